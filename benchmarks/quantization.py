@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Benchmark of the quantized npstore data types: for clustered synthetic embeddings (by default of
+# the 1536 dimensions of OpenAI's ada-002) each storage option is compared with the exact float32
+# search on the size of its files, the bytes scanned (and so best kept in RAM) per query, its query
+# throughput and its recall@k:
+#
+#   python -m benchmarks.quantization --size 100000
+
+# Import necessary modules
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from corpusaige.providers.npstore import META_FILE, NumpyCollection
+
+# data type and rescore setting of each storage option compared
+OPTIONS: List[Tuple[str, int]] = [('float32', 0), ('float16', 0), ('int8', 0), ('int8', 4)]
+
+
+def synthetic_embeddings(size: int, dim: int, clusters: int = 100, seed: int = 0) -> np.ndarray:
+    """Embeddings grouped around topics, like those of the chunks of a corpus"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    embeddings = centers[rng.integers(clusters, size=size)] + rng.normal(scale=0.8, size=(size, dim)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def store_size(path: Path) -> int:
+    """Bytes of the vector files of a store (the chunk texts and metadata are left out)"""
+    return sum(f.stat().st_size for f in path.iterdir() if not f.name.startswith(META_FILE))
+
+
+def run_benchmark(size: int, dim: int, queries: int, k: int, work_dir: Path) -> Dict[str, Dict[str, float]]:
+    embeddings = synthetic_embeddings(size, dim)
+    rng = np.random.default_rng(1)
+    query_vectors = embeddings[rng.integers(size, size=queries)] + rng.normal(scale=0.02, size=(queries, dim)).astype(np.float32)
+    ids = [str(i) for i in range(size)]
+
+    results: Dict[str, Dict[str, float]] = {}
+    exact: List[set] = []
+    for dtype, rescore in OPTIONS:
+        name = dtype + (f"+rescore{rescore}" if rescore else "")
+        collection = NumpyCollection(work_dir / name, dtype=dtype, rescore=rescore)
+        for start in range(0, size, 10000):
+            collection.add(ids[start:start + 10000], embeddings[start:start + 10000])
+        collection.query([query_vectors[0]], k)  # map the files
+        start = time.perf_counter()
+        found = [set(collection.query([query], k)['ids'][0]) for query in query_vectors]
+        seconds = time.perf_counter() - start
+        if not exact:
+            exact = found
+        scanned = collection._matrix.nbytes + (collection._scales.nbytes if collection._scales is not None else 0)
+        results[name] = {'size_mb': store_size(collection.path) / 2 ** 20,
+                         'scanned_mb': scanned / 2 ** 20,
+                         'queries_per_s': queries / seconds,
+                         f'recall_at_{k}': float(np.mean([len(f & e) / k for f, e in zip(found, exact)]))}
+        collection.close()
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.quantization',
+                                     description='Size, speed and recall of the npstore data types')
+    parser.add_argument('--size', type=int, default=100000, help='Number of embeddings (default: 100000)')
+    parser.add_argument('--dim', type=int, default=1536, help='Dimensions of the embeddings (default: 1536)')
+    parser.add_argument('--queries', type=int, default=100, help='Number of queries timed (default: 100)')
+    parser.add_argument('-k', type=int, default=10, help='Results per query (default: 10)')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_benchmark(args.size, args.dim, args.queries, args.k, Path(work_dir))
+    metrics = list(next(iter(results.values())))
+    print(f"{'storage':<18}" + "".join(f"{metric:>16}" for metric in metrics))
+    for name, values in results.items():
+        print(f"{name:<18}" + "".join(f"{values[metric]:>16.3f}" for metric in metrics))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
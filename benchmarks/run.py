@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Benchmark of the overhead of Corpusaige itself: synthetic corpora of the given sizes are built
+# with the fake LLM and embeddings (no network, no API key) and ingestion, search, ls, prompts,
+# state database operations and remove are timed. The results are kept as JSON files and
+# compared with the previous run to spot regressions:
+#
+#   python -m benchmarks.run --sizes 1000 100000 1000000
+
+# Import necessary modules
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.synthetic import create_synthetic_corpus, synthetic_chunks, synthetic_queries
+from corpusaige import providers
+from corpusaige.corpus import StatefullCorpus
+from corpusaige.tracing import percentile
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+DEFAULT_THRESHOLD = 0.3
+
+
+def timed(operation: Callable, *args: Any) -> float:
+    """Duration of the operation in ms"""
+    start = time.perf_counter()
+    operation(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def timings(operation: Callable, args: List[Any]) -> Tuple[float, float]:
+    """p50 and p95 of the durations (in ms) of the operation on each of the arguments"""
+    durations = sorted(timed(operation, arg) for arg in args)
+    return percentile(durations, 50), percentile(durations, 95)
+
+
+def run_benchmark(size: int, work_dir: Path, queries: int = 50, prompts: int = 10,
+                  vector_db: str = 'npstore') -> Dict[str, float]:
+    providers.register_internal_factories()
+    config = create_synthetic_corpus(work_dir / f"corpus-{size}", vector_db)
+    results: Dict[str, float] = {}
+    with StatefullCorpus(config) as corpus:
+        start = time.perf_counter()
+        for batch in synthetic_chunks(size, batch_size=max(1000, size // 20)):
+            corpus.repository._add_chunks(batch)
+        results['ingest_chunks_per_s'] = size / (time.perf_counter() - start)
+
+        results['search_p50_ms'], results['search_p95_ms'] = timings(corpus.store_search, synthetic_queries(queries))
+        results['ls_ms'] = timed(corpus.ls_docs)
+        results['prompt_p50_ms'], results['prompt_p95_ms'] = timings(corpus.send_prompt, synthetic_queries(prompts, seed=2))
+        corpus.state_writer.flush()
+        store = sorted(span.duration * 1000 for span in corpus.tracer.spans if span.name == 'prompt.store')
+        results['state_db_store_p50_ms'] = percentile(store, 50)
+        # the interactions are committed by the background writer
+        write = sorted(span.duration * 1000 for span in corpus.tracer.spans if span.name == 'state.write')
+        results['state_db_write_p50_ms'] = percentile(write, 50)
+        results['state_db_list_ms'] = timed(corpus.list_conversations)
+        results['state_db_search_ms'] = timed(corpus.search_conversations, 'corpus answer')
+        results['remove_ms'] = timed(corpus.remove_docset, 'set-0')
+    return results
+
+
+def is_regression(metric: str, previous: float, current: float, threshold: float) -> bool:
+    # throughputs (per_s) should not go down, durations (ms) should not go up
+    if metric.endswith('_per_s'):
+        return current < previous * (1 - threshold)
+    return current > previous * (1 + threshold)
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD) -> Tuple[List[str], int]:
+    """Lines comparing the metrics of two runs, and the number of regressions (changes worse than threshold)"""
+    lines = [f"{'size':>8} {'metric':<22} {'previous':>10} {'current':>10} {'change':>8}"]
+    regressions = 0
+    for size, metrics in current['sizes'].items():
+        for metric, value in metrics.items():
+            before = previous['sizes'].get(size, {}).get(metric)
+            if before is None:
+                continue
+            change = (value - before) / before if before else 0.0
+            flag = ''
+            if is_regression(metric, before, value, threshold):
+                regressions += 1
+                flag = '  REGRESSION'
+            lines.append(f"{size:>8} {metric:<22} {before:>10.2f} {value:>10.2f} {change:>+8.0%}{flag}")
+    return lines, regressions
+
+
+def latest_results(results_dir: Path) -> Optional[Path]:
+    files = sorted(results_dir.glob('*.json'))
+    return files[-1] if files else None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='Corpusaige performance benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000], help='Numbers of chunks of the corpora (default: 1000)')
+    parser.add_argument('--queries', type=int, default=50, help='Number of searches timed (default: 50)')
+    parser.add_argument('--prompts', type=int, default=10, help='Number of prompts timed (default: 10)')
+    parser.add_argument('--vector-db', default='npstore', help='Vector store of the corpora (default: npstore)')
+    parser.add_argument('--results', type=Path, default=RESULTS_DIR, help='Folder the results are kept in')
+    parser.add_argument('--compare', type=Path, help='Results to compare with (default: the latest in --results)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Relative change counted as a regression (default: {DEFAULT_THRESHOLD})')
+    args = parser.parse_args(argv)
+
+    previous_path = args.compare or latest_results(args.results)
+    current: Dict[str, Any] = {'date': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                               'platform': platform.platform(), 'vector_db': args.vector_db, 'sizes': {}}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in args.sizes:
+            print(f"Benchmarking {size} chunks...", file=sys.stderr)
+            current['sizes'][str(size)] = run_benchmark(size, Path(work_dir), args.queries, args.prompts, args.vector_db)
+
+    args.results.mkdir(parents=True, exist_ok=True)
+    out_path = args.results / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    out_path.write_text(json.dumps(current, indent=2), encoding='utf-8')
+    for size, metrics in current['sizes'].items():
+        for metric, value in metrics.items():
+            print(f"{size:>8} {metric:<22} {value:>10.2f}")
+    print(f"Results written to {out_path}")
+
+    if previous_path is None:
+        return 0
+    lines, regressions = compare(json.loads(previous_path.read_text(encoding='utf-8')), current, args.threshold)
+    print(f"\nCompared with {previous_path}:")
+    print("\n".join(lines))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+import configparser
+import random
+from pathlib import Path
+from typing import Iterator, List
+
+from langchain.schema import Document as Chunk
+
+from corpusaige.config.read import CorpusConfig
+from corpusaige.corpus import create_corpus
+
+# vocabulary of the synthetic texts: common words plus identifiers, so both the lexical and
+# the vector search have something to match
+_WORDS = ("the a of to in is for on with as by at from that this it be are was or an which "
+          "corpus document chunk index vector search query answer model token memory server "
+          "client request batch cache store retrieve embed rank merge pack stream trace "
+          "trait struct enum lifetime borrow ownership module crate function closure iterator").split()
+_IDENTIFIERS = [f"E{code}" for code in range(1000, 1100)] + [f"get_item_{n}" for n in range(100)]
+
+
+def synthetic_text(rng: random.Random, words: int = 150) -> str:
+    text = [rng.choice(_WORDS) for _ in range(words)]
+    for _ in range(2):
+        text[rng.randrange(words)] = rng.choice(_IDENTIFIERS)
+    return " ".join(text).capitalize() + "."
+
+
+def synthetic_queries(count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [rng.choice(_IDENTIFIERS) if n % 4 == 0 else " ".join(rng.choice(_WORDS) for _ in range(6))
+            for n in range(count)]
+
+
+def synthetic_chunks(count: int, doc_sets: int = 10, seed: int = 0, batch_size: int = 1000) -> Iterator[List[Chunk]]:
+    """count deterministic chunks (of about 1000 characters) spread over doc_sets document sets, in batches"""
+    rng = random.Random(seed)
+    for start in range(0, count, batch_size):
+        yield [Chunk(page_content=synthetic_text(rng),
+                     metadata={'doc-set': f"set-{n % doc_sets}", 'source': f"doc-{n // 10}.txt", 'path': f"doc-{n // 10}.txt"})
+               for n in range(start, min(start + batch_size, count))]
+
+
+def create_synthetic_corpus(path: Path, vector_db: str = 'npstore', llm_latency: float = 0.0,
+                            embedding_latency: float = 0.0) -> CorpusConfig:
+    """Create an (empty) corpus using the fake LLM and embeddings (no network needed)"""
+    path.mkdir(parents=True, exist_ok=True)
+    config_p = configparser.ConfigParser()
+    config_p['main'] = {'name': f"Benchmark {path.name}", 'llm': 'fake', 'vector-db': vector_db}
+    config_p['fake'] = {'latency': str(llm_latency), 'embedding-latency': str(embedding_latency)}
+    config_p[vector_db] = {'path': './db'}
+    return create_corpus(path, config_p)
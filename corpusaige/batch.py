@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, TextIO
+
+from corpusaige.exceptions import InvalidParameters
+
+
+class BatchItem:
+    def __init__(self, id: str, prompt: str):
+        self.id = id
+        self.prompt = prompt
+
+    def __repr__(self):
+        return f"<BatchItem(id={self.id!r})>"
+
+
+def read_batch(path: Path | str) -> List[BatchItem]:
+    """Read the prompts of a batch from a JSONL file. Each line holds either a JSON string (the prompt)
+    or an object with a "prompt" (or "question") and an optional "id" (default: the line number)."""
+    items = []
+    ids = set()
+    with open(path, encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise InvalidParameters(f"Invalid JSON on line {line_num} of {path}: {e}")
+            if isinstance(entry, str):
+                entry = {'prompt': entry}
+            prompt = entry.get('prompt', entry.get('question')) if isinstance(entry, dict) else None
+            if not isinstance(prompt, str) or not prompt.strip():
+                raise InvalidParameters(f"No prompt on line {line_num} of {path}")
+            id = str(entry.get('id', line_num))
+            if id in ids:
+                raise InvalidParameters(f"Duplicate id {id} on line {line_num} of {path}")
+            ids.add(id)
+            items.append(BatchItem(id, prompt))
+    return items
+
+
+def completed_ids(path: Path | str) -> Set[str]:
+    """Ids of the prompts answered in an (earlier) output file; failed prompts are not included"""
+    done = set()
+    if not Path(path).exists():
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # a line cut short by an interrupted run
+                continue
+            if isinstance(result, dict) and 'answer' in result:
+                done.add(str(result['id']))
+    return done
+
+
+async def run_batch(corpus: Any, items: List[BatchItem], out: TextIO, concurrency: int = 4,
+                    progress: Optional[TextIO] = None) -> Dict[str, int]:
+    """Send the prompts concurrently (at most concurrency at a time) to the corpus. Every prompt is
+    isolated from the conversation and from the other prompts. The results are written to out as
+    JSON lines in the order they finish: {"id", "prompt", "answer"} or {"id", "prompt", "error"}.
+    Returns the number of answered and failed prompts."""
+    if concurrency < 1:
+        raise InvalidParameters("Concurrency must be at least 1")
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {'answered': 0, 'failed': 0}
+
+    async def run(item: BatchItem):
+        async with semaphore:
+            result: Dict[str, Any] = {'id': item.id, 'prompt': item.prompt}
+            try:
+                result['answer'] = await corpus.asend_prompt(item.prompt, isolated=True, store=False)
+                counts['answered'] += 1
+            except Exception as e:
+                result['error'] = str(e)
+                counts['failed'] += 1
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            out.flush()
+            if progress is not None:
+                done = counts['answered'] + counts['failed']
+                status = 'failed' if 'error' in result else 'ok'
+                print(f"[{done}/{len(items)}] {item.id}: {status}", file=progress, flush=True)
+
+    await asyncio.gather(*(run(item) for item in items))
+    return counts
+
+
+def batch_prompt(corpus: Any, batch_path: Path | str, out_path: Optional[Path | str] = None,
+                 concurrency: int = 4, resume: bool = False) -> Dict[str, int]:
+    """Run the prompts of a JSONL file against the corpus, writing the results to out_path (default:
+    stdout). With resume, the prompts already answered in out_path are skipped and new results are
+    appended to it."""
+    items = read_batch(batch_path)
+    if resume:
+        if out_path is None:
+            raise InvalidParameters("--resume needs an output file (--out)")
+        done = completed_ids(out_path)
+        items = [item for item in items if item.id not in done]
+
+    if out_path is None:
+        return asyncio.run(run_batch(corpus, items, sys.stdout, concurrency, progress=sys.stderr))
+    with open(out_path, 'a' if resume else 'w', encoding='utf-8') as out:
+        return asyncio.run(run_batch(corpus, items, out, concurrency, progress=sys.stderr))
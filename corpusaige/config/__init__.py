@@ -14,3 +14,10 @@ CORPUS_SCRIPTS = 'scripts'
 ANNOTATION_DOCSET_NAME = 'Corpusaige annotations'
 CORPUS_PLUGINS = 'plugins'
 CORPUSAIGE_HOME_DIR = '.corpusaige'
+CORPUS_LEXICAL_INDEX = 'lexical-index.bm25'
+CORPUS_SHARDS = 'corpus-shards.json'
+RETRIEVAL_SECTION = 'retrieval'
+MEMORY_SECTION = 'memory'
+TRACING_SECTION = 'tracing'
+SHARDING_SECTION = 'sharding'
+CORPUS_SERVER = 'corpus-server.json'
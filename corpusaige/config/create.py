@@ -52,7 +52,7 @@ def prompt_user_for_init() -> configparser.ConfigParser:
     ai_provider = radiolist_dialog_with_params("Select LLM Provider", "Select LLM Provider", [
                                                ("openai", "openai"), ("unspecified", "unspecified")])
     vector_db = radiolist_dialog_with_params("Select Vector DB", "Select Vector DB", [
-                                             ("chroma", "chroma"), ("unspecified", "unspecified")])
+                                             ("chroma", "chroma"), ("npstore", "npstore (built-in)"), ("unspecified", "unspecified")])
 
     config['main'] = {'name': name, 'llm': ai_provider,
                       'vector-db': vector_db} #, 'data-sections': ''}
@@ -81,5 +81,20 @@ def prompt_user_for_init() -> configparser.ConfigParser:
 
         config['chroma'] = {'type': type_, 'path': path}
 
+    # npstore (built-in NumPy vector store) section
+    if vector_db.lower() == 'npstore':
+        path = prompt("Enter path: ", default='./npdb')
+        dtype = radiolist_dialog_with_params("Select npstore data type", "Select data type of the stored embeddings", [
+                                             ("float32", "float32"), ("float16", "float16 (half the size)"),
+                                             ("int8", "int8 (a quarter of the size)")])
+        index = radiolist_dialog_with_params("Select npstore index", "Select index type", [
+                                             ("flat", "flat (exact search)"), ("ivf", "ivf (large corpora)")])
+
+        config['npstore'] = {'path': path, 'dtype': dtype, 'index': index}
+        if dtype != 'float32':
+            rescore = radiolist_dialog_with_params("Select npstore rescoring", "Rescore results with full precision embeddings?", [
+                                                   ("0", "no (smallest store)"), ("4", "yes (exact ranking, full precision copy on disk)")])
+            config['npstore']['rescore'] = rescore
+
     return config
     
@@ -14,8 +14,8 @@ from typing import Dict, TypeAlias
 
 from corpusaige.config import CORPUS_INI
 
-from ..exceptions import InvalidConfigSection
-from . import CORPUS_PLUGINS, CORPUSAIGE_HOME_DIR
+from ..exceptions import InvalidConfigEntry, InvalidConfigSection
+from . import CORPUS_PLUGINS, CORPUSAIGE_HOME_DIR, MEMORY_SECTION, RETRIEVAL_SECTION, SHARDING_SECTION
 
 ConfigEntries : TypeAlias = Dict[str,str]
 class CorpusConfig:
@@ -34,6 +34,8 @@ class CorpusConfig:
             self.name = self.main["name"]
             self.llm = self.main["llm"]
             self.vector_db = self.main["vector-db"]
+            # provider of the embeddings (default: the provider of the llm)
+            self.embeddings = self.main.get("embeddings", self.llm)
             # sections = self.main["data-sections"]
             # if not sections:
             #     self.data_sections = []
@@ -50,8 +52,27 @@ class CorpusConfig:
     def get_llm_config(self) -> ConfigEntries:
         return dict(self.llm_config.items())
         
+    def get_embeddings_config(self) -> ConfigEntries:
+        """Entries of the section of the embeddings provider (none needed for e.g. local embeddings)"""
+        return self.get_optional_section_config(self.embeddings)
+
     def get_vector_db_config(self) -> ConfigEntries:
         return dict(self.vector_db_config.items())
+
+    def get_retrieval_config(self) -> ConfigEntries:
+        return self.get_optional_section_config(RETRIEVAL_SECTION)
+
+    def get_memory_config(self) -> ConfigEntries:
+        return self.get_optional_section_config(MEMORY_SECTION)
+
+    def get_sharding_config(self) -> ConfigEntries:
+        return self.get_optional_section_config(SHARDING_SECTION)
+
+    def get_optional_section_config(self, section: str) -> ConfigEntries:
+        """Entries of a section which may be omitted from corpus.ini (all its entries having defaults)"""
+        if self.config.has_section(section):
+            return dict(self.config[section].items())
+        return {}
         
     # def get_data_section_config(self, section: str) -> ConfigEntries:
     #     entries = self.data_section_configs.get(section)
@@ -87,6 +108,34 @@ class CorpusConfig:
     #         configs[key] = dict(value.items())
     #     return configs
 
+def get_bool_entry(entries: ConfigEntries, key: str, default: bool) -> bool:
+    value = entries.get(key)
+    if value is None or value.strip() == "":
+        return default
+    if value.strip().lower() in ('1', 'yes', 'true', 'on'):
+        return True
+    if value.strip().lower() in ('0', 'no', 'false', 'off'):
+        return False
+    raise InvalidConfigEntry(f"Invalid boolean value for {key}: {value}")
+
+def get_int_entry(entries: ConfigEntries, key: str, default: int) -> int:
+    value = entries.get(key)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidConfigEntry(f"Invalid integer value for {key}: {value}")
+
+def get_float_entry(entries: ConfigEntries, key: str, default: float) -> float:
+    value = entries.get(key)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise InvalidConfigEntry(f"Invalid numeric value for {key}: {value}")
+
 def get_config(config_path: str | Path) -> CorpusConfig:
    
     #if isinstance(config_path, str):
@@ -8,22 +8,29 @@ through deep exploration and understanding of comprehensive document sets and so
 """
 
 # Import necessary modules
+import asyncio
+from concurrent.futures import Future
 from configparser import ConfigParser
 from pathlib import Path
+import queue
 import sys
-from typing import Any, List, Protocol
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Protocol
 
 from sqlalchemy import Engine
 from sqlalchemy.orm.session import Session
 from corpusaige import providers
 from corpusaige.data import annotations, conversations
 from corpusaige.data.db import create_db, init_db
+from corpusaige.data.writer import StateWriter
 from corpusaige.documentset import Document, DocumentSet
 from corpusaige.exceptions import InvalidParameters
 from corpusaige.interactions import StatefullInteraction
 from corpusaige.protocols import Output
 from corpusaige.registry import ServiceRegistry
 from corpusaige.storage import VectorRepository
+from corpusaige.tracing import Tracer
 from .config.read import CorpusConfig, get_config
 from corpusaige.config import CORPUS_INI, CORPUS_PLUGINS, CORPUS_STATE_DB, CORPUS_ANNOTATIONS, CORPUS_SCRIPTS
 from importlib import import_module, reload
@@ -35,8 +42,19 @@ class Corpus(Protocol):
     path: Path
     show_sources: bool = False
     context_size: int = 15
+    context_budget: int = 0
+    last_context_tokens: int = 0
+    scope: List[str]
+    tracer: Tracer
 
-    def send_prompt(self, prompt: str) -> str:
+    def send_prompt(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        ...
+
+    def stream_prompt(self, prompt: str) -> Iterator[str]:
+        ...
+
+    async def asend_prompt(self, prompt: str, on_token: Optional[Callable[[str], None]] = None, 
+                           isolated: bool = False, store: bool = True) -> str:
         ...
 
     def add_docset(self, docset: DocumentSet) -> None:
@@ -52,13 +70,19 @@ class Corpus(Protocol):
     def add_annotation(self, annotation_docset_name: str, title: str, cmdtext: str)-> None:
         ...
     
-    def store_search(self, search_str: str) -> List[str]:
+    def store_search(self, search_str: str, doc_sets: Optional[List[str]] = None) -> List[str]:
+        ...
+
+    async def astore_search(self, search_str: str, doc_sets: Optional[List[str]] = None) -> List[str]:
         ...
 
     #def store_ls(self, set_name: str) -> List[str]:
     def ls_docs(self, all_docs: bool = False, doc_set:str = '') -> List[str]:
         ...
 
+    def doc_set_names(self) -> List[str]:
+        ...
+
     def get_conversations(self) -> List[Conversation]:
         ...
     
@@ -67,10 +91,28 @@ class Corpus(Protocol):
 
     def get_interaction(self, interaction_id: int) -> Interaction:
         ...
+
+    def search_conversations(self, terms: str, limit: int = 20) -> List[conversations.InteractionMatch]:
+        ...
+
+    def list_conversations(self, limit: int = conversations.DEFAULT_PAGE_SIZE, 
+                           before: Optional[int] = None) -> List[conversations.ConversationSummary]:
+        ...
+
+    def list_interactions(self, conversation_id: int, limit: int = conversations.DEFAULT_PAGE_SIZE, 
+                          after: Optional[int] = None) -> List[conversations.InteractionSummary]:
+        ...
          
     def toggle_sources(self):
         ...
 
+    def set_memory(self, strategy: str, size: Optional[int] = None) -> None:
+        ...
+
+    @property
+    def memory_description(self) -> str:
+        ...
+
     @property
     def state_db_path(self) -> Path:
         ...
@@ -89,6 +131,9 @@ class Corpus(Protocol):
     def run_script(self, script_name: str, *args) -> Any:
         ...
 
+    def close(self) -> None:
+        ...
+
 
 class BasicConsoleOutput(Output):
     @property
@@ -102,17 +147,16 @@ class BasicConsoleOutput(Output):
     def print(self, text:str):
         print(text)
     
+    def print_token(self, text:str):
+        print(text, end='', flush=True)
+    
     def clear(self):
        pass
 class StatefullCorpus(Corpus):
 
     name : str
     path : Path
-    repository: VectorRepository
     out: Output
-    last_conversation_id: int | None
-    last_interaction_id: int | None
-    plugin_registry: ServiceRegistry
 
     def __init__(self, config: str | CorpusConfig,show_sources: bool = False, 
                                             context_size: int = 15):
@@ -125,26 +169,119 @@ class StatefullCorpus(Corpus):
         self.path = config.config_path
         self.show_sources = show_sources
         self.context_size = context_size
+        # token budget of the retrieved context (0: use context_size chunks)
+        self.context_budget = 0
+        self.last_context_tokens = 0
+        # document sets to which prompts and searches are restricted (empty: the whole corpus)
+        self.scope = []
+        
+        # durations of the stages of prompts and searches (see /stats)
+        self.tracer = Tracer.from_config(config)
         
         providers.register_internal_factories()
-        self.repository = VectorRepository(config)
-        self.interaction = StatefullInteraction(
-            config, retriever=self.repository.as_retriever())
+        # the vector store, the LLM (chain), the state database and the plugins are created on 
+        # first use (or by warmup), so operations not needing the LLM do not pay for it
+        self.config = config
+        self._components: Dict[str, Any] = {}
+        self._init_lock = threading.RLock()
         
         self.out = BasicConsoleOutput()
         
-        self.last_conversation_id = None
-        self.last_interaction_id = None
+        # interactions are stored by the state writer: the conversation id is only used (and set)
+        # by its thread, the ids of the last interaction stored are the result of its last write
+        self._conversation_id: int | None = None
+        self._last_write: Future | None = None
         
         self.scripts = self._get_scripts()
         self._cached_script_mods = {}
-        self._db_state_engine = init_db(self.state_db_path)
         #set import path to corpus scripts folder
         sys.path.append(str(self.corpus_folder_path / CORPUS_SCRIPTS))
-        
-        for plugin_path in config.get_plugin_folders():
+
+    def _component(self, name: str, create: Callable[[], Any]) -> Any:
+        """The component with the given name, created on first use; its creation time is traced as 
+        'init.<name>'"""
+        component = self._components.get(name)
+        if component is None:
+            with self._init_lock:
+                component = self._components.get(name)
+                if component is None:
+                    with self.tracer.span(f'init.{name}'):
+                        component = create()
+                    self._components[name] = component
+        return component
+
+    @property
+    def repository(self) -> VectorRepository:
+        return self._component('repository', self._create_repository)
+
+    @repository.setter
+    def repository(self, repository: VectorRepository):
+        self._components['repository'] = repository
+
+    def _create_repository(self) -> VectorRepository:
+        self._ensure_provider(self.config.vector_db)
+        self._ensure_provider(self.config.embeddings)
+        return VectorRepository(self.config, self.tracer)
+
+    @property
+    def interaction(self) -> StatefullInteraction:
+        return self._component('interaction', self._create_interaction)
+
+    @interaction.setter
+    def interaction(self, interaction: StatefullInteraction):
+        self._components['interaction'] = interaction
+
+    def _create_interaction(self) -> StatefullInteraction:
+        self._ensure_provider(self.config.llm)
+        return StatefullInteraction(self.config, retriever=self.repository.as_retriever(), tracer=self.tracer)
+
+    @property
+    def plugin_registry(self) -> ServiceRegistry:
+        return self._component('plugins', self._load_plugins)
+
+    def _load_plugins(self) -> ServiceRegistry:
+        for plugin_path in self.config.get_plugin_folders():
             ServiceRegistry.register_plugins_from_dir(plugin_path)
-        self.plugin_registry = ServiceRegistry
+        return ServiceRegistry
+
+    def _ensure_provider(self, provider_name: str):
+        # the provider may be a plugin: only then the plugins have to be loaded first
+        if ServiceRegistry.get_service_info(provider_name) is None:
+            self.plugin_registry
+
+    def warmup(self) -> Dict[str, float]:
+        """Create all components now (e.g. before serving requests) instead of on first use. 
+        Returns the creation time (in seconds) of each component created."""
+        components = {'plugins': lambda: self.plugin_registry, 'state-db': lambda: self.state_db_engine,
+                      'state-writer': lambda: self.state_writer, 'repository': lambda: self.repository, 'interaction': lambda: self.interaction}
+        timings = {}
+        for name, create in components.items():
+            if name not in self._components:
+                start = time.perf_counter()
+                create()
+                timings[name] = time.perf_counter() - start
+        return timings
+
+    def close(self):
+        """Release the components created (the vector store is shared with the other users of the
+        corpus in this process and only closed by the last one)"""
+        with self._init_lock:
+            components, self._components = self._components, {}
+        if 'interaction' in components:
+            components['interaction'].close()
+        if 'repository' in components:
+            components['repository'].close()
+        if 'state-writer' in components:
+            components['state-writer'].close()
+        if 'state-db' in components:
+            components['state-db'].dispose()
+        self.tracer.flush()
+
+    def __enter__(self) -> 'StatefullCorpus':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     @property
     def state_db_path(self) -> Path:
@@ -152,7 +289,25 @@ class StatefullCorpus(Corpus):
     
     @property
     def state_db_engine(self) -> Engine:
-        return self._db_state_engine
+        return self._component('state-db', lambda: init_db(self.state_db_path))
+
+    @property
+    def state_writer(self) -> StateWriter:
+        return self._component('state-writer', lambda: StateWriter(self.state_db_engine, tracer=self.tracer))
+
+    def _flush_state(self):
+        """Wait for the pending writes of the state writer (if any), so they can be read"""
+        if 'state-writer' in self._components:
+            self.state_writer.flush()
+
+    @property
+    def last_conversation_id(self) -> int | None:
+        """Id of the conversation of the last interaction (waits until the interaction is stored)"""
+        return self._last_write.result()[0] if self._last_write is not None else None
+
+    @property
+    def last_interaction_id(self) -> int | None:
+        return self._last_write.result()[1] if self._last_write is not None else None
     
     @property
     def annotations_path(self) -> Path:
@@ -162,17 +317,99 @@ class StatefullCorpus(Corpus):
     def corpus_folder_path(self) -> Path:
         return self.path.parent
     
-    def send_prompt(self, prompt: str) -> str :
+    def send_prompt(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> str :
+        """Send the prompt to the LLM. The answer is passed to on_token (if given) while it is 
+        generated; the interaction is stored (in the background) once the answer is complete."""
         
-        with Session(self.state_db_engine) as session:
-            answer = self.interaction.send_prompt(prompt, self.show_sources, self.context_size)
-            self.last_conversation_id, self.last_interaction_id = conversations.add_interaction(session, self.last_conversation_id, prompt, answer)
-    
+        with self.tracer.span('prompt'):
+            answer, self.last_context_tokens = self.interaction.prompt(prompt, self.show_sources, self.context_size,
+                                                                       self.scope, self.context_budget, on_token)
+            self._store_interaction(prompt, answer)
         return answer
 
+    def _store_interaction(self, prompt: str, answer: str, isolated: bool = False):
+        if isolated:
+            # in a conversation of its own, which the conversation of the corpus does not continue
+            with self.tracer.span('prompt.store'):
+                self.state_writer.submit(lambda session: conversations.add_interaction(session, None, prompt, answer))
+            return
+
+        previous: List[int | None] = []
+
+        def write(session: Session):
+            previous.append(self._conversation_id)
+            self._conversation_id, interaction_id = conversations.add_interaction(session, self._conversation_id, prompt, answer)
+            return self._conversation_id, interaction_id
+
+        def undo():
+            self._conversation_id = previous.pop()
+
+        with self.tracer.span('prompt.store'):
+            self._last_write = self.state_writer.submit(write, undo)
+
+    def stream_prompt(self, prompt: str) -> Iterator[str]:
+        """Send the prompt to the LLM, yielding the parts of the answer as they are generated"""
+        tokens: queue.Queue = queue.Queue()
+        done = object()
+        errors = []
+
+        def run():
+            try:
+                self.send_prompt(prompt, on_token=tokens.put)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                tokens.put(done)
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        while (token := tokens.get()) is not done:
+            yield token
+        worker.join()
+        if errors:
+            raise errors[0]
+
+    # Asynchronous API: LLM and embedding calls use the asynchronous provider APIs, blocking 
+    # work (index searches, database writes, loading documents) runs in worker threads
+
+    async def asend_prompt(self, prompt: str, on_token: Optional[Callable[[str], None]] = None, 
+                           isolated: bool = False, store: bool = True) -> str:
+        """Asynchronous send_prompt; prompts sent concurrently each see the conversation as it was 
+        when they were sent. An isolated prompt does not use nor extend the conversation history
+        (it is saved in a conversation of its own). With store False the interaction is not saved
+        in the state database."""
+        with self.tracer.span('prompt'):
+            answer, self.last_context_tokens = await self.interaction.aprompt(prompt, self.show_sources, self.context_size,
+                                                                              self.scope, self.context_budget, on_token,
+                                                                              isolated)
+            if store:
+                self._store_interaction(prompt, answer, isolated)
+        return answer
+
+    async def astore_search(self, search_str: str, doc_sets: Optional[List[str]] = None) -> List[str]:
+        with self.tracer.span('search'):
+            return await self.repository.asearch(search_str, self.context_size, doc_sets or self.scope)
+
+    async def aadd_docset(self, docset: DocumentSet) -> None:
+        await asyncio.to_thread(self.add_docset, docset)
+
+    async def aremove_docset(self, docset_name: str) -> None:
+        await asyncio.to_thread(self.remove_docset, docset_name)
+
+    async def als_docs(self, all_docs: bool = False, doc_set:str = '') -> List[str]:
+        return await asyncio.to_thread(self.ls_docs, all_docs, doc_set)
+
     def toggle_sources(self):
         self.show_sources = not self.show_sources
 
+    def set_memory(self, strategy: str, size: Optional[int] = None) -> None:
+        """Switch the conversation memory strategy (buffer, window, tokens or summary)"""
+        self.interaction.set_memory(strategy, size)
+
+    @property
+    def memory_description(self) -> str:
+        return self.interaction.memory_description
+
     def add_docset(self, docset: DocumentSet) -> None:
         self.repository.add_docset(docset)
 
@@ -182,22 +419,52 @@ class StatefullCorpus(Corpus):
     def add_doc(self, doc: Document, docset_name: str) -> None:
         self.repository.add_doc(doc, docset_name)
         
-    def store_search(self, search_str: str) -> List[str]:
-        return self.repository.search(search_str, self.context_size)
+    def store_search(self, search_str: str, doc_sets: Optional[List[str]] = None) -> List[str]:
+        with self.tracer.span('search'):
+            return self.repository.search(search_str, self.context_size, doc_sets or self.scope)
 
     def ls_docs(self, all_docs: bool = False, doc_set:str = '') -> List[str]:
         
         return self.repository.ls(all_docs, doc_set)
 
+    def doc_set_names(self) -> List[str]:
+        """Names of the document sets (as used by scope), where ls_docs lists them for display"""
+        return self.repository.ls()
+
     def get_conversations(self) -> List[Conversation]:
+        self._flush_state()
         with Session(self.state_db_engine) as session:
             return conversations.get_conversations(session)
     
     def get_conversation(self, conversation_id: int) -> Conversation:
+        self._flush_state()
         with Session(self.state_db_engine) as session:
             return conversations.get_conversation_by_id(session, conversation_id)
 
+    def list_conversations(self, limit: int = conversations.DEFAULT_PAGE_SIZE, 
+                           before: Optional[int] = None) -> List[conversations.ConversationSummary]:
+        """A page of (the id, title and date of) the conversations, most recent first; the next page 
+        is the one before the id of the last conversation of this one"""
+        self._flush_state()
+        with Session(self.state_db_engine) as session:
+            return conversations.list_conversations(session, limit, before)
+
+    def list_interactions(self, conversation_id: int, limit: int = conversations.DEFAULT_PAGE_SIZE, 
+                          after: Optional[int] = None) -> List[conversations.InteractionSummary]:
+        """A page of (the id, date and start of the question of) the interactions of a conversation; 
+        the next page is the one after the id of the last interaction of this one"""
+        self._flush_state()
+        with Session(self.state_db_engine) as session:
+            return conversations.list_interactions(session, conversation_id, limit, after)
+
+    def search_conversations(self, terms: str, limit: int = 20) -> List[conversations.InteractionMatch]:
+        """The interactions (of all conversations) best matching the search terms"""
+        self._flush_state()
+        with Session(self.state_db_engine) as session:
+            return conversations.search_interactions(session, terms, limit)
+
     def get_interaction(self, interaction_id: int) -> Interaction:
+        self._flush_state()
         with Session(self.state_db_engine) as session:
             return conversations.get_interaction_by_id(session, interaction_id)
        
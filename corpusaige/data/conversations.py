@@ -8,18 +8,20 @@ through deep exploration and understanding of comprehensive document sets and so
 """
 
 # Import necessary modules
+import re
 from datetime import datetime
-from typing import Optional, Tuple
-from sqlalchemy import  func, ForeignKey, select
+from typing import NamedTuple, Optional, Tuple
+from sqlalchemy import  Connection, func, ForeignKey, select, text
 from sqlalchemy.orm import mapped_column, Mapped, relationship, joinedload
 from typing import List
 from sqlalchemy.orm import Session
 from corpusaige.data import Base
+from corpusaige.exceptions import InvalidParameters
 
 class Interaction(Base):
     __tablename__ = "interaction"
     id : Mapped[int] = mapped_column(primary_key=True)   #,increment=True)
-    conversation_id = mapped_column(ForeignKey("conversation.id"))
+    conversation_id = mapped_column(ForeignKey("conversation.id"), index=True)
     human_question: Mapped[str] 
     date_question : Mapped[datetime]= mapped_column(insert_default=func.now()) #type: ignore
     ai_answer : Mapped[Optional[str]] 
@@ -48,27 +50,119 @@ def remove_whitespace(s):
     return s.translate(str.maketrans('', '', '\n\t\r\v\f'))
 
 def add_interaction(session: Session, conversation_id: int | None, question: str, answer: str) -> Tuple[int, int]:
-    
+    """Add an interaction to the conversation (a new one if conversation_id is None); the caller commits"""
     question_stripped = remove_whitespace(question[:50]).strip()
     if conversation_id is None:
         conversation = Conversation(title=f"{datetime.now().strftime('%Y-%m-%d %H:%M')}: {question_stripped}")
         session.add(conversation)
-    else:
-        conversation = session.execute(select(Conversation).where(Conversation.id == conversation_id)).scalar_one()
+        session.flush()
+        conversation_id = conversation.id
     
-    interaction = Interaction(human_question=question, ai_answer=answer)
-    conversation.interactions.append(interaction)
-    session.commit()
-    return conversation.id, interaction.id
+    # the interaction refers to the conversation by id: the conversation is not loaded
+    interaction = Interaction(conversation_id=conversation_id, human_question=question, ai_answer=answer)
+    session.add(interaction)
+    session.flush()
+    return conversation_id, interaction.id
 
 def get_conversations(session) -> List[Conversation]:
     """Get all conversations from the database"""
     return session.execute(select(Conversation).order_by(Conversation.date_created)).scalars().all()
 
+# Listings page through the conversations and interactions with keyset cursors (the id of the last
+# row of the previous page), selecting only the columns shown, so they take the same time however
+# long the history is.
+DEFAULT_PAGE_SIZE = 20
+QUESTION_WIDTH = 120
+
+class ConversationSummary(NamedTuple):
+    id: int
+    title: str
+    date_created: datetime
+
+class InteractionSummary(NamedTuple):
+    id: int
+    date_question: datetime
+    question: str
+
+def list_conversations(session: Session, limit: int = DEFAULT_PAGE_SIZE, before: Optional[int] = None) -> List[ConversationSummary]:
+    """A page of conversations, most recent first: those with an id below before (if given)"""
+    query = select(Conversation.id, Conversation.title, Conversation.date_created)
+    if before is not None:
+        query = query.where(Conversation.id < before)
+    rows = session.execute(query.order_by(Conversation.id.desc()).limit(limit))
+    return [ConversationSummary(*row) for row in rows]
+
+def list_interactions(session: Session, conversation_id: int, limit: int = DEFAULT_PAGE_SIZE, after: Optional[int] = None,
+                      width: int = QUESTION_WIDTH) -> List[InteractionSummary]:
+    """A page of the interactions of a conversation, in order: those with an id above after (if given), 
+    with the first width characters of their question"""
+    query = select(Interaction.id, Interaction.date_question, func.substr(Interaction.human_question, 1, width)).where(
+        Interaction.conversation_id == conversation_id)
+    if after is not None:
+        query = query.where(Interaction.id > after)
+    rows = session.execute(query.order_by(Interaction.id).limit(limit))
+    return [InteractionSummary(*row) for row in rows]
+
 def get_conversation_by_id(session, id: int) -> Conversation:
     """Get a conversation by its id"""
     return session.execute(select(Conversation).options(joinedload(Conversation.interactions)).where(Conversation.id == id)).unique().scalar_one()
 
+# Full-text index (SQLite FTS5) of the questions and answers of the interactions. It only holds
+# the index, the texts are read from the interaction table; triggers keep it in sync.
+_SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS interaction_fts USING fts5(human_question, ai_answer, 
+       content='interaction', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS interaction_fts_insert AFTER INSERT ON interaction BEGIN
+         INSERT INTO interaction_fts(rowid, human_question, ai_answer) VALUES (new.id, new.human_question, new.ai_answer);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS interaction_fts_delete AFTER DELETE ON interaction BEGIN
+         INSERT INTO interaction_fts(interaction_fts, rowid, human_question, ai_answer) 
+         VALUES ('delete', old.id, old.human_question, old.ai_answer);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS interaction_fts_update AFTER UPDATE OF human_question, ai_answer ON interaction BEGIN
+         INSERT INTO interaction_fts(interaction_fts, rowid, human_question, ai_answer) 
+         VALUES ('delete', old.id, old.human_question, old.ai_answer);
+         INSERT INTO interaction_fts(rowid, human_question, ai_answer) VALUES (new.id, new.human_question, new.ai_answer);
+       END""",
+    # matches in the question weigh twice as much as matches in the answer
+    """INSERT INTO interaction_fts(interaction_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0)')""",
+]
+
+class InteractionMatch(NamedTuple):
+    interaction_id: int
+    conversation_id: int
+    date_question: datetime
+    snippet: str
+
+def create_search_index(connection: Connection) -> None:
+    """Create the full-text index of the interactions if the database has none yet, indexing the 
+    interactions already stored"""
+    exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'interaction_fts'")).first()
+    if exists:
+        return
+    for statement in _SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+    connection.execute(text("INSERT INTO interaction_fts(interaction_fts) VALUES ('rebuild')"))
+
+def search_query(terms: str) -> str:
+    """FTS5 query matching interactions with all the words of terms (a word ending in * matches 
+    as prefix); other characters are ignored, so user input cannot break the query syntax"""
+    words = re.findall(r'\w+\*?', terms)
+    if not words:
+        raise InvalidParameters("No words to search for")
+    return " ".join(f'"{word.rstrip("*")}"' + ('*' if word.endswith('*') else '') for word in words)
+
+def search_interactions(session: Session, terms: str, limit: int = 20) -> List[InteractionMatch]:
+    """The interactions best matching the terms (BM25 ranking), with a snippet of the matching text"""
+    rows = session.execute(text("""
+        SELECT i.id, i.conversation_id, i.date_question, m.snippet
+        FROM (SELECT rowid, rank, snippet(interaction_fts, -1, '[', ']', '...', 12) AS snippet 
+              FROM interaction_fts WHERE interaction_fts MATCH :query ORDER BY rank LIMIT :limit) AS m 
+        JOIN interaction AS i ON i.id = m.rowid
+        ORDER BY m.rank"""), {'query': search_query(terms), 'limit': limit})
+    return [InteractionMatch(id, conversation_id, date if isinstance(date, datetime) else datetime.fromisoformat(date), snippet)
+            for id, conversation_id, date, snippet in rows]
+
 def get_interaction_by_id(session, id: int) -> Interaction:
     """Get an interaction by its id"""
     return session.execute(select(Interaction).where(Interaction.id == id)).scalar_one()    
\ No newline at end of file
@@ -8,24 +8,54 @@ through deep exploration and understanding of comprehensive document sets and so
 """
 
 from pathlib import Path
-from sqlalchemy import Engine, create_engine
+from sqlalchemy import Connection, Engine, create_engine, event, text
 from corpusaige.data import Base
-from corpusaige.data.conversations import Interaction, Conversation # noqa: F401 - ignore Not used
+from corpusaige.data.conversations import Interaction, Conversation, create_search_index # noqa: F401 - ignore Not used
 from corpusaige.data.annotations import Annotation # noqa: F401 - ignore Not Used 
 
 
+# seconds a connection waits for a lock held by another connection (process) before failing
+BUSY_TIMEOUT = 30.0
+
+
+def _create_engine(path: Path) -> Engine:
+    # the engine keeps a pool of connections, which may be used by any thread
+    engine = create_engine(f'sqlite:///{path}', connect_args={'timeout': BUSY_TIMEOUT, 'check_same_thread': False})
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, _):
+        # write-ahead logging: readers (e.g. other shells and servers) do not block the writer and vice versa
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+    return engine
+
+
+def _upgrade(connection: Connection) -> None:
+    """Add the indexes introduced after the database was created"""
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_interaction_conversation_id ON interaction (conversation_id)"))
+    create_search_index(connection)
+
+
 def create_db(path: Path)-> Engine:
     # Connect to the database. If it doesn't exist, it will be created.
-    engine = create_engine(f'sqlite:///{path}')
+    engine = _create_engine(path)
 
     # Create tables in the database
     Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        _upgrade(connection)
     
     return engine
 
 def init_db(path: Path)-> Engine:
     # Connect to the database
-    engine = create_engine(f'sqlite:///{path}')
+    engine = _create_engine(path)
+    # databases created before the (full-text) indexes get them (once) here
+    with engine.begin() as connection:
+        _upgrade(connection)
     
     return engine
 
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Background writer of the state database: writes (e.g. of interactions) are queued and carried
+# out by a thread of their own, so they never add to the latency of a prompt. The writes queued
+# while a transaction is being committed are committed together in the next one. The writers still
+# open when the process exits commit their pending writes first.
+
+# Import necessary modules
+import atexit
+import queue
+import sys
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+
+from corpusaige.tracing import NO_TRACER, Tracer
+
+DEFAULT_BATCH_SIZE = 100
+
+Write = Callable[[Session], Any]
+Undo = Optional[Callable[[], None]]
+
+_open_writers: 'weakref.WeakSet[StateWriter]' = weakref.WeakSet()
+
+
+@atexit.register
+def _close_open_writers() -> None:
+    # the writer threads are daemons (they do not keep the process alive), so their pending writes
+    # are committed here rather than lost when the owner of a writer did not close it
+    for writer in list(_open_writers):
+        writer.close()
+
+
+class StateWriter:
+    """Carries out writes to the state database in a background thread, in batches of at most
+    batch_size writes per transaction. A write is a function of a session returning a result
+    (available through the Future returned by submit); it should not commit. If the transaction
+    of a batch fails, the (optional) undo functions of the writes already carried out are called,
+    most recent first, and each write is retried in a transaction of its own; the writes failing
+    on their own are reported on stderr (and through their Future)."""
+
+    def __init__(self, engine: Engine, batch_size: int = DEFAULT_BATCH_SIZE, tracer: Tracer = NO_TRACER):
+        self.engine = engine
+        self.batch_size = max(1, batch_size)
+        self.tracer = tracer
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, write: Write, undo: Undo = None) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("StateWriter is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='state-writer', daemon=True)
+                self._thread.start()
+                _open_writers.add(self)
+            self._queue.put((write, undo, future))
+        return future
+
+    def flush(self) -> None:
+        """Wait until all writes submitted so far are committed (or failed)"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Commit the pending writes and stop the background thread"""
+        with self._lock:
+            self._closed = True
+            thread, self._thread = self._thread, None
+        _open_writers.discard(self)
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch: List[Tuple[Write, Undo, Future]]) -> None:
+        done: List[Tuple[Undo, Future, Any]] = []
+        try:
+            with self.tracer.span('state.write'), Session(self.engine) as session:
+                for write, undo, future in batch:
+                    done.append((undo, future, write(session)))
+                session.commit()
+        except Exception as e:
+            for undo, _, _ in reversed(done):
+                if undo is not None:
+                    undo()
+            if len(batch) > 1:
+                for item in batch:
+                    self._write([item])
+            else:
+                _, _, future = batch[0]
+                print(f"Failed to write to the state database: {e!r}", file=sys.stderr)
+                future.set_exception(e)
+            return
+        for _, future, result in done:
+            future.set_result(result)
@@ -9,11 +9,48 @@ through deep exploration and understanding of comprehensive document sets and so
 
 # Import necessary modules
 
-from typing import Protocol
-from corpusaige.config.read import CorpusConfig
-from corpusaige.providers import llm_factory, vectorstore_factory
-from langchain.memory import ConversationBufferMemory
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple
+from corpusaige.config.read import CorpusConfig, get_int_entry
+from corpusaige.exceptions import InvalidConfigEntry, InvalidParameters
+from corpusaige.memory import (DEFAULT_MAX_TOKENS, DEFAULT_MEMORY_STRATEGY, DEFAULT_TURNS, asave_context,
+                               create_memory, describe_memory)
+from corpusaige.providers import acquire_vectorstore, llm_factory, release_vectorstore, supports_streaming
+from corpusaige.retrieval import count_tokens
+from corpusaige.tracing import NO_TRACER, Tracer
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.callbacks.manager import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
 from langchain.chains import RetrievalQA, ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain.schema import Document
+
+TokenCallback = Callable[[str], None]
+
+CONDENSE_MODES = ['auto', 'always']
+
+# words and phrases by which a question refers back to earlier turns of the conversation
+_REFERRING_RE = re.compile(r"\b(it|its|itself|this|that|these|those|they|them|their|theirs|he|him|his|she|her|"
+                           r"former|latter|above|previous|previously|earlier|same|mentioned|aforementioned|"
+                           r"else|again|instead|another)\b", re.IGNORECASE)
+_CONTINUATION_RE = re.compile(r"^\s*(and|but|also|so|then|or|what about|how about|why not|what if|"
+                              r"what else|same for|more)\b", re.IGNORECASE)
+_SHORT_QUESTION_WORDS = 3
+
+
+def refers_to_history(question: str) -> bool:
+    """Cheap heuristic verifying if a follow-up question needs the conversation to be understood
+    (e.g. 'And in Rust?', 'Why is that?', 'Show an example of it') as opposed to a self-contained
+    question ('How does the borrow checker work?'). Errs on the side of referring."""
+    words = question.split()
+    return (len(words) <= _SHORT_QUESTION_WORDS or bool(_CONTINUATION_RE.match(question)) 
+            or bool(_REFERRING_RE.search(question)))
+
+
+def context_tokens(llm_response: Dict[str, Any]) -> int:
+    """Number of tokens of the retrieved context the answer is based on"""
+    return sum(count_tokens(doc.page_content) for doc in llm_response.get('source_documents', []))
 
 
 class Interaction(Protocol):
@@ -29,11 +66,109 @@ def process_llm_response(llm_response):
     for source in llm_response["source_documents"]:
         print(source.metadata['source'])
         
+class TokenHandler(BaseCallbackHandler):
+    """Passes the tokens of a streaming LLM to a callback"""
+    def __init__(self, on_token: TokenCallback):
+        self.on_token = on_token
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.on_token(token)
+
+
+class ConversationChain(ConversationalRetrievalChain):
+    """ConversationalRetrievalChain which only rephrases (condenses) a question with the chat history
+    when the question refers to it (condense 'auto'). A question referring to the history is retrieved
+    with its rephrasing. A self-contained question rephrased anyway (condense 'always') is retrieved as
+    is, concurrently with the rephrasing, so each question costs a single retrieval."""
+
+    condense: str = 'auto'
+    tracer: Any = None
+
+    def _span(self, name: str):
+        return (self.tracer or NO_TRACER).span(name)
+
+    def _needs_condensing(self, question: str, chat_history_str: str) -> bool:
+        return bool(chat_history_str) and (self.condense == 'always' or refers_to_history(question))
+
+    def _retrieves_as_is(self, question: str) -> bool:
+        # a self-contained question retrieves as well as its rephrasing, which mostly differs in wording
+        return not refers_to_history(question)
+
+    def _call(self, inputs: Dict[str, Any], run_manager: Optional[CallbackManagerForChainRun] = None) -> Dict[str, Any]:
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        question = inputs["question"]
+        chat_history_str = (self.get_chat_history or _get_chat_history)(inputs["chat_history"])
+
+        if self._needs_condensing(question, chat_history_str) and self._retrieves_as_is(question):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                retrieval = executor.submit(self._get_docs, question, inputs, run_manager=_run_manager)
+                new_question = self._condense(question, chat_history_str, _run_manager)
+                docs = retrieval.result()
+        elif self._needs_condensing(question, chat_history_str):
+            new_question = self._condense(question, chat_history_str, _run_manager)
+            docs = self._get_docs(new_question, inputs, run_manager=_run_manager)
+        else:
+            new_question = question
+            docs = self._get_docs(question, inputs, run_manager=_run_manager)
+        
+        with self._span('prompt.llm'):
+            answer = self.combine_docs_chain.run(input_documents=docs, callbacks=_run_manager.get_child(), 
+                                                 **self._answer_inputs(inputs, new_question, chat_history_str))
+        return self._output(answer, docs, new_question)
+
+    async def _acall(self, inputs: Dict[str, Any], run_manager: Optional[AsyncCallbackManagerForChainRun] = None) -> Dict[str, Any]:
+        _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+        question = inputs["question"]
+        chat_history_str = (self.get_chat_history or _get_chat_history)(inputs["chat_history"])
+
+        if self._needs_condensing(question, chat_history_str) and self._retrieves_as_is(question):
+            new_question, docs = await asyncio.gather(
+                self._acondense(question, chat_history_str, _run_manager),
+                self._aget_docs(question, inputs, run_manager=_run_manager))
+        elif self._needs_condensing(question, chat_history_str):
+            new_question = await self._acondense(question, chat_history_str, _run_manager)
+            docs = await self._aget_docs(new_question, inputs, run_manager=_run_manager)
+        else:
+            new_question = question
+            docs = await self._aget_docs(question, inputs, run_manager=_run_manager)
+
+        with self._span('prompt.llm'):
+            answer = await self.combine_docs_chain.arun(input_documents=docs, callbacks=_run_manager.get_child(), 
+                                                        **self._answer_inputs(inputs, new_question, chat_history_str))
+        return self._output(answer, docs, new_question)
+
+    def _condense(self, question: str, chat_history_str: str, run_manager: CallbackManagerForChainRun) -> str:
+        with self._span('prompt.condense'):
+            return self.question_generator.run(question=question, chat_history=chat_history_str, 
+                                               callbacks=run_manager.get_child())
+
+    async def _acondense(self, question: str, chat_history_str: str, run_manager: AsyncCallbackManagerForChainRun) -> str:
+        with self._span('prompt.condense'):
+            return await self.question_generator.arun(question=question, chat_history=chat_history_str, 
+                                                      callbacks=run_manager.get_child())
+
+    def _answer_inputs(self, inputs: Dict[str, Any], new_question: str, chat_history_str: str) -> Dict[str, Any]:
+        new_inputs = inputs.copy()
+        if self.rephrase_question:
+            new_inputs["question"] = new_question
+        new_inputs["chat_history"] = chat_history_str
+        return new_inputs
+
+    def _output(self, answer: str, docs: List[Document], new_question: str) -> Dict[str, Any]:
+        output: Dict[str, Any] = {self.output_key: answer}
+        if self.return_source_documents:
+            output["source_documents"] = docs
+        if self.return_generated_question:
+            output["generated_question"] = new_question
+        return output
+
+
 class StatelessInteraction(Interaction):
     def __init__(self, config: CorpusConfig):
         # create the chain to answer questions
         self.llm = llm_factory(config)
-        self.vectorstore = vectorstore_factory(config)
+        self.config = config
+        self.vectorstore = acquire_vectorstore(config)
         retriever = self.vectorstore.as_retriever()
         
         self.qa_chain = RetrievalQA.from_chain_type(llm=self.llm,
@@ -45,36 +180,132 @@ class StatelessInteraction(Interaction):
     def send_prompt(self, prompt: str) -> str:
         llm_response = self.qa_chain(prompt)
         return process_llm_response(llm_response)
+
+    def close(self):
+        release_vectorstore(self.config)
     
 class StatefullInteraction(Interaction):
-    def __init__(self, config: CorpusConfig, retriever = None):
-        # create the chain to answer questions
-        self.llm = llm_factory(config)
+    def __init__(self, config: CorpusConfig, retriever = None, tracer: Tracer = NO_TRACER):
+        # create the chain to answer questions; only the answer is streamed, not the condensed question
+        self.llm = llm_factory(config, streaming=True)
+        self.condense_llm = llm_factory(config) if supports_streaming(self.llm) else self.llm
+        # the vector store is released by close() if it is acquired here
+        self._vectorstore_config = None
         if retriever is None:
-            self.retriever = vectorstore_factory(config).as_retriever()
+            self.retriever = acquire_vectorstore(config).as_retriever()
+            self._vectorstore_config = config
         else:
             self.retriever = retriever 
         
-        self.memory = ConversationBufferMemory(memory_key="chat_history", 
-                                               input_key='question', 
-                                               output_key='answer', 
-                                               return_messages=True)
+        memory_config = config.get_memory_config()
+        self.memory_turns = get_int_entry(memory_config, 'turns', DEFAULT_TURNS)
+        self.memory_max_tokens = get_int_entry(memory_config, 'max-tokens', DEFAULT_MAX_TOKENS)
+        try:
+            self.memory = create_memory(memory_config.get('strategy', DEFAULT_MEMORY_STRATEGY), self.condense_llm, 
+                                        self.memory_turns, self.memory_max_tokens)
+        except InvalidParameters as e:
+            raise InvalidConfigEntry(f"Invalid memory strategy in corpus.ini: {e}")
         
-        self.qa_chain = ConversationalRetrievalChain.from_llm(
+        self.condense = memory_config.get('condense', 'auto').lower()
+        if self.condense not in CONDENSE_MODES:
+            raise InvalidConfigEntry(f"Invalid condense mode in corpus.ini: {self.condense}, use one of: {', '.join(CONDENSE_MODES)}")
+        
+        self.qa_chain = ConversationChain.from_llm(
             llm=self.llm, 
+            condense_question_llm=self.condense_llm,
             retriever = self.retriever, 
             memory=self.memory, 
-            return_source_documents=True)
+            return_source_documents=True,
+            condense=self.condense,
+            tracer=tracer)
 
-    def send_prompt(self, prompt: str, show_sources: bool = False, results_num: int=4) -> str:
-        
-        self.retriever.search_kwargs['k'] = results_num
-        llm_response = self.qa_chain({"question": prompt})
+    def send_prompt(self, prompt: str, show_sources: bool = False, results_num: int=4, 
+                    doc_sets: Optional[List[str]] = None, token_budget: int = 0, 
+                    on_token: Optional[TokenCallback] = None) -> str:
+        """Send the prompt and return the answer. If on_token is given, the answer is passed to it 
+        while it is generated (in one piece if the LLM does not support streaming); the text 
+        passed to on_token equals the returned answer."""
+        return self.prompt(prompt, show_sources, results_num, doc_sets, token_budget, on_token)[0]
+
+    def prompt(self, prompt: str, show_sources: bool = False, results_num: int=4, 
+               doc_sets: Optional[List[str]] = None, token_budget: int = 0, 
+               on_token: Optional[TokenCallback] = None) -> Tuple[str, int]:
+        """send_prompt returning the answer with the number of tokens of the retrieved context"""
+        chain = self._chain(results_num, doc_sets, token_budget, memory=self.memory)
+        streaming = on_token is not None and supports_streaming(self.llm)
+        callbacks = [TokenHandler(on_token)] if streaming else None # type: ignore
+        llm_response = chain({"question": prompt}, callbacks=callbacks)
+        return self._answer(llm_response, show_sources, on_token, streaming), context_tokens(llm_response)
+
+    def _chain(self, results_num: int, doc_sets: Optional[List[str]], token_budget: int, 
+               memory: Any = None) -> ConversationChain:
+        # a chain and retriever per prompt: prompts may be sent concurrently (server, asynchronous API)
+        retriever = self.retriever.copy(update={'search_kwargs': {'k': results_num, 'doc_sets': doc_sets, 
+                                                                  'token_budget': token_budget}})
+        return ConversationChain(retriever=retriever,
+                                 combine_docs_chain=self.qa_chain.combine_docs_chain,
+                                 question_generator=self.qa_chain.question_generator,
+                                 memory=memory,
+                                 return_source_documents=True,
+                                 condense=self.qa_chain.condense,
+                                 tracer=self.qa_chain.tracer)
+
+    async def asend_prompt(self, prompt: str, show_sources: bool = False, results_num: int=4, 
+                           doc_sets: Optional[List[str]] = None, token_budget: int = 0, 
+                           on_token: Optional[TokenCallback] = None, isolated: bool = False) -> str:
+        """Asynchronous send_prompt. Several prompts can run concurrently: each call uses its own
+        retriever settings and a snapshot of the conversation history (no history at all if 
+        isolated, in which case the prompt and answer are not added to the conversation either)."""
+        return (await self.aprompt(prompt, show_sources, results_num, doc_sets, token_budget, on_token, isolated))[0]
+
+    async def aprompt(self, prompt: str, show_sources: bool = False, results_num: int=4, 
+                      doc_sets: Optional[List[str]] = None, token_budget: int = 0, 
+                      on_token: Optional[TokenCallback] = None, isolated: bool = False) -> Tuple[str, int]:
+        """asend_prompt returning the answer with the number of tokens of the retrieved context"""
+        chain = self._chain(results_num, doc_sets, token_budget)
+        chat_history = [] if isolated else self.memory.load_memory_variables({})['chat_history']
+        streaming = on_token is not None and supports_streaming(self.llm)
+        callbacks = [TokenHandler(on_token)] if streaming else None # type: ignore
+        llm_response = await chain.acall({"question": prompt, "chat_history": chat_history}, callbacks=callbacks)
+        if not isolated:
+            await asave_context(self.memory, {'question': prompt}, {'answer': llm_response['answer']})
+        return self._answer(llm_response, show_sources, on_token, streaming), context_tokens(llm_response)
+
+    def _answer(self, llm_response: dict, show_sources: bool, on_token: Optional[TokenCallback], streaming: bool) -> str:
+        if on_token is not None and not streaming:
+            on_token(llm_response['answer'])
       
         if show_sources:
             sources = [f"doc-set: {source.metadata['doc-set']}, source: {source.metadata['source']}"  for source in llm_response["source_documents"]]
             sources_str = "\n | ".join(sources)
+            if on_token is not None:
+                on_token(f'\n\nSources: {sources_str}')
             return f'{llm_response["answer"]}\n\nSources: {sources_str}'
         else:
             return llm_response['answer']
-     
\ No newline at end of file
+
+    def set_memory(self, strategy: str, size: Optional[int] = None):
+        """Switch the memory strategy, keeping the conversation (and its summary) so far. The size is
+        the number of turns (window) or tokens (tokens, summary) to keep; the buffer has no size.
+        Nothing changes if the strategy or size is invalid."""
+        turns, max_tokens = self.memory_turns, self.memory_max_tokens
+        if size is not None:
+            if strategy == 'buffer':
+                raise InvalidParameters("The buffer memory keeps the whole conversation, it takes no size")
+            elif strategy == 'window':
+                turns = size
+            else:
+                max_tokens = size
+        self.memory = create_memory(strategy, self.condense_llm, turns, max_tokens, self.memory.chat_memory.messages,
+                                    getattr(self.memory, 'moving_summary_buffer', ''))
+        self.memory_turns, self.memory_max_tokens = turns, max_tokens
+        self.qa_chain.memory = self.memory
+
+    @property
+    def memory_description(self) -> str:
+        return describe_memory(self.memory)
+
+    def close(self):
+        if self._vectorstore_config is not None:
+            release_vectorstore(self._vectorstore_config)
+            self._vectorstore_config = None
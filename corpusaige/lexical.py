@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+import math
+import os
+import re
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_MAGIC = b"CRPSGLX1"
+_HEADER = struct.Struct("<8sIII")
+# delta file records: generation of the main file, first chunk number, number of chunks and
+# size of the compressed record
+_DELTA_HEADER = struct.Struct("<QIIQ")
+
+# the delta file is merged into the main file beyond this many postings (or this fraction of the index)
+DELTA_MIN_POSTINGS = 100_000
+DELTA_RATIO = 0.25
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z0-9])|[A-Z]?[a-z0-9]+|[A-Z]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lower case terms. Identifiers are kept whole (so 'get_vectordb_factory'
+    can be matched exactly) and are also split in their snake_case/CamelCase parts."""
+    terms = []
+    for word in _WORD_RE.findall(text):
+        terms.append(word.lower())
+        parts = [p for chunk in word.split('_') for p in _CAMEL_RE.findall(chunk)]
+        if len(parts) > 1:
+            terms.extend(p.lower() for p in parts)
+    return terms
+
+
+def _join(strings: Iterable[str]) -> bytes:
+    return "\x00".join(strings).encode("utf-8")
+
+
+def _split(data: bytes) -> List[str]:
+    return data.decode("utf-8").split("\x00") if data else []
+
+
+def _sections(sections: List[bytes]) -> bytes:
+    return b"".join(struct.pack("<Q", len(s)) + s for s in sections)
+
+
+def _read_sections(payload: bytes) -> List[bytes]:
+    sections = []
+    pos = 0
+    while pos < len(payload):
+        (size,) = struct.unpack_from("<Q", payload, pos)
+        pos += 8
+        sections.append(payload[pos:pos + size])
+        pos += size
+    return sections
+
+
+class LexicalIndex:
+    """BM25 inverted index over the chunks stored in the vector store.
+
+    The index is persisted as a zlib compressed file with delta encoded postings (uint32 chunk
+    numbers and uint16 term frequencies per term), kept in memory as numpy arrays and only decoded
+    for the terms of a query. Chunks added later are appended to a delta file next to it, so a save
+    costs in proportion to what was added; the delta is merged into the main file once it grows
+    beyond a fraction of the index (or when a document set is removed).
+    """
+    path: Path
+
+    def __init__(self, path: Path, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.delta_path = path.with_suffix(".delta")
+        self.k1 = k1
+        self.b = b
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._ids: List[str] = []
+        self._doc_sets: List[str] = []
+        self._doc_set_of = array("I")
+        self._lengths = array("I")
+        self._total_length = 0
+        # packed postings: term -> (offset, count) in _docs/_tfs, terms in sorted order
+        self._terms: Dict[str, Tuple[int, int]] = {}
+        self._docs = np.zeros(0, dtype=np.uint32)
+        self._tfs = np.zeros(0, dtype=np.uint16)
+        # postings added since the main file was written (including those in the delta file)
+        self._pending: Dict[str, List[Tuple[int, int]]] = {}
+        # number of chunks in the main and delta files, postings in the delta file
+        self._saved_docs = 0
+        self._delta_postings = 0
+        # the files on disk can only be replaced as a whole (chunks were removed and renumbered)
+        self._rewrite = False
+        # identifies the main file the records of the delta file apply to
+        self._generation = 0
+
+    @property
+    def ids(self) -> List[str]:
+        self._ensure_loaded()
+        return self._ids
+
+    @property
+    def doc_sets(self) -> List[str]:
+        self._ensure_loaded()
+        return self._doc_sets
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._ids)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            # searches may run concurrently in worker threads
+            with self._load_lock:
+                if not self._loaded:
+                    if self.path.exists():
+                        self.load()
+                    self._loaded = True
+
+    def add(self, ids: List[str], texts: List[str], doc_sets: List[str]):
+        """Add chunks (identified by their vector store id) to the index"""
+        self._ensure_loaded()
+        for id, text, doc_set in zip(ids, texts, doc_sets):
+            terms = tokenize(text)
+            freqs: Dict[str, int] = {}
+            for term in terms:
+                freqs[term] = freqs.get(term, 0) + 1
+            self._add_doc(id, doc_set, len(terms), freqs.items())
+
+    def _add_doc(self, id: str, doc_set: str, length: int, freqs: Iterable[Tuple[str, int]]):
+        if doc_set not in self._doc_sets:
+            self._doc_sets.append(doc_set)
+        docnum = len(self._ids)
+        self._ids.append(id)
+        self._doc_set_of.append(self._doc_sets.index(doc_set))
+        self._lengths.append(length)
+        self._total_length += length
+        for term, tf in freqs:
+            self._pending.setdefault(term, []).append((docnum, min(tf, 0xFFFF)))
+
+    def remove_docset(self, docset_name: str):
+        """Remove all chunks of a document set, renumbering the remaining chunks"""
+        self._ensure_loaded()
+        if docset_name not in self._doc_sets:
+            return
+        self._merge_pending()
+        removed_set = self._doc_sets.index(docset_name)
+        doc_set_of = np.frombuffer(self._doc_set_of, dtype=np.uint32)
+        keep = doc_set_of != removed_set
+        renumber = (np.cumsum(keep) - 1).astype(np.uint32)
+
+        # filter the postings of all terms at once, dropping the terms left without postings
+        terms = list(self._terms)
+        term_ids = np.repeat(np.arange(len(terms)), [count for _, count in self._terms.values()])
+        mask = keep[self._docs]
+        term_ids = term_ids[mask]
+        docs = renumber[self._docs[mask]]
+        tfs = self._tfs[mask]
+        dfs = np.bincount(term_ids, minlength=len(terms))
+
+        kept = np.flatnonzero(keep).tolist()
+        self._ids = [self._ids[n] for n in kept]
+        self._lengths = array("I", (self._lengths[n] for n in kept))
+        self._total_length = sum(self._lengths)
+        # document sets after the removed one shift down
+        self._doc_set_of = array("I", (doc_set_of[keep] - (doc_set_of[keep] > removed_set)).astype(np.uint32).tobytes())
+        self._doc_sets = [ds for ds in self._doc_sets if ds != docset_name]
+        self._set_packed([term for term, df in zip(terms, dfs) if df > 0], dfs[dfs > 0], docs, tfs)
+        self._rewrite = True
+
+    def _set_packed(self, terms: List[str], dfs: np.ndarray, docs: np.ndarray, tfs: np.ndarray):
+        offsets = np.cumsum(dfs, dtype=np.int64) - dfs
+        self._terms = dict(zip(terms, zip(offsets.tolist(), dfs.tolist())))
+        self._docs = docs.astype(np.uint32, copy=False)
+        self._tfs = tfs.astype(np.uint16, copy=False)
+
+    def _merge_pending(self):
+        """Fold the pending postings into the packed arrays"""
+        if not self._pending:
+            return
+        old_terms = list(self._terms)
+        pending_terms = list(self._pending)
+        terms = sorted(set(old_terms).union(pending_terms))
+        position = {term: n for n, term in enumerate(terms)}
+        pending_dfs = [len(plist) for plist in self._pending.values()]
+        pending = np.fromiter(chain.from_iterable(chain.from_iterable(self._pending.values())),
+                              dtype=np.uint32).reshape(-1, 2)
+
+        term_ids = np.concatenate((
+            np.repeat(np.array([position[term] for term in old_terms], dtype=np.int64),
+                      [count for _, count in self._terms.values()]),
+            np.repeat(np.array([position[term] for term in pending_terms], dtype=np.int64), pending_dfs)))
+        docs = np.concatenate((self._docs, pending[:, 0]))
+        tfs = np.concatenate((self._tfs, pending[:, 1].astype(np.uint16)))
+        # pending postings have higher chunk numbers than the packed ones: a stable sort on the
+        # term keeps the postings of each term ordered by chunk
+        order = np.argsort(term_ids, kind="stable")
+        self._set_packed(terms, np.bincount(term_ids, minlength=len(terms)), docs[order], tfs[order])
+        self._pending = {}
+
+    def _postings(self, term: str) -> List[Tuple[int, int]]:
+        plist: List[Tuple[int, int]] = []
+        packed = self._terms.get(term)
+        if packed is not None:
+            offset, count = packed
+            plist.extend(zip(self._docs[offset:offset + count].tolist(), self._tfs[offset:offset + count].tolist()))
+        plist.extend(self._pending.get(term, []))
+        return plist
+
+    def search(self, query: str, k: int, doc_sets: Optional[List[str]] = None,
+               whole_words: bool = False) -> List[Tuple[str, float]]:
+        """Return the ids of the k best matching chunks with their BM25 score. With whole_words only
+        chunks containing every word of the query as a whole match: identifiers are not split in
+        their parts, so 'get_vectordb_factory' does not match a chunk about getting a factory."""
+        self._ensure_loaded()
+        n = len(self._ids)
+        if n == 0:
+            return []
+        allowed = None
+        if doc_sets:
+            allowed = {self._doc_sets.index(ds) for ds in doc_sets if ds in self._doc_sets}
+            if not allowed:
+                return []
+
+        avg_length = self._total_length / n or 1.0
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = {}
+        if whole_words:
+            terms = list(dict.fromkeys(word.lower() for word in _WORD_RE.findall(query)))
+        else:
+            terms = list(dict.fromkeys(tokenize(query)))
+        for term in terms:
+            plist = self._postings(term)
+            if not plist:
+                if whole_words:
+                    return []
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for docnum, tf in plist:
+                if allowed is not None and self._doc_set_of[docnum] not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[docnum] / avg_length)
+                scores[docnum] = scores.get(docnum, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                matched[docnum] = matched.get(docnum, 0) + 1
+
+        if whole_words:
+            scores = {docnum: score for docnum, score in scores.items() if matched[docnum] == len(terms)}
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self._ids[docnum], score) for docnum, score in best]
+
+    def save(self):
+        """Persist the index: chunks added since the last save are appended to the delta file,
+        which is merged into the main file when it grows too large"""
+        self._ensure_loaded()
+        if self._saved_docs == len(self._ids) and not self._rewrite and self.path.exists():
+            return
+        if self._rewrite or not self.path.exists():
+            self._write_main()
+            return
+        added = self._unsaved_postings()
+        if self._delta_postings + len(added[2]) > max(DELTA_MIN_POSTINGS, DELTA_RATIO * len(self._docs)):
+            self._write_main()
+        else:
+            self._append_delta(*added)
+
+    def _unsaved_postings(self) -> Tuple[List[str], List[int], List[Tuple[int, int]]]:
+        """The terms, document frequencies and postings of the chunks added since the last save"""
+        terms, dfs, postings = [], [], []
+        for term, plist in self._pending.items():
+            start = bisect_left(plist, self._saved_docs, key=itemgetter(0))
+            if start < len(plist):
+                terms.append(term)
+                dfs.append(len(plist) - start)
+                postings.extend(plist[start:])
+        return terms, dfs, postings
+
+    def _write_main(self):
+        self._merge_pending()
+        terms = list(self._terms)
+        dfs = np.array([count for _, count in self._terms.values()], dtype=np.uint32)
+        starts = np.array([offset for offset, _ in self._terms.values()], dtype=np.int64)
+        # chunk numbers are stored as the difference with the previous posting of the term
+        docs = self._docs.copy()
+        docs[1:] -= self._docs[:-1]
+        docs[starts] = self._docs[starts]
+
+        sections = [_join(self._ids), _join(self._doc_sets), self._doc_set_of.tobytes(),
+                    self._lengths.tobytes(), _join(terms), dfs.tobytes(), docs.tobytes(), self._tfs.tobytes()]
+        generation = int.from_bytes(os.urandom(8), "little")
+        sections.append(struct.pack("<Q", generation))
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, 1, len(self._ids), len(terms)))
+            f.write(zlib.compress(_sections(sections), 1))
+        tmp_path.replace(self.path)
+        # the delta is part of the main file now (records left by a crash here belong to another generation)
+        self.delta_path.unlink(missing_ok=True)
+        self._generation = generation
+        self._saved_docs = len(self._ids)
+        self._delta_postings = 0
+        self._rewrite = False
+
+    def _append_delta(self, terms: List[str], dfs: List[int], postings: List[Tuple[int, int]]):
+        start = self._saved_docs
+        new_docs = range(start, len(self._ids))
+        sections = [_join(self._ids[start:]), _join(self._doc_sets[self._doc_set_of[n]] for n in new_docs),
+                    self._lengths[start:].tobytes(), _join(terms), array("I", dfs).tobytes(),
+                    array("I", (docnum for docnum, _ in postings)).tobytes(),
+                    array("H", (tf for _, tf in postings)).tobytes()]
+        data = zlib.compress(_sections(sections), 1)
+        with open(self.delta_path, "ab") as f:
+            f.write(_DELTA_HEADER.pack(self._generation, start, len(new_docs), len(data)) + data)
+        self._saved_docs = len(self._ids)
+        self._delta_postings += len(postings)
+
+    def load(self):
+        with open(self.path, "rb") as f:
+            magic, _version, _num_docs, _num_terms = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"Not a lexical index file: {self.path}")
+            sections = _read_sections(zlib.decompress(f.read()))
+
+        self._reset()
+        self._ids = _split(sections[0])
+        self._doc_sets = _split(sections[1])
+        self._doc_set_of.frombytes(sections[2])
+        self._lengths.frombytes(sections[3])
+        self._total_length = sum(self._lengths)
+        dfs = np.frombuffer(sections[5], dtype=np.uint32)
+        docs = np.frombuffer(sections[6], dtype=np.uint32)
+        # undo the delta encoding of all terms at once: a running sum restarted at each term
+        running = np.cumsum(docs, dtype=np.uint64)
+        starts = np.cumsum(dfs, dtype=np.int64) - dfs
+        docs = running - np.repeat(running[starts] - docs[starts], dfs)
+        self._set_packed(_split(sections[4]), dfs, docs, np.frombuffer(sections[7], dtype=np.uint16))
+        # files written before delta files were introduced have no generation
+        self._generation = struct.unpack("<Q", sections[8])[0] if len(sections) > 8 else 0
+        self._saved_docs = len(self._ids)
+        if self.delta_path.exists():
+            self._load_delta()
+        self._loaded = True
+
+    def _load_delta(self):
+        with open(self.delta_path, "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos + _DELTA_HEADER.size <= len(data):
+            generation, start, num_docs, size = _DELTA_HEADER.unpack_from(data, pos)
+            pos += _DELTA_HEADER.size
+            if generation != self._generation or start != len(self._ids) or pos + size > len(data):
+                # records already merged into another main file, or cut short by a crash
+                break
+            record, pos = data[pos:pos + size], pos + size
+            sections = _read_sections(zlib.decompress(record))
+            ids, doc_sets = _split(sections[0]), _split(sections[1])
+            lengths = array("I", sections[2])
+            terms, dfs = _split(sections[3]), array("I", sections[4])
+            docs, tfs = array("I", sections[5]), array("H", sections[6])
+            for id, doc_set, length in zip(ids, doc_sets, lengths):
+                self._add_doc(id, doc_set, length, ())
+            offset = 0
+            for term, df in zip(terms, dfs):
+                self._pending.setdefault(term, []).extend(zip(docs[offset:offset + df], tfs[offset:offset + df]))
+                offset += df
+            self._delta_postings += len(docs)
+        self._saved_docs = len(self._ids)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+from typing import Any, Dict, List, Optional
+
+from langchain.memory import (ConversationBufferMemory, ConversationBufferWindowMemory,
+                              ConversationSummaryBufferMemory)
+from langchain.chains import LLMChain
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.schema import BaseMessage, SystemMessage, get_buffer_string
+from pydantic import PrivateAttr
+
+from corpusaige.exceptions import InvalidParameters
+from corpusaige.retrieval import count_tokens
+
+MEMORY_STRATEGIES = ['buffer', 'window', 'tokens', 'summary']
+DEFAULT_MEMORY_STRATEGY = 'buffer'
+DEFAULT_TURNS = 5
+DEFAULT_MAX_TOKENS = 2000
+
+# overhead of the role and separators of a message
+_MESSAGE_TOKENS = 4
+
+
+def message_tokens(messages: List[BaseMessage]) -> int:
+    """Estimated number of tokens of the messages (with the same tokenizer as the context)"""
+    return sum(count_tokens(message.content) + _MESSAGE_TOKENS for message in messages)
+
+
+class TokenWindowMemory(ConversationBufferMemory):
+    """Buffer of the most recent messages fitting in max_token_limit tokens"""
+    max_token_limit: int = DEFAULT_MAX_TOKENS
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        self.prune()
+
+    def prune(self) -> None:
+        messages = self.chat_memory.messages
+        while messages and message_tokens(messages) > self.max_token_limit:
+            messages.pop(0)
+
+
+class RollingSummaryMemory(ConversationSummaryBufferMemory):
+    """The most recent messages fitting in max_token_limit tokens, preceded by a summary (made by the
+    LLM) of the older messages"""
+    # messages pruned while a summary is made asynchronously, added to the summary after it
+    _unsummarized: List[BaseMessage] = PrivateAttr(default_factory=list)
+    _summarizing: bool = PrivateAttr(default=False)
+
+    def _pop_pruned(self) -> List[BaseMessage]:
+        messages = self.chat_memory.messages
+        pruned = []
+        while messages and message_tokens(messages) > self.max_token_limit:
+            pruned.append(messages.pop(0))
+        return pruned
+
+    def prune(self) -> None:
+        pruned = self._pop_pruned()
+        if pruned:
+            self.moving_summary_buffer = self.predict_new_summary(pruned, self.moving_summary_buffer)
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        """save_context which summarizes with the asynchronous LLM API"""
+        BaseChatMemory.save_context(self, inputs, outputs)
+        await self.aprune()
+
+    async def aprune(self) -> None:
+        """Asynchronous prune. The summaries of concurrent prunes are made one after the other, so each
+        extends the summary made before it."""
+        self._unsummarized.extend(self._pop_pruned())
+        if self._summarizing:
+            return
+        self._summarizing = True
+        try:
+            while self._unsummarized:
+                pruned, self._unsummarized = self._unsummarized, []
+                new_lines = get_buffer_string(pruned, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+                chain = LLMChain(llm=self.llm, prompt=self.prompt)
+                self.moving_summary_buffer = await chain.apredict(summary=self.moving_summary_buffer,
+                                                                  new_lines=new_lines)
+        finally:
+            self._summarizing = False
+
+
+async def asave_context(memory: BaseChatMemory, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+    """Save a turn of the conversation in the memory without blocking the event loop on a summary"""
+    if isinstance(memory, RollingSummaryMemory):
+        await memory.asave_context(inputs, outputs)
+    else:
+        memory.save_context(inputs, outputs)
+
+
+def create_memory(strategy: str, llm: Any, turns: int = DEFAULT_TURNS, max_tokens: int = DEFAULT_MAX_TOKENS,
+                  messages: Optional[List[BaseMessage]] = None, summary: str = '') -> BaseChatMemory:
+    """Create the conversation memory of the given strategy:
+        buffer  - the whole conversation
+        window  - the last turns (question and answer) of the conversation
+        tokens  - the most recent messages fitting in max_tokens tokens
+        summary - as tokens, preceded by a rolling summary of the older messages (made by llm)
+    The memory is filled with messages and the summary of older messages (e.g. those of the memory
+    it replaces); memories without a summary keep it as a system message preceding the messages."""
+    settings: Dict[str, Any] = dict(memory_key="chat_history", input_key='question', output_key='answer',
+                                    return_messages=True)
+    match strategy:
+        case 'buffer':
+            memory: BaseChatMemory = ConversationBufferMemory(**settings)
+        case 'window':
+            memory = ConversationBufferWindowMemory(k=turns, **settings)
+        case 'tokens':
+            memory = TokenWindowMemory(max_token_limit=max_tokens, **settings)
+        case 'summary':
+            memory = RollingSummaryMemory(llm=llm, max_token_limit=max_tokens, **settings)
+        case _:
+            raise InvalidParameters(f"Unknown memory strategy {strategy}, use one of: {', '.join(MEMORY_STRATEGIES)}")
+
+    if isinstance(memory, RollingSummaryMemory):
+        memory.moving_summary_buffer = summary
+    elif summary:
+        messages = [SystemMessage(content=summary), *(messages or [])]
+    if messages:
+        memory.chat_memory.messages.extend(messages)
+        if isinstance(memory, (TokenWindowMemory, RollingSummaryMemory)):
+            memory.prune()
+    return memory
+
+
+def describe_memory(memory: BaseChatMemory) -> str:
+    """Short description of the strategy and size of the memory"""
+    if isinstance(memory, ConversationBufferWindowMemory):
+        return f"window (last {memory.k} turns)"
+    elif isinstance(memory, RollingSummaryMemory):
+        return f"summary (summary and last {memory.max_token_limit} tokens)"
+    elif isinstance(memory, TokenWindowMemory):
+        return f"tokens (last {memory.max_token_limit} tokens)"
+    else:
+        return "buffer (whole conversation)"
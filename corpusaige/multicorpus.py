@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema import Document as Chunk
+
+from corpusaige.config.read import CorpusConfig, get_config
+from corpusaige.corpus import StatefullCorpus
+from corpusaige.documentset import Document, DocumentSet
+from corpusaige.exceptions import InvalidParameters
+from corpusaige.retrieval import CorpusRetriever
+from corpusaige.storage import VectorRepository
+from corpusaige.tracing import NO_TRACER, Tracer
+
+
+def normalize_scores(results: List[Tuple[Chunk, float]]) -> List[Tuple[Chunk, float]]:
+    """Min-max normalize the scores of the results of one corpus to [0, 1], so results of corpora
+    with different score scales (e.g. fused ranks and vector similarity) can be merged"""
+    if not results:
+        return []
+    scores = [score for _, score in results]
+    low, high = min(scores), max(scores)
+    if high == low:
+        return [(chunk, 1.0) for chunk, _ in results]
+    return [(chunk, (score - low) / (high - low)) for chunk, score in results]
+
+
+def merge_results(results_per_corpus: Dict[str, List[Tuple[Chunk, float]]], k: int) -> List[Tuple[Chunk, float]]:
+    """Merge the results of several corpora into the k best by normalized score. The chunks are
+    attributed to their corpus (metadata 'corpus'); equal scores are ordered by rank."""
+    merged = []
+    for name, results in results_per_corpus.items():
+        for rank, (chunk, score) in enumerate(normalize_scores(results)):
+            chunk.metadata['corpus'] = name
+            merged.append((score, -rank, chunk))
+    merged.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    return [(chunk, score) for score, _, chunk in merged[:k]]
+
+
+class FederatedRepository:
+    """Searches several VectorRepositories (one per corpus) concurrently and merges the results"""
+
+    def __init__(self, repositories: Dict[str, VectorRepository], tracer: Tracer = NO_TRACER):
+        self.repositories = repositories
+        self.tracer = tracer
+        self.merge_chunks = all(repository.merge_chunks for repository in repositories.values())
+        self._executor = ThreadPoolExecutor(max_workers=len(repositories), thread_name_prefix='corpus')
+
+    def as_retriever(self):
+        return CorpusRetriever(repository=self)
+
+    def retrieve(self, query: str, k: int, doc_sets: Optional[List[str]] = None) -> List[Tuple[Chunk, float]]:
+        with self.tracer.span('retrieve.federated'):
+            futures = {name: self._executor.submit(repository.retrieve, query, k, doc_sets)
+                       for name, repository in self.repositories.items()}
+            return merge_results({name: future.result() for name, future in futures.items()}, k)
+
+    async def aretrieve(self, query: str, k: int, doc_sets: Optional[List[str]] = None) -> List[Tuple[Chunk, float]]:
+        with self.tracer.span('retrieve.federated'):
+            results = await asyncio.gather(*(repository.aretrieve(query, k, doc_sets)
+                                             for repository in self.repositories.values()))
+            return merge_results(dict(zip(self.repositories.keys(), results)), k)
+
+    def search(self, search_str: str, results_num: int, doc_sets: Optional[List[str]] = None) -> List[str]:
+        return self._format_results(self.retrieve(search_str, results_num, doc_sets))
+
+    async def asearch(self, search_str: str, results_num: int, doc_sets: Optional[List[str]] = None) -> List[str]:
+        return self._format_results(await self.aretrieve(search_str, results_num, doc_sets))
+
+    @staticmethod
+    def _format_results(result: List[Tuple[Chunk, float]]) -> List[str]:
+        return ["\n\n".join([f"[{doc.metadata['corpus']}] {doc.metadata['source']}", doc.page_content]) for doc, _ in result]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        for repository in self.repositories.values():
+            repository.close()
+
+    def ls(self, all_docs: bool = False, doc_set: str = '') -> List[str]:
+        """As VectorRepository.ls, with the entries of every corpus prefixed by the name of the corpus"""
+        futures = {name: self._executor.submit(repository.ls, all_docs, doc_set)
+                   for name, repository in self.repositories.items()}
+        return [f"{name}: {entry}" for name, future in futures.items() for entry in future.result()]
+
+    def doc_set_names(self) -> List[str]:
+        """Names of the document sets of all corpora (a name used in several corpora once)"""
+        futures = [self._executor.submit(repository.ls) for repository in self.repositories.values()]
+        return list(dict.fromkeys(name for future in futures for name in future.result()))
+
+
+class MultiCorpus(StatefullCorpus):
+    """Search and chat across several corpora at once. The corpora are searched in parallel and their
+    results merged; the first corpus provides the LLM and stores the conversations, annotations
+    and document sets added or removed."""
+
+    def __init__(self, configs: List[str | CorpusConfig], show_sources: bool = False, context_size: int = 15):
+        if len(configs) < 1:
+            raise InvalidParameters("MultiCorpus needs at least one corpus")
+        configs = [get_config(config) if isinstance(config, str) else config for config in configs]
+        super().__init__(configs[0], show_sources, context_size)
+
+        self.configs: Dict[str, CorpusConfig] = {}
+        for config in configs:
+            name = config.name
+            while name in self.configs:
+                name = f"{name}'"
+            self.configs[name] = config
+        self.name = " + ".join(self.configs.keys())
+
+    def _create_repository(self) -> FederatedRepository: # type: ignore
+        for config in self.configs.values():
+            self._ensure_provider(config.vector_db)
+            self._ensure_provider(config.embeddings)
+        with ThreadPoolExecutor(max_workers=len(self.configs)) as executor:
+            repositories = list(executor.map(lambda config: VectorRepository(config, self.tracer), self.configs.values()))
+        return FederatedRepository(dict(zip(self.configs.keys(), repositories)), self.tracer)
+
+    @property
+    def primary_repository(self) -> VectorRepository:
+        return next(iter(self.repository.repositories.values())) # type: ignore
+
+    @property
+    def corpus_names(self) -> List[str]:
+        return list(self.configs.keys())
+
+    def doc_set_names(self) -> List[str]:
+        return self.repository.doc_set_names() # type: ignore
+
+    def add_docset(self, docset: DocumentSet) -> None:
+        self.primary_repository.add_docset(docset)
+
+    def remove_docset(self, docset_name: str) -> None:
+        self.primary_repository.remove_docset(docset_name)
+
+    def add_doc(self, doc: Document, docset_name: str) -> None:
+        self.primary_repository.add_doc(doc, docset_name)
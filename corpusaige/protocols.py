@@ -29,6 +29,10 @@ class Output(Protocol):
         """Print text to the screen"""
         ...
 
+    def print_token(self, text: str):
+        """Print part of a streamed text to the screen (without line break)"""
+        ...
+
     def clear(self):
         """Clear the screen"""
         ...
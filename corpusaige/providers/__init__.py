@@ -9,34 +9,99 @@ through deep exploration and understanding of comprehensive document sets and so
 
 
 # Import necessary modules
-from corpusaige.config.read import ConfigEntries, CorpusConfig
-from typing import Any
+import inspect
+from corpusaige.config.read import ConfigEntries, CorpusConfig, get_bool_entry
+from typing import Any, Optional
 
 from corpusaige.exceptions import InvalidConfigEntry, InvalidProviderConfig
-from corpusaige.registry import ServiceRegistry
+from corpusaige.registry import ClientRegistry, ServiceRegistry
 
 
-def llm_factory(config: CorpusConfig) -> Any:
+def llm_factory(config: CorpusConfig, streaming: bool = False) -> Any:
     
     factory = ServiceRegistry.get_service_item(config.llm, "get_llm_factory")
     if factory is None:
         raise InvalidProviderConfig(f"LLM type {config.llm} not found or factory not implemented")
     
+    # streaming is optional for providers: factories without the parameter return a non-streaming LLM
+    if streaming and 'streaming' in inspect.signature(factory).parameters:
+        return factory(config, streaming=True)
     return factory(config)
 
+
+def supports_streaming(llm: Any) -> bool:
+    """Verifies if the LLM reports its answer token by token to its callbacks"""
+    return bool(getattr(llm, 'streaming', False))
+
+
+def _section_key(entries: ConfigEntries) -> tuple:
+    return tuple(sorted(entries.items()))
+
+def embeddings_key(config: CorpusConfig) -> tuple:
+    """Corpora with the same embeddings configuration share one embeddings client"""
+    return ("embeddings", config.embeddings, _section_key(config.get_embeddings_config()))
+
+def vectorstore_key(config: CorpusConfig, shard: Optional[str] = None) -> tuple:
+    return ("vectorstore", str(config.config_path.resolve()), config.vector_db,
+            _section_key(config.get_vector_db_config()), embeddings_key(config), shard)
+
+def is_sharded(config: CorpusConfig) -> bool:
+    """Verifies if the corpus keeps each document set (or group of document sets) in a shard of its own"""
+    return get_bool_entry(config.get_sharding_config(), "enabled", False)
        
 def embeddings_factory(config: CorpusConfig) -> Any:
-    factory = ServiceRegistry.get_service_item(config.llm, "get_embeddings_factory")
+    """The (shared) embeddings client of the configured embeddings provider (by default the provider 
+    of the LLM); release it with release_embeddings"""
+    factory = ServiceRegistry.get_service_item(config.embeddings, "get_embeddings_factory")
     if factory is None:
-        raise InvalidProviderConfig(f"LLM type {config.llm} not found or factory not implemented")
-    return factory(config)
+        raise InvalidProviderConfig(f"Embeddings type {config.embeddings} not found or factory not implemented")
+    return ClientRegistry.acquire(embeddings_key(config), lambda: factory(config))
+
+def release_embeddings(config: CorpusConfig) -> None:
+    ClientRegistry.release(embeddings_key(config))
 
-def vectorstore_factory(config: CorpusConfig) -> Any:
+def vectorstore_factory(config: CorpusConfig, shard: Optional[str] = None) -> Any:
    
     factory = ServiceRegistry.get_service_item(config.vector_db, "get_vectordb_factory")
     if factory is None:
         raise InvalidProviderConfig(f"VectorStore type {config.vector_db} not found or factory not implemented")                                           
-    return factory(config)
+    if shard is None:
+        return factory(config)
+    # sharding is optional for providers: their factories create the store of a shard if they have the parameter
+    if 'shard' not in inspect.signature(factory).parameters:
+        raise InvalidProviderConfig(f"VectorStore type {config.vector_db} does not support sharding")
+    return factory(config, shard=shard)
+
+def acquire_vectorstore(config: CorpusConfig, shard: Optional[str] = None) -> Any:
+    """The vector store of the corpus (or of one of its shards), shared by all users in this process 
+    (repositories, interactions, scripts, plugins); every acquire must be matched by a release_vectorstore.
+    The store of a sharded corpus spans all its shards."""
+    if shard is None and is_sharded(config):
+        def create() -> Any:
+            from corpusaige.sharding import ShardedStore
+            return ShardedStore(config)
+    else:
+        def create() -> Any:
+            return vectorstore_factory(config, shard)
+    return ClientRegistry.acquire(vectorstore_key(config, shard), create,
+                                  lambda vectorstore: _close_vectorstore(config, vectorstore))
+
+def release_vectorstore(config: CorpusConfig, shard: Optional[str] = None) -> None:
+    ClientRegistry.release(vectorstore_key(config, shard))
+
+def drop_vectorstore_shard(config: CorpusConfig, shard: str) -> None:
+    """Delete a shard with all its chunks; it must not be in use (acquired)"""
+    drop = ServiceRegistry.get_service_item(config.vector_db, "drop_vectordb_shard")
+    if drop is None:
+        raise InvalidProviderConfig(f"VectorStore type {config.vector_db} does not support sharding")
+    drop(config, shard)
+
+def _close_vectorstore(config: CorpusConfig, vectorstore: Any) -> None:
+    for method in ("persist", "close"):
+        if callable(getattr(vectorstore, method, None)):
+            getattr(vectorstore, method)()
+    # the embeddings were acquired by the factory of the vector store
+    release_embeddings(config)
 
 def vectorstore_creator_factory(config: CorpusConfig) -> Any:
     factory = ServiceRegistry.get_service_item(config.vector_db, "local_vectordb_creator_factory")
@@ -45,7 +110,10 @@ def vectorstore_creator_factory(config: CorpusConfig) -> Any:
     return factory(config)
      
 def register_internal_factories():
-    """Register all factories of  'internal' providers/plugins."""
-    from corpusaige.providers import chroma, openai
-    ServiceRegistry.register_provider(openai) # type: ignore
-    ServiceRegistry.register_provider(chroma) # type: ignore
\ No newline at end of file
+    """Register all factories of  'internal' providers/plugins. The provider modules (and their
+    dependencies: langchain, chromadb, numpy...) are imported when the provider is first used."""
+    ServiceRegistry.register_lazy_provider("openai", "corpusaige.providers.openai")
+    ServiceRegistry.register_lazy_provider("chroma", "corpusaige.providers.chroma")
+    ServiceRegistry.register_lazy_provider("npstore", "corpusaige.providers.npstore")
+    ServiceRegistry.register_lazy_provider("local", "corpusaige.providers.local")
+    ServiceRegistry.register_lazy_provider("fake", "corpusaige.providers.fake")
\ No newline at end of file
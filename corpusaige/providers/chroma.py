@@ -7,37 +7,175 @@ through deep exploration and understanding of comprehensive document sets and so
 @license: MIT
 """
 import sys
-from typing import Any
-from corpusaige.config.read import ConfigEntries, CorpusConfig
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+from corpusaige.config.read import ConfigEntries, CorpusConfig, get_float_entry, get_int_entry
 from corpusaige.exceptions import InvalidConfigEntry
 from corpusaige.registry import ServiceRegistry
 from corpusaige.providers import embeddings_factory
-from langchain.vectorstores import Chroma
 
 
 _name = "chroma"
 
-_exported_items = ["get_vectordb_factory", "local_vectordb_creator_factory"]
+_exported_items = ["get_vectordb_factory", "local_vectordb_creator_factory", "drop_vectordb_shard"]
 
+DEFAULT_COLLECTION = "langchain"
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_POOL_SIZE = 10
+DEFAULT_BATCH_SIZE = 256
 
-def get_vectordb_factory(config: CorpusConfig) -> Any:
+
+def parse_connection_string(connection_string: str) -> Tuple[str, int, bool]:
+    """Host, port and ssl of a Chroma server url (http[s]://host[:port])"""
+    url = urlparse(connection_string if "://" in connection_string else f"http://{connection_string}")
+    if url.scheme not in ("http", "https") or not url.hostname:
+        raise InvalidConfigEntry(f"ChromaDb: invalid connection-string: {connection_string}")
+    ssl = url.scheme == "https"
+    return url.hostname, url.port or (443 if ssl else 8000), ssl
+
+
+def batches(items: List[Any], size: int) -> Iterable[Tuple[int, int]]:
+    """(start, end) of consecutive batches of at most size items"""
+    for start in range(0, len(items), size):
+        yield start, min(start + size, len(items))
+
+
+def http_client(connection_string: str, timeout: float = DEFAULT_TIMEOUT, pool_size: int = DEFAULT_POOL_SIZE) -> Any:
+    """Client of a Chroma server. Its requests share a pool of kept-alive connections (pool_size
+    connections at most) and time out after timeout seconds."""
+    import chromadb
+    from chromadb.config import Settings
+    from requests.adapters import HTTPAdapter
+
+    class TimeoutHTTPAdapter(HTTPAdapter):
+        def send(self, request, **kwargs):
+            # chromadb sends its requests without a timeout
+            if kwargs.get("timeout") is None:
+                kwargs["timeout"] = timeout
+            return super().send(request, **kwargs)
+
+    host, port, ssl = parse_connection_string(connection_string)
+    client = chromadb.HttpClient(host=host, port=str(port), ssl=ssl, settings=Settings(anonymized_telemetry=False))
+    adapter = TimeoutHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    client._session.mount("http://", adapter)
+    client._session.mount("https://", adapter)
+    return client
+
+
+def _server_store_class():
+    from langchain.vectorstores import Chroma
+
+    class ChromaServerStore(Chroma):
+        """Chroma collection on a Chroma server. Large adds and gets are sent in batches (of
+        batch_size chunks) so no request exceeds the limits of the server; the server persists
+        the data itself."""
+
+        def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, **kwargs: Any):
+            super().__init__(**kwargs)
+            self.batch_size = batch_size
+
+        def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                      ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+            texts = list(texts)
+            added: List[str] = []
+            for start, end in batches(texts, self.batch_size):
+                added += super().add_texts(texts[start:end], metadatas[start:end] if metadatas else None,
+                                           ids[start:end] if ids else None, **kwargs)
+            return added
+
+        def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+                limit: Optional[int] = None, offset: Optional[int] = None, where_document: Optional[Dict] = None,
+                include: Optional[List[str]] = None) -> Dict[str, Any]:
+            if limit is not None or offset is not None:
+                return super().get(ids, where, limit, offset, where_document, include)
+            result: Dict[str, Any] = {}
+            if ids is not None:
+                pages = (super(ChromaServerStore, self).get(ids[start:end], where, None, None, where_document, include)
+                         for start, end in batches(ids, self.batch_size))
+            else:
+                pages = self._pages(where, where_document, include)
+            for page in pages:
+                for key, values in page.items():
+                    if isinstance(values, list):
+                        result.setdefault(key, []).extend(values)
+                    else:
+                        result.setdefault(key, values)
+            return result if result else super().get(ids, where, limit, offset, where_document, include)
+
+        def _pages(self, where, where_document, include):
+            offset = 0
+            while True:
+                page = super().get(None, where, self.batch_size, offset, where_document, include)
+                yield page
+                if len(page["ids"]) < self.batch_size:
+                    return
+                offset += self.batch_size
+
+        def persist(self) -> None:
+            pass
+
+    return ChromaServerStore
+
+
+def _server_client(config: CorpusConfig) -> Any:
+    vbconfig = config.get_vector_db_config()
+    return http_client(vbconfig["connection-string"], get_float_entry(vbconfig, "timeout", DEFAULT_TIMEOUT),
+                       get_int_entry(vbconfig, "pool-size", DEFAULT_POOL_SIZE))
+
+
+def collection_name(config: CorpusConfig, shard: Optional[str] = None) -> str:
+    """Name of the collection of the corpus, or of one of its shards"""
+    vbconfig = config.get_vector_db_config()
+    if vbconfig.get("connection-string"):
+        # the collections of several corpora may share a server
+        collection = vbconfig.get("collection", DEFAULT_COLLECTION)
+        return f"{collection}-{shard}" if shard else collection
+    return shard or DEFAULT_COLLECTION
+
+
+def _server_store(config: CorpusConfig, embedding: Any = None, shard: Optional[str] = None) -> Any:
+    vbconfig = config.get_vector_db_config()
+    return _server_store_class()(batch_size=max(1, get_int_entry(vbconfig, "batch-size", DEFAULT_BATCH_SIZE)),
+                                 collection_name=collection_name(config, shard),
+                                 embedding_function=embedding, client=_server_client(config))
+
+
+def get_vectordb_factory(config: CorpusConfig, shard: Optional[str] = None) -> Any:
 
     vbconfig = config.get_vector_db_config()
-    path = config.resolve_path_to_config(vbconfig.get("path", None)) 
-        
     # type: ignore
     connection_string = vbconfig.get("connection-string", None)
-    if path is None and connection_string is None:
+    if not vbconfig.get("path") and not connection_string:
         raise InvalidConfigEntry("ChromaDb: Either path or connection must be provided")
 
     embedding = embeddings_factory(config)
-    if path:
-        vectordb = Chroma(persist_directory=str(path),
-                            embedding_function=embedding)
-        return vectordb
+    if connection_string:
+        # client/server mode: several processes share the index of the server
+        return _server_store(config, embedding, shard)
+
+    from langchain.vectorstores import Chroma
+
+    path = config.resolve_path_to_config(vbconfig["path"])
+    vectordb = Chroma(persist_directory=str(path), collection_name=collection_name(config, shard),
+                        embedding_function=embedding)
+    return vectordb
+
+
+def drop_vectordb_shard(config: CorpusConfig, shard: str) -> None:
+    vbconfig = config.get_vector_db_config()
+    if vbconfig.get("connection-string"):
+        client = _server_client(config)
     else:
-        raise NotImplementedError(
-            "ChromaDb: Service connection not implemented")
+        import chromadb
+        from chromadb.config import Settings
+
+        client = chromadb.PersistentClient(path=str(config.resolve_path_to_config(vbconfig["path"])),
+                                           settings=Settings(anonymized_telemetry=False))
+    try:
+        client.delete_collection(collection_name(config, shard))
+    except ValueError:
+        # no such collection
+        pass
   
 
 
@@ -47,7 +185,13 @@ def local_vectordb_creator_factory(config: CorpusConfig) -> None:
     """
     
     def _():
+        from langchain.vectorstores import Chroma
+
         vbconfig: ConfigEntries = config.get_vector_db_config()
+        if vbconfig.get("connection-string"):
+            # creates the collection on the server
+            _server_store(config)
+            return
         path = config.resolve_path_to_config(
             vbconfig.get("path", None))   # type: ignore
         vectordb = Chroma(persist_directory=str(path))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Deterministic stand-ins for the LLM and embeddings of a remote provider, with a configurable
+# simulated latency. They make every code path usable without network access or API key, so
+# the overhead of Corpusaige itself can be measured (see benchmarks/) and demos run offline.
+
+# Import necessary modules
+import asyncio
+import hashlib
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain.llms.base import LLM
+
+from corpusaige.config.read import CorpusConfig, get_float_entry, get_int_entry
+from corpusaige.providers.local import DEFAULT_DIM, HashedNgramEmbeddings
+
+_name = "fake"
+
+_exported_items = ["get_llm_factory", "get_embeddings_factory"]
+
+DEFAULT_ANSWER_WORDS = 20
+_WORDS = ("the corpus answers questions about documents with sources retrieved by hybrid search "
+          "of chunks embedded stored ranked merged packed and sent to a model").split()
+
+
+def fake_answer(prompt: str, words: int = DEFAULT_ANSWER_WORDS) -> str:
+    """Answer of the fake LLM: words chosen by a hash of the prompt, so equal prompts get equal answers"""
+    digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+    return " ".join(_WORDS[digest[i % len(digest)] % len(_WORDS)] for i in range(words)).capitalize() + "."
+
+
+class FakeLLM(LLM):
+    """LLM answering deterministically after latency seconds; a streaming FakeLLM reports the
+    answer word by word to its callbacks."""
+    latency: float = 0.0
+    answer_words: int = DEFAULT_ANSWER_WORDS
+    streaming: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        if self.latency > 0:
+            time.sleep(self.latency)
+        answer = fake_answer(prompt, self.answer_words)
+        if self.streaming and run_manager is not None:
+            for word in re.findall(r"\S+\s*", answer):
+                run_manager.on_llm_new_token(word)
+        return answer
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        answer = fake_answer(prompt, self.answer_words)
+        if self.streaming and run_manager is not None:
+            for word in re.findall(r"\S+\s*", answer):
+                await run_manager.on_llm_new_token(word)
+        return answer
+
+
+class FakeEmbeddings(HashedNgramEmbeddings):
+    """Local hashed n-gram embeddings which take latency seconds per request (batch of texts),
+    like a remote embeddings API"""
+
+    def __init__(self, latency: float = 0.0, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.latency = latency
+
+    def embed_batch(self, texts: List[str]):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return super().embed_batch(texts)
+
+
+def get_llm_factory(config: CorpusConfig, streaming: bool = False) -> Any:
+    entries = config.get_llm_config()
+    return FakeLLM(latency=get_float_entry(entries, "latency", 0.0),
+                   answer_words=get_int_entry(entries, "answer-words", DEFAULT_ANSWER_WORDS), streaming=streaming)
+
+
+def get_embeddings_factory(config: CorpusConfig) -> Any:
+    entries = config.get_embeddings_config()
+    return FakeEmbeddings(latency=get_float_entry(entries, "embedding-latency", 0.0),
+                          dim=get_int_entry(entries, "dim", DEFAULT_DIM),
+                          batch_size=get_int_entry(entries, "batch-size", 64),
+                          threads=get_int_entry(entries, "threads", 0))
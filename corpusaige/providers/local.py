@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Local (offline) embeddings: the character n-grams of a text are hashed into a fixed number of
+# dimensions (the 'hashing trick'), with a hash-derived sign to cancel out collisions. No model
+# is downloaded and no data leaves the machine, so air-gapped material can be indexed. A whole
+# batch of texts is hashed with a few vectorized NumPy operations; batches are spread over a
+# pool of threads.
+
+# Import necessary modules
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from corpusaige.config.read import CorpusConfig, get_int_entry
+from corpusaige.exceptions import InvalidConfigEntry
+
+_name = "local"
+
+_exported_items = ["get_embeddings_factory"]
+
+DEFAULT_DIM = 512
+DEFAULT_NGRAM_MIN = 3
+DEFAULT_NGRAM_MAX = 5
+DEFAULT_BATCH_SIZE = 64
+
+_FNV_OFFSET = np.uint64(14695981039346656037)
+_FNV_PRIME = np.uint64(1099511628211)
+_SEPARATOR = 0
+
+
+def _ngram_hashes(data: np.ndarray, n: int) -> np.ndarray:
+    """FNV-1a hashes of all n-grams (of bytes) of data, the order n mixed in"""
+    windows = np.lib.stride_tricks.sliding_window_view(data, n)
+    hashes = np.full(len(windows), _FNV_OFFSET, dtype=np.uint64)
+    for i in range(n):
+        hashes ^= windows[:, i].astype(np.uint64)
+        hashes *= _FNV_PRIME
+    return hashes ^ np.uint64(n)
+
+
+class HashedNgramEmbeddings(Embeddings):
+    """Embeddings of hashed character n-grams (ngram_min to ngram_max bytes of the lower-cased
+    text), L2 normalized, so similar spellings and shared words give similar vectors."""
+
+    def __init__(self, dim: int = DEFAULT_DIM, ngram_min: int = DEFAULT_NGRAM_MIN, ngram_max: int = DEFAULT_NGRAM_MAX,
+                 batch_size: int = DEFAULT_BATCH_SIZE, threads: int = 0):
+        if dim < 1 or not 1 <= ngram_min <= ngram_max or batch_size < 1:
+            raise InvalidConfigEntry("local embeddings: dim, batch-size and 1 <= ngram-min <= ngram-max must be positive")
+        self.dim = dim
+        self.ngram_min = ngram_min
+        self.ngram_max = ngram_max
+        self.batch_size = batch_size
+        self.threads = threads if threads > 0 else (os.cpu_count() or 1)
+        # throughput of the last embed_documents call
+        self.last_count = 0
+        self.last_seconds = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Texts (chunks) embedded per second by the last embed_documents call"""
+        return self.last_count / self.last_seconds if self.last_seconds > 0 else 0.0
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embeddings of a batch of texts as a (len(texts), dim) matrix"""
+        # all texts in one byte array, separated (and padded) by a separator byte
+        encoded = [f" {text.lower()} ".encode("utf-8") for text in texts]
+        data = np.frombuffer(b"\0".join(encoded), dtype=np.uint8)
+        starts = np.cumsum([0] + [len(e) + 1 for e in encoded[:-1]])
+        rows, buckets, signs = [], [], []
+        for n in range(self.ngram_min, self.ngram_max + 1):
+            if len(data) < n:
+                continue
+            hashes = _ngram_hashes(data, n)
+            # n-grams spanning two texts contain the separator
+            valid = ~np.lib.stride_tricks.sliding_window_view(data == _SEPARATOR, n).any(axis=1)
+            positions = np.nonzero(valid)[0]
+            hashes = hashes[valid]
+            rows.append(np.searchsorted(starts, positions, side="right") - 1)
+            buckets.append((hashes % np.uint64(self.dim)).astype(np.int64))
+            signs.append(np.where((hashes >> np.uint64(40)) & np.uint64(1), 1.0, -1.0))
+        if not rows:
+            return np.zeros((len(texts), self.dim), dtype=np.float32)
+        matrix = np.bincount(np.concatenate(rows) * self.dim + np.concatenate(buckets), weights=np.concatenate(signs),
+                             minlength=len(texts) * self.dim).reshape(len(texts), self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.where(norms == 0, 1.0, norms)).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) > 1 and self.threads > 1:
+            with ThreadPoolExecutor(max_workers=min(self.threads, len(batches))) as executor:
+                matrices = list(executor.map(self.embed_batch, batches))
+        else:
+            matrices = [self.embed_batch(batch) for batch in batches]
+        embeddings = [row.tolist() for matrix in matrices for row in matrix]
+        self.last_count, self.last_seconds = len(texts), time.perf_counter() - start
+        return embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_batch([text])[0].tolist()
+
+
+def get_embeddings_factory(config: CorpusConfig) -> Any:
+    entries = config.get_embeddings_config()
+    return HashedNgramEmbeddings(dim=get_int_entry(entries, "dim", DEFAULT_DIM),
+                                 ngram_min=get_int_entry(entries, "ngram-min", DEFAULT_NGRAM_MIN),
+                                 ngram_max=get_int_entry(entries, "ngram-max", DEFAULT_NGRAM_MAX),
+                                 batch_size=get_int_entry(entries, "batch-size", DEFAULT_BATCH_SIZE),
+                                 threads=get_int_entry(entries, "threads", 0))
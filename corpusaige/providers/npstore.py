@@ -0,0 +1,607 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Built-in, dependency light vector store. Embeddings are kept (normalized) in a flat file which is
+# memory-mapped as a NumPy matrix, so opening the store costs next to nothing and all processes
+# using the same corpus share the pages through the OS page cache. Chunk texts and metadata are
+# kept in a SQLite table. Queries are answered with an exact (vectorized) cosine search or, for
+# large corpora, through an optional IVF (inverted file) index.
+#
+# To shrink large stores the embeddings can be quantized: float16 halves the matrix, int8 quarters
+# it (each vector is scaled by its largest component, the scale kept in a small float32 side file).
+# Optionally a full precision copy is kept on disk; it is only read to rescore the best candidates
+# of the quantized search, which restores the ranking of the full precision store.
+
+import json
+import shutil
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain.vectorstores.base import VectorStore
+
+from corpusaige.config.read import ConfigEntries, CorpusConfig, get_int_entry
+from corpusaige.exceptions import InvalidConfigEntry
+from corpusaige.providers import embeddings_factory
+
+_name = "npstore"
+
+_exported_items = ["get_vectordb_factory", "local_vectordb_creator_factory", "drop_vectordb_shard"]
+
+VECTORS_FILE = "vectors.bin"
+SCALES_FILE = "scales.bin"
+FULL_VECTORS_FILE = "vectors-full.bin"
+META_FILE = "meta.sqlite"
+IVF_CENTROIDS_FILE = "ivf-centroids.npy"
+IVF_ASSIGN_FILE = "ivf-assign.bin"
+
+DTYPES = ("float32", "float16", "int8")
+INDEX_TYPES = ("flat", "ivf")
+# Rows scored per matrix product, bounding the memory used by a full scan
+BLOCK_ROWS = 65536
+# Rows of a quantized block converted to float32 at a time; small enough to stay in the CPU cache
+CONVERT_ROWS = 512
+# Below this number of rows an IVF index is not worth its loss of recall
+IVF_MIN_ROWS = 10000
+DEFAULT_NPROBE = 8
+
+_SQL_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, document TEXT, metadata TEXT);
+CREATE TABLE IF NOT EXISTS dead (row INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def _where_clause(where: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+    """Translate a Chroma style metadata filter (e.g. {'doc-set': 'api'} or
+    {'$or': [{'doc-set': 'a'}, {'doc-set': 'b'}]}) into SQL on the JSON metadata column"""
+    if not where:
+        return "1", []
+    clauses: List[str] = []
+    params: List[Any] = []
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            parts = [_where_clause(sub) for sub in value]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(clause for clause, _ in parts) + ")")
+            for _, sub_params in parts:
+                params.extend(sub_params)
+            continue
+
+        op, operand = next(iter(value.items())) if isinstance(value, dict) else ("$eq", value)
+        field = "json_extract(metadata, ?)"
+        params.append(f'$."{key}"')
+        if op in ("$in", "$nin"):
+            placeholders = ", ".join("?" * len(operand))
+            clauses.append(f"{field} {'IN' if op == '$in' else 'NOT IN'} ({placeholders})")
+            params.extend(operand)
+        elif op in _SQL_OPERATORS:
+            clauses.append(f"{field} {_SQL_OPERATORS[op]} ?")
+            params.append(operand)
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+    return " AND ".join(clauses), params
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _quantize(vectors: np.ndarray, dtype: np.dtype) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """The (normalized) vectors in the stored data type and, for int8, the scale of each vector
+    (its largest absolute component / 127)"""
+    if dtype != np.int8:
+        return vectors.astype(dtype), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def _append_rows(path: Path, start: int, data: np.ndarray):
+    """Write data after the first start rows of the file at path"""
+    row_bytes = data.itemsize * int(np.prod(data.shape[1:]))
+    with open(path, "ab+") as f:
+        # drop rows of an interrupted write
+        f.truncate(start * row_bytes)
+        f.write(np.ascontiguousarray(data).tobytes())
+
+
+def _dot(block: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Similarities of the rows of a block with the query. Quantized rows are converted to float32
+    a few at a time, which is much faster than converting (and multiplying) the whole block."""
+    if block.dtype == np.float32:
+        return block @ query
+    sims = np.empty(len(block), dtype=np.float32)
+    buffer = np.empty((min(CONVERT_ROWS, len(block)), block.shape[1]), dtype=np.float32)
+    for start in range(0, len(block), CONVERT_ROWS):
+        rows = buffer[:len(block[start:start + CONVERT_ROWS])]
+        np.copyto(rows, block[start:start + CONVERT_ROWS], casting="unsafe")
+        np.dot(rows, query, out=sims[start:start + CONVERT_ROWS])
+    return sims
+
+
+def _top_k(matrix: np.ndarray, query: np.ndarray, k: int, rows: Optional[np.ndarray] = None,
+           excluded: Optional[np.ndarray] = None, scales: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact top-k of the cosine similarity between the (normalized) query and the matrix rows
+    (multiplied by their scales, if any), restricted to the given rows and skipping excluded rows.
+    Returns rows and similarities, best first."""
+    best_rows = np.empty(0, dtype=np.int64)
+    best_sims = np.empty(0, dtype=np.float32)
+    total = matrix.shape[0] if rows is None else len(rows)
+    for start in range(0, total, BLOCK_ROWS):
+        if rows is None:
+            block_rows = np.arange(start, min(start + BLOCK_ROWS, total))
+            block = matrix[start:start + BLOCK_ROWS]
+        else:
+            block_rows = rows[start:start + BLOCK_ROWS]
+            block = matrix[block_rows]
+        sims = _dot(block, query)
+        if scales is not None:
+            sims *= scales[block_rows]
+        if excluded is not None and len(excluded):
+            sims[np.isin(block_rows, excluded)] = -np.inf
+        if len(sims) > k:
+            part = np.argpartition(-sims, k)[:k]
+            block_rows, sims = block_rows[part], sims[part]
+        best_rows = np.concatenate([best_rows, block_rows])
+        best_sims = np.concatenate([best_sims, sims])
+        if len(best_sims) > k:
+            part = np.argpartition(-best_sims, k)[:k]
+            best_rows, best_sims = best_rows[part], best_sims[part]
+    order = np.argsort(-best_sims, kind="stable")
+    keep = np.isfinite(best_sims[order])
+    return best_rows[order][keep], best_sims[order][keep]
+
+
+def _kmeans(data: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means, returning normalized centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        empty = np.bincount(assign, minlength=nlist) == 0
+        sums[empty] = centroids[empty]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class NumpyCollection:
+    """Collection of chunks and their embeddings. It mirrors the part of the API of a chromadb
+    Collection used by Corpusaige (add/upsert, get, query, delete, count), with the same result
+    formats, so the VectorRepository can treat both stores alike."""
+
+    def __init__(self, path: Path, dtype: str = "float32", index: str = "flat", nlist: int = 0,
+                 nprobe: int = DEFAULT_NPROBE, rescore: int = 0):
+        self.path = path
+        self.name = path.name
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.index = index
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.rescore = rescore
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path / META_FILE, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        # the data type of an existing store takes precedence over the configured one
+        self.dtype = np.dtype(self._get_info("dtype") or dtype)
+        self.dim = int(self._get_info("dim") or 0)
+        # as is keeping a full precision copy of quantized embeddings
+        full_vectors = self._get_info("full-vectors")
+        self.full_vectors = full_vectors == "1" if full_vectors is not None else rescore > 0 and self.dtype != np.float32
+
+        self._state: Tuple[int, int] | None = None
+        self._matrix: np.ndarray = np.empty((0, self.dim), dtype=self.dtype)
+        self._scales: np.ndarray | None = None
+        self._full: np.ndarray | None = None
+        self._dead = np.empty(0, dtype=np.int64)
+        self._centroids: np.ndarray | None = None
+        self._assign = np.empty(0, dtype=np.int32)
+
+    def _get_info(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_info(self, key: str, value: Any):
+        self._db.execute("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _refresh(self):
+        """(Re)map the matrix when rows were added or removed, possibly by another process"""
+        rows = int(self._get_info("rows") or 0)
+        generation = int(self._get_info("generation") or 0)
+        if self._state == (rows, generation):
+            return
+        self.dim = int(self._get_info("dim") or 0)
+        self._scales = self._full = None
+        if rows and self.dim:
+            self._matrix = np.memmap(self.path / VECTORS_FILE, dtype=self.dtype, mode="r", shape=(rows, self.dim))
+            if self.dtype == np.int8:
+                self._scales = np.memmap(self.path / SCALES_FILE, dtype=np.float32, mode="r", shape=(rows,))
+            if self.full_vectors:
+                self._full = np.memmap(self.path / FULL_VECTORS_FILE, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        else:
+            self._matrix = np.empty((0, self.dim), dtype=self.dtype)
+        self._dead = np.array([r for (r,) in self._db.execute("SELECT row FROM dead")], dtype=np.int64)
+        self._load_ivf()
+        self._state = (rows, generation)
+
+    def _load_ivf(self):
+        self._centroids = None
+        self._assign = np.empty(0, dtype=np.int32)
+        if self.index == "ivf" and (self.path / IVF_CENTROIDS_FILE).exists():
+            self._centroids = np.load(self.path / IVF_CENTROIDS_FILE)
+            self._assign = np.fromfile(self.path / IVF_ASSIGN_FILE, dtype=np.int32)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunk").fetchone()[0]
+
+    def add(self, ids: List[str], embeddings: List[List[float]], metadatas: Optional[List[dict]] = None,
+            documents: Optional[List[str]] = None):
+        self.upsert(ids, embeddings, metadatas, documents)
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], metadatas: Optional[List[dict]] = None,
+               documents: Optional[List[str]] = None):
+        if not ids:
+            return
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        data, scales = _quantize(vectors, self.dtype)
+        metadatas = metadatas or [{} for _ in ids]
+        documents = documents or ["" for _ in ids]
+        with self._lock:
+            # BEGIN IMMEDIATE serializes writers, also those in other processes
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                dim = int(self._get_info("dim") or 0)
+                if dim and dim != vectors.shape[1]:
+                    raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {dim}")
+                start = int(self._get_info("rows") or 0)
+                self._delete_rows(self._rows_of(ids))
+
+                _append_rows(self.path / VECTORS_FILE, start, data)
+                if scales is not None:
+                    _append_rows(self.path / SCALES_FILE, start, scales)
+                if self.full_vectors:
+                    _append_rows(self.path / FULL_VECTORS_FILE, start, vectors)
+                self._db.executemany("INSERT INTO chunk (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                                     [(start + i, id, doc, json.dumps(meta or {}))
+                                      for i, (id, doc, meta) in enumerate(zip(ids, documents, metadatas))])
+                self._set_info("dim", vectors.shape[1])
+                self._set_info("dtype", self.dtype.name)
+                self._set_info("full-vectors", int(self.full_vectors))
+                self._set_info("rows", start + len(ids))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._refresh()
+            self._assign_to_index(start, vectors)
+
+    def _rows_of(self, ids: List[str]) -> List[int]:
+        placeholders = ", ".join("?" * len(ids))
+        return [r for (r,) in self._db.execute(f"SELECT row FROM chunk WHERE id IN ({placeholders})", ids)]
+
+    def _delete_rows(self, rows: List[int]):
+        if rows:
+            self._db.executemany("DELETE FROM chunk WHERE row = ?", [(r,) for r in rows])
+            self._db.executemany("INSERT OR IGNORE INTO dead (row) VALUES (?)", [(r,) for r in rows])
+            self._set_info("generation", int(self._get_info("generation") or 0) + 1)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            clause, params = _where_clause(where)
+            if ids is not None:
+                clause += f" AND id IN ({', '.join('?' * len(ids))})"
+                params.extend(ids)
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = [r for (r,) in self._db.execute(f"SELECT row FROM chunk WHERE {clause}", params)]
+                self._delete_rows(rows)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._refresh()
+            if len(self._dead) > BLOCK_ROWS and len(self._dead) * 2 > self._matrix.shape[0]:
+                self.compact()
+
+    def compact(self):
+        """Rewrite the matrix without the rows of deleted chunks"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._state = None
+                self._refresh()
+                alive = np.setdiff1d(np.arange(self._matrix.shape[0]), self._dead)
+                for name, array in self._files().items():
+                    with open(self.path / (name + ".tmp"), "wb") as f:
+                        for start in range(0, len(alive), BLOCK_ROWS):
+                            f.write(np.ascontiguousarray(array[alive[start:start + BLOCK_ROWS]]).tobytes())
+                # alive is sorted, so rows only move down into rows which are free already
+                self._db.executemany("UPDATE chunk SET row = ? WHERE row = ?",
+                                     [(new, int(old)) for new, old in enumerate(alive) if new != old])
+                self._db.execute("DELETE FROM dead")
+                self._set_info("rows", len(alive))
+                self._set_info("generation", int(self._get_info("generation") or 0) + 1)
+                for name in self._files():
+                    (self.path / (name + ".tmp")).replace(self.path / name)
+                if self._centroids is not None:
+                    assign = self._assign[alive[alive < len(self._assign)]]
+                    assign.tofile(self.path / IVF_ASSIGN_FILE)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._refresh()
+
+    def _files(self) -> Dict[str, np.ndarray]:
+        """The (mapped) files with a row per chunk"""
+        files = {VECTORS_FILE: self._matrix}
+        if self._scales is not None:
+            files[SCALES_FILE] = self._scales
+        if self._full is not None:
+            files[FULL_VECTORS_FILE] = self._full
+        return files
+
+    def _vectors(self, rows: Any) -> np.ndarray:
+        """The embeddings of the rows (an index array or slice) as float32"""
+        if self._full is not None:
+            return np.asarray(self._full[rows])
+        vectors = self._matrix[rows].astype(np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    def _records(self, rows: List[int]) -> Dict[int, Tuple[str, str, dict]]:
+        records = {}
+        for start in range(0, len(rows), 500):
+            batch = rows[start:start + 500]
+            placeholders = ", ".join("?" * len(batch))
+            for row, id, document, metadata in self._db.execute(
+                    f"SELECT row, id, document, metadata FROM chunk WHERE row IN ({placeholders})", batch):
+                records[row] = (id, document, json.loads(metadata))
+        return records
+
+    def _embeddings(self, rows: List[int]) -> List[List[float]]:
+        return self._vectors(np.asarray(rows, dtype=np.int64)).tolist() if rows else []
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None, where_document: Any = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = include if include is not None else ["metadatas", "documents"]
+        clause, params = _where_clause(where)
+        if ids is not None:
+            clause += f" AND id IN ({', '.join('?' * len(ids))})"
+            params.extend(ids)
+        sql = f"SELECT row, id, document, metadata FROM chunk WHERE {clause} ORDER BY row"
+        if limit is not None or offset is not None:
+            sql += f" LIMIT {int(limit if limit is not None else -1)} OFFSET {int(offset or 0)}"
+        with self._lock:
+            self._refresh()
+            records = self._db.execute(sql, params).fetchall()
+            return {
+                "ids": [id for _, id, _, _ in records],
+                "documents": [doc for _, _, doc, _ in records] if "documents" in include else None,
+                "metadatas": [json.loads(meta) for _, _, _, meta in records] if "metadatas" in include else None,
+                "embeddings": self._embeddings([row for row, _, _, _ in records]) if "embeddings" in include else None,
+            }
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              where_document: Any = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = include if include is not None else ["metadatas", "documents", "distances"]
+        results: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        with self._lock:
+            self._refresh()
+            rows = None
+            if where:
+                clause, params = _where_clause(where)
+                rows = np.array([r for (r,) in self._db.execute(f"SELECT row FROM chunk WHERE {clause} ORDER BY row", params)],
+                                dtype=np.int64)
+            rescore = self._full is not None and self.rescore > 0
+            candidates = n_results * self.rescore if rescore else n_results
+            for embedding in query_embeddings:
+                query = _normalize(np.asarray(embedding, dtype=np.float32))
+                if self._matrix.shape[0] == 0 or (rows is not None and len(rows) == 0):
+                    top_rows, sims = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+                elif rows is not None:
+                    top_rows, sims = _top_k(self._matrix, query, candidates, rows=rows, scales=self._scales)
+                else:
+                    top_rows, sims = _top_k(self._matrix, query, candidates, rows=self._probe(query),
+                                            excluded=self._dead, scales=self._scales)
+                if rescore and len(top_rows):
+                    top_rows, sims = self._rescore(top_rows, query, n_results)
+                records = self._records([int(r) for r in top_rows])
+                found = [(int(r), float(s)) for r, s in zip(top_rows, sims) if int(r) in records]
+                results["ids"].append([records[r][0] for r, _ in found])
+                results["documents"].append([records[r][1] for r, _ in found])
+                results["metadatas"].append([records[r][2] for r, _ in found])
+                results["distances"].append([1.0 - s for _, s in found])
+                results["embeddings"].append(self._embeddings([r for r, _ in found]))
+        return {key: (value if key == "ids" or key in include else None) for key, value in results.items()}
+
+    def _rescore(self, rows: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k of the candidate rows by their full precision similarity"""
+        sims = self._full[rows] @ query
+        order = np.argsort(-sims, kind="stable")[:k]
+        return rows[order], sims[order]
+
+    def _probe(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Candidate rows of the IVF lists closest to the query (None: scan all rows)"""
+        if self._centroids is None:
+            return None
+        probes = np.argsort(-(self._centroids @ query))[:self.nprobe]
+        assigned = np.flatnonzero(np.isin(self._assign, probes))
+        # rows added since the index was built and not yet assigned are always scanned
+        unassigned = np.arange(len(self._assign), self._matrix.shape[0])
+        return np.concatenate([assigned, unassigned])
+
+    def _assign_to_index(self, start: int, vectors: np.ndarray):
+        if self._centroids is not None and start == len(self._assign):
+            assign = np.argmax(vectors.astype(np.float32) @ self._centroids.T, axis=1).astype(np.int32)
+            with open(self.path / IVF_ASSIGN_FILE, "ab") as f:
+                f.write(assign.tobytes())
+            self._assign = np.concatenate([self._assign, assign])
+
+    def build_index(self, nlist: int = 0):
+        """Build the IVF index: cluster the embeddings and assign each row to its nearest centroid"""
+        with self._lock:
+            self._refresh()
+            rows = self._matrix.shape[0]
+            nlist = nlist or self.nlist or max(1, int(np.sqrt(rows)))
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(rows, min(rows, nlist * 64), replace=False))
+            centroids = _kmeans(self._vectors(sample), nlist)
+            assign = np.concatenate([
+                np.argmax(self._vectors(slice(start, start + BLOCK_ROWS)) @ centroids.T, axis=1)
+                for start in range(0, rows, BLOCK_ROWS)]).astype(np.int32)
+            np.save(self.path / IVF_CENTROIDS_FILE, centroids)
+            assign.tofile(self.path / IVF_ASSIGN_FILE)
+            self._set_info("ivf-rows", rows)
+            self._load_ivf()
+
+    def update_index(self):
+        """(Re)build the IVF index when configured and the store has outgrown the current one"""
+        if self.index != "ivf":
+            return
+        with self._lock:
+            self._refresh()
+            rows = self._matrix.shape[0]
+            built_rows = int(self._get_info("ivf-rows") or 0)
+            if rows >= IVF_MIN_ROWS and (self._centroids is None or rows > 2 * built_rows):
+                self.build_index()
+
+
+class NumpyVectorStore(VectorStore):
+    """Langchain vector store on top of a NumpyCollection; mirrors the (used part of) the API
+    of the langchain Chroma wrapper."""
+
+    def __init__(self, path: Path, embedding_function: Optional[Embeddings] = None, dtype: str = "float32",
+                 index: str = "flat", nlist: int = 0, nprobe: int = DEFAULT_NPROBE, rescore: int = 0):
+        self._embedding_function = embedding_function
+        self._collection = NumpyCollection(Path(path), dtype, index, nlist, nprobe, rescore)
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding_function
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in texts]
+        if self._embedding_function is None:
+            raise ValueError("NumpyVectorStore: an embedding function is needed to add texts")
+        embeddings = self._embedding_function.embed_documents(texts)
+        self._collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=texts)
+        return ids
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        result = self._collection.query(query_embeddings=[embedding], n_results=k, where=filter)
+        return [(Document(page_content=text, metadata=metadata), distance)
+                for text, metadata, distance in zip(result["documents"][0], result["metadatas"][0], result["distances"][0])]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        if self._embedding_function is None:
+            raise ValueError("NumpyVectorStore: an embedding function is needed to search texts")
+        return self.similarity_search_by_vector_with_score(self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                          **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # distances are cosine distances
+        return lambda distance: 1.0 - distance
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None, where_document: Any = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        return self._collection.get(ids=ids, where=where, limit=limit, offset=offset, include=include)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        self._collection.delete(ids=ids)
+
+    def persist(self) -> None:
+        """Data is written on every add; this only keeps the (optional) IVF index up to date"""
+        self._collection.update_index()
+
+    def close(self) -> None:
+        self._collection.close()
+
+    @classmethod
+    def from_texts(cls: Type["NumpyVectorStore"], texts: List[str], embedding: Embeddings,
+                   metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None,
+                   path: str | Path = "./npdb", **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(Path(path), embedding_function=embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+
+def _store_settings(config: CorpusConfig) -> Dict[str, Any]:
+    vbconfig: ConfigEntries = config.get_vector_db_config()
+    if not vbconfig.get("path"):
+        raise InvalidConfigEntry("npstore: path must be provided")
+    dtype = vbconfig.get("dtype", "float32")
+    if dtype not in DTYPES:
+        raise InvalidConfigEntry(f"npstore: dtype must be one of {', '.join(DTYPES)}")
+    index = vbconfig.get("index", "flat")
+    if index not in INDEX_TYPES:
+        raise InvalidConfigEntry(f"npstore: index must be one of {', '.join(INDEX_TYPES)}")
+    rescore = get_int_entry(vbconfig, "rescore", 0)
+    if rescore < 0:
+        raise InvalidConfigEntry("npstore: rescore must be 0 (off) or a positive number of candidates per result")
+    return {"path": config.resolve_path_to_config(vbconfig["path"]), "dtype": dtype, "index": index,
+            "nlist": get_int_entry(vbconfig, "nlist", 0), "nprobe": get_int_entry(vbconfig, "nprobe", DEFAULT_NPROBE),
+            "rescore": rescore}
+
+
+def get_vectordb_factory(config: CorpusConfig, shard: Optional[str] = None) -> Any:
+    settings = _store_settings(config)
+    if shard is not None:
+        # shards are kept in sub folders
+        settings["path"] = settings["path"] / shard
+    return NumpyVectorStore(embedding_function=embeddings_factory(config), **settings)
+
+
+def drop_vectordb_shard(config: CorpusConfig, shard: str) -> None:
+    shutil.rmtree(_store_settings(config)["path"] / shard, ignore_errors=True)
+
+
+def local_vectordb_creator_factory(config: CorpusConfig) -> Any:
+    """
+        Create local instance of particular vector database type
+    """
+
+    def _():
+        # creates the files of the store; they are opened again when the corpus is used
+        store = NumpyVectorStore(**_store_settings(config))
+        store.close()
+
+    return _
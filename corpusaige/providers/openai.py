@@ -12,26 +12,28 @@ import sys
 from typing import Any
 from corpusaige.config.read import ConfigEntries, CorpusConfig
 from corpusaige.registry import ServiceRegistry
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.chat_models import ChatOpenAI
 
 
 _name = "openai"
 
 _exported_items = ["get_llm_factory", "get_embeddings_factory"]
 
-def get_llm_factory(config: CorpusConfig) -> Any:
+def get_llm_factory(config: CorpusConfig, streaming: bool = False) -> Any:
    
+        from langchain.chat_models import ChatOpenAI
+
         llmconfig: ConfigEntries = config.get_llm_config()
         llm_model = llmconfig.get("llm-model", "")
         api_key = llmconfig.get("api-key", "")
 
         # type: ignore
-        return ChatOpenAI(model=llm_model, openai_api_key=api_key)
+        return ChatOpenAI(model=llm_model, openai_api_key=api_key, streaming=streaming)
    
 
 def get_embeddings_factory(config: CorpusConfig) -> Any:
    
+        from langchain.embeddings import OpenAIEmbeddings
+
         llmconfig: ConfigEntries = config.get_llm_config()
 
         embedding_model = llmconfig.get("embedding-model", "")
@@ -7,11 +7,13 @@ through deep exploration and understanding of comprehensive document sets and so
 @license: MIT
 """
 
+from concurrent.futures import Future
 import importlib
 from pathlib import Path
+import threading
 import types
 
-from typing import Any, List, Protocol, Type, Dict, Optional
+from typing import Any, Callable, Hashable, List, Protocol, Type, Dict, Optional
 from pathlib import Path
 
 class ServiceInfo:
@@ -28,6 +30,8 @@ class ServiceInfo:
 class ServiceRegistry(Protocol):
     """Service registry for providers and plugins."""
     _services: Dict[str, ServiceInfo] = {}
+    # providers imported on first use: name -> module path
+    _lazy_providers: Dict[str, str] = {}
     
     
     @classmethod
@@ -39,6 +43,12 @@ class ServiceRegistry(Protocol):
         else:
             raise ValueError(f"Module {module} has no _name attribute")
         
+    @classmethod
+    def register_lazy_provider(cls, name: str, module_path: str) -> None:
+        """Register a provider module by name; it is imported (and registered) when first used, 
+        so the dependencies of unused providers are never loaded."""
+        cls._lazy_providers[name] = module_path
+
     @classmethod
     def register_plugins(cls, paths: List[Path]) -> None:
         
@@ -66,6 +76,8 @@ class ServiceRegistry(Protocol):
     
     @classmethod
     def get_service_info(cls, plugin_name: str) -> ServiceInfo:
+        if plugin_name not in cls._services and plugin_name in cls._lazy_providers:
+            cls.register_provider(importlib.import_module(cls._lazy_providers[plugin_name]))
         return cls._services.get(plugin_name, None)
        
         
@@ -90,6 +102,88 @@ class ServiceRegistry(Protocol):
                 return getattr(info.instance, item_name, None)
 
         return None
-    
+
+
+class ClientEntry:
+    def __init__(self, on_close: Optional[Callable[[Any], None]] = None):
+        # the client, once created
+        self.ready: Future = Future()
+        self.on_close = on_close
+        self.refcount = 0
+
+    @property
+    def client(self) -> Any:
+        return self.ready.result()
+
+    def close(self) -> None:
+        if self.ready.done():
+            self._close(self.ready)
+        else:
+            # released while being created: closed by the creating thread once created
+            self.ready.add_done_callback(self._close)
+
+    def _close(self, ready: Future) -> None:
+        if self.on_close is not None and ready.exception() is None:
+            self.on_close(ready.result())
+
+
+class ClientRegistry(Protocol):
+    """Process-wide registry of open clients (vector stores, embeddings...). A client is created
+    by the first acquire of its key and shared by the following ones; it is closed when released
+    as many times as it was acquired (or by close_all). Clients are created outside the lock of the
+    registry: different clients are created in parallel, the acquires of a client being created
+    wait for it."""
+    _clients: Dict[Hashable, ClientEntry] = {}
+    _lock = threading.RLock()
+
+    @classmethod
+    def acquire(cls, key: Hashable, create: Callable[[], Any],
+                on_close: Optional[Callable[[Any], None]] = None) -> Any:
+        with cls._lock:
+            entry = cls._clients.get(key)
+            creating = entry is None
+            if creating:
+                entry = ClientEntry(on_close)
+                cls._clients[key] = entry
+            entry.refcount += 1
+        if creating:
+            try:
+                entry.ready.set_result(create())
+            except BaseException as e:
+                # forgotten, so the next acquire tries again
+                with cls._lock:
+                    if cls._clients.get(key) is entry:
+                        del cls._clients[key]
+                entry.ready.set_exception(e)
+                raise
+        return entry.client
+
+    @classmethod
+    def release(cls, key: Hashable) -> None:
+        with cls._lock:
+            entry = cls._clients.get(key)
+            if entry is None:
+                return
+            entry.refcount -= 1
+            if entry.refcount > 0:
+                return
+            del cls._clients[key]
+        # closing may take disk I/O: outside the lock, like close_all
+        entry.close()
+
+    @classmethod
+    def refcount(cls, key: Hashable) -> int:
+        with cls._lock:
+            entry = cls._clients.get(key)
+            return entry.refcount if entry is not None else 0
+
+    @classmethod
+    def close_all(cls) -> None:
+        with cls._lock:
+            entries = list(cls._clients.values())
+            cls._clients.clear()
+        for entry in entries:
+            entry.close()
+
 # Usage example
 
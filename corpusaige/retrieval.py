@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.callbacks.manager import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever, Document
+from pydantic import Field
+
+RRF_K = 60
+MMR_LAMBDA = 0.5
+MMR_FETCH_FACTOR = 4
+# number of candidates fetched when the context is limited by a token budget instead of a number of chunks
+BUDGET_FETCH_K = 50
+TOKEN_ENCODING = "cl100k_base"
+
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][\w.:]*$")
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fuse several rankings (lists of ids, best first) into one using reciprocal rank fusion"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def maximal_marginal_relevance(relevance: np.ndarray, embeddings: np.ndarray, k: int,
+                               lambda_mult: float = MMR_LAMBDA) -> List[int]:
+    """Select k candidates balancing relevance against similarity to the candidates already selected.
+    Relevance is scaled to the best score (keeping the ratios of e.g. fused rank scores), similarity 
+    is the cosine similarity of the candidate embeddings.
+    Returns the indices of the selected candidates in order of selection."""
+    n = len(relevance)
+    if n == 0:
+        return []
+    best_score = relevance.max()
+    relevance = relevance / best_score if best_score > 0 else np.ones(n)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.where(norms == 0, 1.0, norms)
+    similarity = normalized @ normalized.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    while len(selected) < min(k, n):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
+
+
+def _text_overlap(first: str, second: str, min_overlap: int) -> int:
+    """Length of the longest suffix of first which is a prefix of second (0 if shorter than min_overlap)"""
+    for size in range(min(len(first), len(second)), min_overlap - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+def _merge_pair(first: Document, second: Document, min_overlap: int) -> Optional[Document]:
+    """Merge two chunks of the same source into one passage if their spans overlap"""
+    if first.page_content in second.page_content:
+        return second
+    if second.page_content in first.page_content:
+        return first
+    start_first, start_second = first.metadata.get('start_index'), second.metadata.get('start_index')
+    if isinstance(start_first, int) and isinstance(start_second, int):
+        if start_second < start_first:
+            first, second, start_first, start_second = second, first, start_second, start_first
+        end_first = start_first + len(first.page_content)
+        if start_second > end_first:
+            return None
+        text = first.page_content + second.page_content[end_first - start_second:]
+        return Document(page_content=text, metadata=first.metadata)
+    for a, b in ((first, second), (second, first)):
+        size = _text_overlap(a.page_content, b.page_content, min_overlap)
+        if size:
+            return Document(page_content=a.page_content + b.page_content[size:], metadata=a.metadata)
+    return None
+
+
+def merge_overlapping_chunks(results: List[Tuple[Document, float]], min_overlap: int = 20) -> List[Tuple[Document, float]]:
+    """Compress the retrieved context: chunks of the same source whose spans overlap (see the 
+    chunk_overlap of the text splitter) are merged into one passage and exact duplicates are dropped.
+    A merged passage keeps the position and score of its best ranked chunk. Merging is transitive: 
+    a chunk bridging two passages joins them into one."""
+    merged: List[Tuple[Document, float]] = []
+    seen = set()
+    for chunk, score in results:
+        if chunk.page_content in seen:
+            continue
+        seen.add(chunk.page_content)
+        source = chunk.metadata.get('source')
+        combined, best, position = chunk, score, None
+        i = 0
+        while source is not None and i < len(merged):
+            passage, passage_score = merged[i]
+            joined = _merge_pair(passage, combined, min_overlap) if passage.metadata.get('source') == source else None
+            if joined is None:
+                i += 1
+                continue
+            del merged[i]
+            combined, best = joined, max(best, passage_score)
+            position = i if position is None else min(position, i)
+            # the passage grew: it may now overlap passages already checked
+            i = 0
+        merged.insert(len(merged) if position is None else position, (combined, best))
+    return merged
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """The tiktoken encoding, loaded once (None if tiktoken or its encoding file is not available)"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Number of tokens of the text; estimated as 4 characters per token without tokenizer"""
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def pack_token_budget(results: List[Tuple[Document, float]], budget: int) -> Tuple[List[Tuple[Document, float]], int]:
+    """Greedily select the best scored chunks which fit in the token budget. Returns the selected 
+    chunks (in order of score) and their total number of tokens."""
+    packed = []
+    used = 0
+    for chunk, score in sorted(results, key=lambda item: item[1], reverse=True):
+        tokens = count_tokens(chunk.page_content)
+        if used + tokens <= budget:
+            packed.append((chunk, score))
+            used += tokens
+    return packed, used
+
+
+def is_identifier_query(query: str) -> bool:
+    """Verifies if the query is a single code identifier or error code (e.g. 'get_config',
+    'VectorRepository', 'E1102', 'corpus.send_prompt') as opposed to a natural language question."""
+    query = query.strip()
+    if not _IDENTIFIER_RE.match(query):
+        return False
+    return (any(c in query for c in "_.:") or any(c.isdigit() for c in query)
+            or (not query.islower() and not query.isupper() and not query.istitle()))
+
+
+class CorpusRetriever(BaseRetriever):
+    """Retriever handing the queries of the conversation chain to the VectorRepository, so
+    prompts go through the same (hybrid) search pipeline as /search"""
+
+    repository: Any
+    search_kwargs: Dict[str, Any] = Field(default_factory=dict)
+
+    def _fetch_size(self) -> int:
+        k = self.search_kwargs.get('k', 4)
+        return max(k, BUDGET_FETCH_K) if self.search_kwargs.get('token_budget') else k
+
+    def _retrieve(self, query: str) -> List[Document]:
+        results = self.repository.retrieve(query, self._fetch_size(), self.search_kwargs.get('doc_sets'))
+        return self._assemble(results)
+
+    def _assemble(self, results: List[Tuple[Document, float]]) -> List[Document]:
+        token_budget = self.search_kwargs.get('token_budget')
+        if self.repository.merge_chunks:
+            results = merge_overlapping_chunks(results)
+        if token_budget:
+            results, _ = pack_token_budget(results, token_budget)
+        return [doc for doc, _ in results]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._retrieve(query)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        results = await self.repository.aretrieve(query, self._fetch_size(), self.search_kwargs.get('doc_sets'))
+        return self._assemble(results)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+import json
+import os
+import secrets
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from corpusaige.config import CORPUS_SERVER
+from corpusaige.config.read import CorpusConfig
+from corpusaige.documentset import DocumentSet
+from corpusaige.exceptions import InvalidConfigEntry, InvalidConfigSection, InvalidParameters, InvalidProviderConfig
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8642
+CLIENT_TIMEOUT = 600.0
+# header carrying the token of the server (see the discovery files)
+TOKEN_HEADER = 'X-Corpusaige-Token'
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+# errors caused by the request, answered with 400 (other errors are server errors, 500)
+INVALID_REQUEST_ERRORS = (InvalidParameters, InvalidConfigEntry, InvalidConfigSection, InvalidProviderConfig)
+
+
+class NotFound(Exception):
+    """Unknown path or corpus (answered with 404)"""
+
+
+class Forbidden(Exception):
+    """Request without the token of the server or from a web page of another site (answered with 403)"""
+
+
+class UnsupportedMediaType(Exception):
+    """Request body which is not JSON (answered with 415)"""
+
+
+class CorpusServer:
+    """Keeps one or more corpora loaded and serves them over HTTP with JSON. Requests are handled
+    concurrently (one thread per request): prompts are isolated from each other (and stored in a
+    conversation of their own) unless they ask to continue the conversation of the corpus, in
+    which case they are sent one at a time; adding and removing document sets are serialized per
+    corpus.
+
+    Every request carries the token of the server (a random secret written to the discovery files,
+    which only the user running the server can read) in the X-Corpusaige-Token header. Requests
+    from web pages of other sites (an Origin header of another host) and POST requests whose
+    Content-Type is not application/json are rejected, so web pages cannot use the server.
+
+    POST /prompt {"prompt", "corpus"?, "conversation"?: false} -> {"answer"}
+    POST /search {"query", "corpus"?, "results"?, "doc_sets"?} -> {"results"}
+    POST /ls     {"corpus"?, "all"?: false, "doc_set"?} -> {"entries"}
+    POST /add    {"name", "paths", "types", "corpus"?, "recursive"?: false} -> {}
+    POST /remove {"name", "corpus"?} -> {}
+    GET  /health -> {"corpora", "pid"}
+    GET  /stats  -> {corpus: {stage: timings}}"""
+
+    def __init__(self, corpora: Dict[str, Any], host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        if not corpora:
+            raise InvalidParameters("The server needs at least one corpus")
+        self.corpora = corpora
+        self.token = secrets.token_urlsafe(32)
+        self._conversation_locks = {name: threading.Lock() for name in corpora}
+        self._write_locks = {name: threading.Lock() for name in corpora}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _check_access(self):
+                origin = self.headers.get('Origin')
+                if origin is not None and urllib.parse.urlsplit(origin).hostname not in LOCAL_HOSTS:
+                    raise Forbidden(f"requests from {origin} are not allowed")
+                if not secrets.compare_digest(self.headers.get(TOKEN_HEADER, ''), server.token):
+                    raise Forbidden("missing or invalid token")
+
+            def do_GET(self):
+                def handle():
+                    self._check_access()
+                    return server.handle_get(self.path)
+                self._respond(handle)
+
+            def do_POST(self):
+                def handle():
+                    self._check_access()
+                    if self.headers.get_content_type() != 'application/json':
+                        raise UnsupportedMediaType("The request must be application/json")
+                    length = int(self.headers.get('Content-Length', 0))
+                    try:
+                        payload = json.loads(self.rfile.read(length) or b'{}')
+                    except json.JSONDecodeError as e:
+                        raise InvalidParameters(f"Invalid JSON: {e}")
+                    if not isinstance(payload, dict):
+                        raise InvalidParameters("The request must be a JSON object")
+                    return server.handle_post(self.path, payload)
+                self._respond(handle)
+
+            def _respond(self, handle):
+                try:
+                    status, body = 200, handle()
+                except NotFound as e:
+                    status, body = 404, {'error': f"Not found: {e}"}
+                except Forbidden as e:
+                    status, body = 403, {'error': f"Forbidden: {e}"}
+                except UnsupportedMediaType as e:
+                    status, body = 415, {'error': str(e)}
+                except INVALID_REQUEST_ERRORS as e:
+                    status, body = 400, {'error': str(e)}
+                except Exception as e:
+                    status, body = 500, {'error': f"{type(e).__name__}: {e}"}
+                data = json.dumps(body).encode('utf-8')
+                if status != 200:
+                    # the body of a rejected request may not have been read
+                    self.close_connection = True
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _corpus_name(self, payload: Dict[str, Any]) -> str:
+        name = payload.get('corpus')
+        if name is None:
+            if len(self.corpora) > 1:
+                raise InvalidParameters(f"Specify the corpus: {', '.join(self.corpora)}")
+            return next(iter(self.corpora))
+        if name not in self.corpora:
+            raise NotFound(f"corpus {name}")
+        return name
+
+    def handle_get(self, path: str) -> Dict[str, Any]:
+        match path:
+            case '/health':
+                return {'corpora': list(self.corpora), 'pid': os.getpid()}
+            case '/stats':
+                return {name: corpus.tracer.stats() for name, corpus in self.corpora.items()}
+        raise NotFound(path)
+
+    def handle_post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        name = self._corpus_name(payload)
+        corpus = self.corpora[name]
+        match path:
+            case '/prompt':
+                prompt = _required(payload, 'prompt')
+                if payload.get('conversation', False):
+                    with self._conversation_locks[name]:
+                        return {'answer': corpus.send_prompt(prompt)}
+                # imported here: the command line imports this module for the client only
+                import asyncio
+                return {'answer': asyncio.run(corpus.asend_prompt(prompt, isolated=True))}
+            case '/search':
+                query = _required(payload, 'query')
+                with corpus.tracer.span('search'):
+                    results = corpus.repository.search(query, int(payload.get('results', corpus.context_size)),
+                                                       payload.get('doc_sets') or corpus.scope)
+                return {'results': results}
+            case '/ls':
+                return {'entries': corpus.ls_docs(bool(payload.get('all', False)), payload.get('doc_set', ''))}
+            case '/add':
+                docset = DocumentSet.initialize(_required(payload, 'name'), payload.get('paths', []),
+                                                payload.get('types', []), bool(payload.get('recursive', False)))
+                with self._write_locks[name]:
+                    corpus.add_docset(docset)
+                return {}
+            case '/remove':
+                with self._write_locks[name]:
+                    corpus.remove_docset(_required(payload, 'name'))
+                return {}
+        raise NotFound(path)
+
+    def serve_forever(self, discovery_paths: Optional[List[Path]] = None):
+        """Serve until interrupted. The address and token of the server are written to the discovery
+        files (see find_server) while it runs."""
+        discovery_paths = discovery_paths or []
+        info = json.dumps({'url': self.url, 'pid': os.getpid(), 'corpora': list(self.corpora), 'token': self.token})
+        for path in discovery_paths:
+            _write_private(path, info)
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            for path in discovery_paths:
+                path.unlink(missing_ok=True)
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+
+def _required(payload: Dict[str, Any], key: str) -> Any:
+    value = payload.get(key)
+    if not value:
+        raise InvalidParameters(f"Missing {key}")
+    return value
+
+
+def _write_private(path: Path, text: str):
+    """Write the file, readable (and writable) by the current user only"""
+    path.unlink(missing_ok=True)
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w', encoding='utf-8') as file:
+        file.write(text)
+
+
+def discovery_path(config: CorpusConfig) -> Path:
+    return config.get_config_dir() / CORPUS_SERVER
+
+
+class CorpusClient:
+    """Client of a CorpusServer, with the operations of a corpus the command line uses"""
+
+    def __init__(self, url: str, corpus: Optional[str] = None, timeout: float = CLIENT_TIMEOUT, token: str = ''):
+        self.url = url.rstrip('/')
+        self.corpus = corpus
+        self.timeout = timeout
+        self.token = token
+
+    def _request(self, path: str, payload: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None) -> Dict[str, Any]:
+        data = None
+        if payload is not None:
+            if self.corpus is not None:
+                payload = {'corpus': self.corpus, **payload}
+            data = json.dumps(payload).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=data,
+                                         headers={'Content-Type': 'application/json', TOKEN_HEADER: self.token})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error', e.reason)
+            except (json.JSONDecodeError, AttributeError):
+                message = e.reason
+            raise InvalidParameters(f"Server error: {message}") from e
+
+    def health(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        return self._request('/health', timeout=timeout)
+
+    def send_prompt(self, prompt: str, conversation: bool = False) -> str:
+        return self._request('/prompt', {'prompt': prompt, 'conversation': conversation})['answer']
+
+    def store_search(self, search_str: str, doc_sets: Optional[List[str]] = None,
+                     results_num: Optional[int] = None) -> List[str]:
+        payload: Dict[str, Any] = {'query': search_str, 'doc_sets': doc_sets}
+        if results_num is not None:
+            payload['results'] = results_num
+        return self._request('/search', payload)['results']
+
+    def ls_docs(self, all_docs: bool = False, doc_set: str = '') -> List[str]:
+        return self._request('/ls', {'all': all_docs, 'doc_set': doc_set})['entries']
+
+    def add_docset(self, name: str, doc_paths: List[Path | str], doc_types: List[str], recursive: bool) -> None:
+        self._request('/add', {'name': name, 'paths': [str(Path(path).absolute()) for path in doc_paths],
+                               'types': doc_types, 'recursive': recursive})
+
+    def remove_docset(self, docset_name: str) -> None:
+        self._request('/remove', {'name': docset_name})
+
+
+def find_server(config: CorpusConfig) -> Optional[CorpusClient]:
+    """Client of the server running for the corpus, if any (a stale discovery file is ignored)"""
+    path = discovery_path(config)
+    try:
+        info = json.loads(path.read_text(encoding='utf-8'))
+        client = CorpusClient(info['url'], config.name, token=info['token'])
+        if config.name in client.health(timeout=1.0)['corpora']:
+            return client
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Sharded vector store: every document set (or configured group of document sets) is kept in a
+# collection of its own, a shard, of the configured vector store. Queries restricted to document
+# sets only search their shards; other queries search all shards in parallel and merge the results
+# by distance. Removing a document set with a shard of its own drops the shard. Which document set
+# lives in which shard is recorded in a manifest next to corpus.ini, so changes to the configured
+# groups only apply to document sets added afterwards. The manifest is updated under a file lock,
+# as several processes may add or remove document sets at the same time.
+
+# Import necessary modules
+import hashlib
+import json
+import re
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain.vectorstores.base import VectorStore
+
+from corpusaige.config import CORPUS_SHARDS
+from corpusaige.config.read import CorpusConfig, get_int_entry
+from corpusaige.providers import acquire_vectorstore, drop_vectorstore_shard, embeddings_factory, release_vectorstore
+
+DEFAULT_THREADS = 8
+# entries of the sharding section which are not groups of document sets
+_SETTINGS = ("enabled", "threads")
+
+
+def shard_name(name: str) -> str:
+    """Name of the shard of a document set or group, usable as collection (and folder) name:
+    3 to 63 alphanumeric characters or dashes"""
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")[:40]
+    digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+    return f"ds-{slug}-{digest}" if slug else f"ds-{digest}"
+
+
+def shard_groups(entries: Dict[str, str]) -> Dict[str, str]:
+    """Document sets sharing a shard, configured as <group> = <doc set>, <doc set>...: maps the
+    document sets to the name of their group"""
+    return {doc_set.strip(): group for group, doc_sets in entries.items() if group not in _SETTINGS
+            for doc_set in doc_sets.split(",") if doc_set.strip()}
+
+
+def filter_doc_sets(where: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """Document sets a filter (as made by storage.doc_set_filter) restricts a query to, None for
+    any other filter"""
+    if not where:
+        return None
+    if set(where) == {"doc-set"} and isinstance(where["doc-set"], str):
+        return [where["doc-set"]]
+    if set(where) == {"$or"}:
+        doc_sets = [filter_doc_sets(sub) for sub in where["$or"]]
+        if all(sub is not None and len(sub) == 1 for sub in doc_sets):
+            return [sub[0] for sub in doc_sets] # type: ignore
+    return None
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Exclusive lock of the (lock) file at path, held while the block runs; excludes other
+    processes as well as other threads taking the lock"""
+    with open(path, "a+b") as lock_file:
+        if sys.platform == "win32":
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ShardedCollection:
+    """Collection spanning the shards. It mirrors the part of the API of a chromadb Collection used
+    by Corpusaige (query, get, delete, count), like the NumpyCollection."""
+
+    def __init__(self, config: CorpusConfig):
+        self.config = config
+        entries = config.get_sharding_config()
+        self.groups = shard_groups(entries)
+        self.manifest_path = config.get_config_dir() / CORPUS_SHARDS
+        self._manifest: Dict[str, str] = {}
+        self._manifest_mtime = -1.0
+        self._stores: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, get_int_entry(entries, "threads", DEFAULT_THREADS)),
+                                            thread_name_prefix="shard")
+
+    # manifest: doc set -> shard, shared by all processes using the corpus
+    def _load_manifest(self, force: bool = False) -> Dict[str, str]:
+        mtime = self.manifest_path.stat().st_mtime if self.manifest_path.exists() else 0.0
+        if force or mtime != self._manifest_mtime:
+            self._manifest = json.loads(self.manifest_path.read_text(encoding="utf-8")) if mtime else {}
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def _save_manifest(self, manifest: Dict[str, str]):
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+        tmp_path.replace(self.manifest_path)
+        self._manifest = manifest
+        self._manifest_mtime = self.manifest_path.stat().st_mtime
+
+    @contextmanager
+    def _updating_manifest(self) -> Iterator[Dict[str, str]]:
+        """The current manifest, to be changed in place; saved (if changed) when the block ends"""
+        with self._lock, file_lock(self.manifest_path.with_suffix(".lock")):
+            manifest = dict(self._load_manifest(force=True))
+            yield manifest
+            if manifest != self._manifest:
+                self._save_manifest(manifest)
+
+    @property
+    def doc_sets(self) -> Dict[str, str]:
+        """The document sets in the store and their shards"""
+        with self._lock:
+            return dict(self._load_manifest())
+
+    def shard_of(self, doc_set: str, create: bool = False) -> Optional[str]:
+        with self._lock:
+            if doc_set in self._load_manifest() or not create:
+                return self._manifest.get(doc_set)
+            with self._updating_manifest() as manifest:
+                manifest.setdefault(doc_set, shard_name(self.groups.get(doc_set, doc_set)))
+            return manifest[doc_set]
+
+    def shards(self, doc_sets: Optional[List[str]] = None) -> List[str]:
+        """Shards holding the document sets (all shards if None)"""
+        manifest = self.doc_sets
+        names = manifest.values() if doc_sets is None else (manifest[d] for d in doc_sets if d in manifest)
+        return list(dict.fromkeys(names))
+
+    def store(self, shard: str) -> Any:
+        """The vector store of a shard, acquired on first use"""
+        with self._lock:
+            if shard not in self._stores:
+                self._stores[shard] = acquire_vectorstore(self.config, shard)
+            return self._stores[shard]
+
+    def map(self, operation: Callable[[Any], Any], shards: List[str]) -> List[Any]:
+        """Results of the operation on the stores of the shards, run in parallel"""
+        stores = [self.store(shard) for shard in shards]
+        if len(stores) == 1:
+            return [operation(stores[0])]
+        return list(self._executor.map(operation, stores))
+
+    def count(self) -> int:
+        return sum(self.map(lambda store: store._collection.count(), self.shards()))
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              where_document: Any = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = include if include is not None else ["metadatas", "documents", "distances"]
+        shard_include = list(dict.fromkeys(include + ["distances"]))
+        results = self.map(lambda store: store._collection.query(query_embeddings=query_embeddings, n_results=n_results,
+                                                                 where=where, include=shard_include),
+                           self.shards(filter_doc_sets(where)))
+        merged: Dict[str, Any] = {key: [] if key == "ids" or key in include else None
+                                  for key in ("ids", "documents", "metadatas", "distances", "embeddings")}
+        for i in range(len(query_embeddings)):
+            # the best n_results of all shards, by distance
+            hits = sorted(((result["distances"][i][j], shard, j) for shard, result in enumerate(results)
+                           for j in range(len(result["ids"][i]))), key=lambda hit: hit[0])[:n_results]
+            for key, values in merged.items():
+                if values is not None:
+                    values.append([results[shard][key][i][j] for _, shard, j in hits])
+        return merged
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None, where_document: Any = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = include if include is not None else ["metadatas", "documents"]
+        shards = self.shards(None if ids is not None else filter_doc_sets(where))
+        # no shard needs to return more than the requested page
+        shard_limit = (offset or 0) + limit if limit is not None else None
+        pages = self.map(lambda store: store.get(ids=ids, where=where, limit=shard_limit, include=include), shards)
+        result: Dict[str, Any] = {key: [] if key == "ids" or key in include else None
+                                  for key in ("ids", "documents", "metadatas", "embeddings")}
+        for page in pages:
+            for key, values in result.items():
+                if values is not None:
+                    values.extend(page[key])
+        start = offset or 0
+        end = start + limit if limit is not None else None
+        return {key: values[start:end] if values is not None else None for key, values in result.items()}
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        doc_sets = filter_doc_sets(where)
+        if ids is not None or doc_sets is None:
+            self.map(lambda store: store._collection.delete(ids=ids, where=where), self.shards())
+            return
+        with self._updating_manifest() as manifest:
+            for doc_set in doc_sets:
+                shard = manifest.pop(doc_set, None)
+                if shard is None:
+                    continue
+                if shard in manifest.values():
+                    # the shard of a group: only delete the chunks of the document set
+                    self.store(shard)._collection.delete(where={"doc-set": doc_set})
+                else:
+                    self._drop(shard)
+
+    def _drop(self, shard: str):
+        if shard in self._stores:
+            del self._stores[shard]
+            release_vectorstore(self.config, shard)
+        drop_vectorstore_shard(self.config, shard)
+
+    def persist(self):
+        with self._lock:
+            stores = list(self._stores.values())
+        for store in stores:
+            if callable(getattr(store, "persist", None)):
+                store.persist()
+
+    def close(self):
+        with self._lock:
+            self._executor.shutdown(wait=False)
+            for shard in self._stores:
+                release_vectorstore(self.config, shard)
+            self._stores = {}
+
+
+class ShardedStore(VectorStore):
+    """Langchain vector store on top of a ShardedCollection: chunks are added to the shard of their
+    document set (metadata 'doc-set'). Mirrors the (used part of) the API of the langchain Chroma
+    wrapper, like the NumpyVectorStore."""
+
+    def __init__(self, config: CorpusConfig):
+        self._embedding_function = embeddings_factory(config)
+        self._collection = ShardedCollection(config)
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding_function
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        doc_sets = [(metadata or {}).get("doc-set", "") for metadata in metadatas]
+        shards = {doc_set: self._collection.shard_of(doc_set, create=True) for doc_set in dict.fromkeys(doc_sets)}
+        per_shard: Dict[str, List[int]] = {}
+        for i, doc_set in enumerate(doc_sets):
+            per_shard.setdefault(shards[doc_set], []).append(i) # type: ignore
+
+        def add(shard: str) -> List[str]:
+            indices = per_shard[shard]
+            return self._collection.store(shard).add_texts([texts[i] for i in indices], [metadatas[i] for i in indices],
+                                                          [ids[i] for i in indices], **kwargs)
+
+        return [id for added in self._collection._executor.map(add, per_shard) for id in added]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        result = self._collection.query(query_embeddings=[embedding], n_results=k, where=filter)
+        return [(Document(page_content=text, metadata=metadata or {}), distance)
+                for text, metadata, distance in zip(result["documents"][0], result["metadatas"][0], result["distances"][0])]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                          **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None, where_document: Any = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        return self._collection.get(ids=ids, where=where, limit=limit, offset=offset, include=include)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        self._collection.delete(ids=ids)
+
+    def persist(self) -> None:
+        self._collection.persist()
+
+    def close(self) -> None:
+        self._collection.close()
+
+    @classmethod
+    def from_texts(cls: Type["ShardedStore"], texts: List[str], embedding: Embeddings,
+                   metadatas: Optional[List[dict]] = None, **kwargs: Any) -> "ShardedStore":
+        raise NotImplementedError("A ShardedStore is created from the configuration of a corpus")
@@ -6,14 +6,24 @@ through deep exploration and understanding of comprehensive document sets and so
 @copyright: Copyright © 2023 Iwan van der Kleijn
 @license: MIT
 """
+import asyncio
 from pathlib import Path
-from typing import List, Protocol
-from corpusaige.config.read import CorpusConfig
+import time
+import uuid
+import numpy as np
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+from corpusaige.config import CORPUS_LEXICAL_INDEX
+from corpusaige.config.read import CorpusConfig, get_bool_entry, get_float_entry, get_int_entry
 from langchain.document_loaders import DirectoryLoader, TextLoader
+from langchain.schema import Document as Chunk
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from corpusaige.documentset import Document, DocumentSet, Entry, FileType
 from corpusaige.exceptions import InvalidParameters
-from corpusaige.providers import vectorstore_factory
+from corpusaige.lexical import LexicalIndex
+from corpusaige.providers import acquire_vectorstore, release_vectorstore
+from corpusaige.tracing import NO_TRACER, Tracer
+from corpusaige.retrieval import (MMR_FETCH_FACTOR, MMR_LAMBDA, RRF_K, CorpusRetriever, is_identifier_query,
+                                  maximal_marginal_relevance, reciprocal_rank_fusion)
 
 
 class Repository(Protocol):
@@ -23,18 +33,48 @@ class Repository(Protocol):
         ...
     def add_doc(self, doc: Document, docset_name: str = ""):
         ...
-    def search(self, search_str: str, results_num:int) -> List[str]:
+    def search(self, search_str: str, results_num:int, doc_sets: Optional[List[str]] = None) -> List[str]:
         ...
     def ls(self, all_docs: bool = False, doc_set:str = '') -> List[str]:
         ...
         
+def doc_set_filter(doc_sets: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+    """Metadata filter restricting a query to the given document sets (None: no restriction)"""
+    if not doc_sets:
+        return None
+    elif len(doc_sets) == 1:
+        return {'doc-set': doc_sets[0]}
+    else:
+        return {'$or': [{'doc-set': doc_set} for doc_set in doc_sets]}
+        
 class VectorRepository(Repository):
-    def __init__(self, config: CorpusConfig):
+    def __init__(self, config: CorpusConfig, tracer: Tracer = NO_TRACER):
         self.config = config
-        self.vectorstore = vectorstore_factory(config)
+        self.tracer = tracer
+        self.vectorstore = acquire_vectorstore(config)
+        self._closed = False
+        # number of chunks and seconds of the last add (embedding and storing)
+        self.last_ingest: Tuple[int, float] = (0, 0.0)
+        
+        retrieval_config = config.get_retrieval_config()
+        self.rrf_k = get_int_entry(retrieval_config, 'rrf-k', RRF_K)
+        self.mmr = get_bool_entry(retrieval_config, 'mmr', True)
+        self.mmr_lambda = get_float_entry(retrieval_config, 'mmr-lambda', MMR_LAMBDA)
+        self.mmr_fetch_factor = max(1, get_int_entry(retrieval_config, 'mmr-fetch-factor', MMR_FETCH_FACTOR))
+        self.merge_chunks = get_bool_entry(retrieval_config, 'merge-chunks', True)
+        if get_bool_entry(retrieval_config, 'hybrid', True):
+            self.lexical: LexicalIndex | None = LexicalIndex(config.get_config_dir() / CORPUS_LEXICAL_INDEX)
+        else:
+            self.lexical = None
     
     def as_retriever(self):
-        return self.vectorstore.as_retriever()
+        return CorpusRetriever(repository=self)
+
+    def close(self):
+        """Release the (shared) vector store; it is closed when no other user in this process holds it"""
+        if not self._closed:
+            self._closed = True
+            release_vectorstore(self.config)
     
     def get_glob(self, entry: Entry) -> str:
         if entry.recursive:
@@ -45,7 +85,7 @@ class VectorRepository(Repository):
     def add_doc(self, doc: Document, doc_set_name: str = ""):
         if doc.file_type == FileType.TEXT:
                 
-            text_splitter = RecursiveCharacterTextSplitter (chunk_size=1000, chunk_overlap=200)
+            text_splitter = RecursiveCharacterTextSplitter (chunk_size=1000, chunk_overlap=200, add_start_index=True)
             # Load text data from a file using TextLoader
             loader = TextLoader(str(doc.path))
             res = loader.load()
@@ -60,8 +100,7 @@ class VectorRepository(Repository):
         else:
             raise NotImplementedError(f'File type {doc.file_type} not supported yet.')
 
-        self.vectorstore.add_documents(chunks)
-        self.vectorstore.persist()
+        self._add_chunks(chunks)
     
     def add_docset(self, doc_set: DocumentSet):
        
@@ -69,7 +108,7 @@ class VectorRepository(Repository):
         for entry in doc_set.entries:
             if entry.file_type == FileType.TEXT:
                 
-                text_splitter = RecursiveCharacterTextSplitter (chunk_size=1000, chunk_overlap=200)
+                text_splitter = RecursiveCharacterTextSplitter (chunk_size=1000, chunk_overlap=200, add_start_index=True)
                 loader = DirectoryLoader(str(entry.path), self.get_glob(entry))
                 docs = loader.load()
                 for doc in docs:
@@ -81,21 +120,152 @@ class VectorRepository(Repository):
                     chunks.extend(text_splitter.split_documents(docs))
             else:
                 raise NotImplementedError(f'File type {entry.file_type} not supported yet.')
-        self.vectorstore.add_documents(chunks)
-        self.vectorstore.persist()
+        self._add_chunks(chunks)
+
+    def _add_chunks(self, chunks: List[Chunk]):
+        # obtain the lexical index before adding: an index built from the store must not include the new chunks
+        lexical = self._lexical_index() if self.lexical is not None else None
+        # ids are assigned here as the ids returned by Chroma.add_texts omit chunks with metadata
+        ids = [str(uuid.uuid4()) for _ in chunks]
+        start = time.perf_counter()
+        with self.tracer.span('ingest.add'):
+            self.vectorstore.add_documents(chunks, ids=ids)
+            self.vectorstore.persist()
+        self.last_ingest = (len(chunks), time.perf_counter() - start)
+        if lexical is not None:
+            lexical.add(ids, [chunk.page_content for chunk in chunks], [chunk.metadata.get('doc-set', '') for chunk in chunks])
+            lexical.save()
+
+    def _lexical_index(self) -> LexicalIndex:
+        """The lexical index, built from the contents of the vector store for corpora which predate it"""
+        assert self.lexical is not None
+        if len(self.lexical) == 0 and not self.lexical.exists():
+            result = self.vectorstore.get(include=['documents', 'metadatas'])
+            doc_sets = [(metadata or {}).get('doc-set', '') for metadata in result['metadatas']]
+            self.lexical.add(result['ids'], result['documents'], doc_sets)
+            self.lexical.save()
+        return self.lexical
 
     def remove_docset(self, docset_name: str):
         #verify that docset exists
-        if len(self.vectorstore.get(where={'doc-set': docset_name})['ids']) > 0:
+        if len(self.vectorstore.get(where={'doc-set': docset_name}, limit=1)['ids']) > 0:
             #cannot use vectorstore.delete(), have to resort to direct access to the collection
             self.vectorstore._collection.delete(where={'doc-set': docset_name})
+            if self.lexical is not None:
+                lexical = self._lexical_index()
+                lexical.remove_docset(docset_name)
+                lexical.save()
         else:
             raise InvalidParameters(f"Could not find document set '{docset_name}'")
+
+    def _query_vectors(self, embedding: List[float], k: int, doc_sets: Optional[List[str]] = None,
+                       with_embeddings: bool = False) -> List[Tuple[str, Chunk, float, Optional[List[float]]]]:
+        """Nearest chunks of the query embedding as (id, chunk, distance, chunk embedding)"""
+        include = ['documents', 'metadatas', 'distances'] + (['embeddings'] if with_embeddings else [])
+        result = self.vectorstore._collection.query(query_embeddings=[embedding], n_results=k,
+                                                    where=doc_set_filter(doc_sets), include=include)
+        embeddings = result['embeddings'][0] if with_embeddings else [None] * len(result['ids'][0])
+        return [(id, Chunk(page_content=text, metadata=metadata or {}), distance, chunk_embedding)
+                for id, text, metadata, distance, chunk_embedding in zip(result['ids'][0], result['documents'][0],
+                                                                         result['metadatas'][0], result['distances'][0],
+                                                                         embeddings)]
+
+    def _get_chunks(self, ids: List[str]) -> Dict[str, Chunk]:
+        if not ids:
+            return {}
+        result = self.vectorstore.get(ids=ids, include=['documents', 'metadatas'])
+        return {id: Chunk(page_content=text, metadata=metadata or {})
+                for id, text, metadata in zip(result['ids'], result['documents'], result['metadatas'])}
+
+    def _get_embeddings(self, ids: List[str]) -> Dict[str, List[float]]:
+        if not ids:
+            return {}
+        result = self.vectorstore.get(ids=ids, include=['embeddings'])
+        return dict(zip(result['ids'], result['embeddings']))
+
+    def retrieve(self, query: str, k: int, doc_sets: Optional[List[str]] = None, 
+                 query_embedding: Optional[List[float]] = None) -> List[Tuple[Chunk, float]]:
+        """Get the k most relevant chunks with their relevance score (higher is better), 
+        optionally restricted to the given document sets. With the lexical index enabled the 
+        vector and BM25 rankings are combined using reciprocal rank fusion. With MMR enabled 
+        more candidates are fetched and re-ranked for diversity. The embedding of the query 
+        is computed if not given."""
+        with self.tracer.span('retrieve'):
+            return self._retrieve(query, k, doc_sets, query_embedding)
+
+    def _retrieve(self, query: str, k: int, doc_sets: Optional[List[str]], 
+                  query_embedding: Optional[List[float]]) -> List[Tuple[Chunk, float]]:
+        span = self.tracer.span
+        fetch_k = k * self.mmr_fetch_factor if self.mmr else k
+        lexical_hits: List[Tuple[str, float]] = []
+        if self.lexical is not None:
+            if is_identifier_query(query):
+                with span('retrieve.lexical'):
+                    exact_hits = self._lexical_index().search(query, k, doc_sets, whole_words=True)
+                if exact_hits:
+                    # exact identifiers are resolved by the lexical index alone, without an embedding call
+                    with span('retrieve.fetch'):
+                        chunks = self._get_chunks([id for id, _ in exact_hits])
+                    return [(chunks[id], score) for id, score in exact_hits if id in chunks]
+            with span('retrieve.lexical'):
+                lexical_hits = self._lexical_index().search(query, fetch_k, doc_sets)
+        
+        if query_embedding is None:
+            with span('retrieve.embed'):
+                query_embedding = self.vectorstore.embeddings.embed_query(query)
+        with span('retrieve.vector'):
+            vector_hits = self._query_vectors(query_embedding, fetch_k, doc_sets, with_embeddings=self.mmr)
+        if self.lexical is None:
+            ranked = [(id, 1.0 / (1.0 + distance)) for id, _, distance, _ in vector_hits]
+        else:
+            ranked = reciprocal_rank_fusion([[id for id, _, _, _ in vector_hits], [id for id, _ in lexical_hits]], self.rrf_k)[:fetch_k]
+        
+        if self.mmr and len(ranked) > k:
+            with span('retrieve.rerank'):
+                embeddings = {id: embedding for id, _, _, embedding in vector_hits}
+                embeddings.update(self._get_embeddings([id for id, _ in ranked if id not in embeddings]))
+                ranked = [item for item in ranked if item[0] in embeddings]
+                selected = maximal_marginal_relevance(np.array([score for _, score in ranked]), 
+                                                      np.array([embeddings[id] for id, _ in ranked]), 
+                                                      k, self.mmr_lambda)
+                ranked = [ranked[i] for i in selected]
+        ranked = ranked[:k]
+        
+        chunks = {id: chunk for id, chunk, _, _ in vector_hits}
+        missing = [id for id, _ in ranked if id not in chunks]
+        if missing:
+            with span('retrieve.fetch'):
+                chunks.update(self._get_chunks(missing))
+        return [(chunks[id], score) for id, score in ranked if id in chunks]
         
-    def search(self, search_str: str, results_num: int) -> List[str]:
-        result = self.vectorstore.similarity_search(search_str, k=results_num)
+    async def _aembed_query(self, query: str) -> List[float]:
+        embeddings = self.vectorstore.embeddings
+        try:
+            return await embeddings.aembed_query(query)
+        except NotImplementedError:
+            return await asyncio.to_thread(embeddings.embed_query, query)
+
+    async def aretrieve(self, query: str, k: int, doc_sets: Optional[List[str]] = None) -> List[Tuple[Chunk, float]]:
+        """Asynchronous retrieve: the query is embedded with the asynchronous API of the embeddings
+        provider, the (local) index searches run in a worker thread"""
+        # identifier queries are usually answered without embedding (see retrieve)
+        query_embedding = None
+        if self.lexical is None or not is_identifier_query(query):
+            with self.tracer.span('retrieve.embed'):
+                query_embedding = await self._aembed_query(query)
+        return await asyncio.to_thread(self.retrieve, query, k, doc_sets, query_embedding)
+
+    def search(self, search_str: str, results_num: int, doc_sets: Optional[List[str]] = None) -> List[str]:
+        result = self.retrieve(search_str, results_num, doc_sets)
         #return [doc.page_content for doc in result]
-        return ["\n\n".join([doc.metadata['source'],doc.page_content]) for doc in result]
+        return self._format_results(result)
+
+    async def asearch(self, search_str: str, results_num: int, doc_sets: Optional[List[str]] = None) -> List[str]:
+        return self._format_results(await self.aretrieve(search_str, results_num, doc_sets))
+
+    @staticmethod
+    def _format_results(result: List[Tuple[Chunk, float]]) -> List[str]:
+        return ["\n\n".join([doc.metadata['source'],doc.page_content]) for doc, _ in result]
     
     def ls(self, all_docs: bool = False, doc_set:str = '') -> List[str]:
         result = None
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+import atexit
+import json
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from corpusaige.config import TRACING_SECTION
+from corpusaige.config.read import CorpusConfig, get_bool_entry, get_int_entry
+
+DEFAULT_BUFFER_SIZE = 2000
+# number of spans written to the export file at once
+EXPORT_BATCH_SIZE = 100
+
+
+class Span:
+    """Duration of one stage (e.g. 'retrieve.embed') of an operation"""
+    __slots__ = ('name', 'start', 'duration')
+
+    def __init__(self, name: str, start: float, duration: float):
+        self.name = name
+        self.start = start
+        self.duration = duration
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {'name': self.name, 'start': self.start, 'duration_ms': round(self.duration * 1000, 3)}
+
+    def __repr__(self):
+        return f"<Span(name={self.name!r}, duration={self.duration:.4f})>"
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Tracer:
+    """Collects the spans of the stages of prompts and searches in a ring buffer (the most recent
+    buffer_size spans) and optionally appends them as JSON lines to an export file. Exported spans
+    are written in batches, the last ones by flush() (called at exit)."""
+
+    def __init__(self, enabled: bool = True, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 export_path: Optional[Path] = None):
+        self.enabled = enabled
+        self.export_path = export_path
+        self._spans: Deque[Span] = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        # spans not yet exported; the export lock keeps the batches in order
+        self._unexported: List[Span] = []
+        self._export_lock = threading.Lock()
+        if export_path is not None:
+            atexit.register(self.flush)
+
+    @classmethod
+    def from_config(cls, config: CorpusConfig) -> 'Tracer':
+        entries = config.get_optional_section_config(TRACING_SECTION)
+        export = entries.get('export', '').strip()
+        return cls(enabled=get_bool_entry(entries, 'enabled', True),
+                   buffer_size=get_int_entry(entries, 'buffer-size', DEFAULT_BUFFER_SIZE),
+                   export_path=config.resolve_path_to_config(export) if export else None)
+
+    def span(self, name: str):
+        """Context manager measuring the duration of the enclosed stage"""
+        if not self.enabled:
+            return nullcontext()
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name: str) -> Iterator[None]:
+        start = time.time()
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(Span(name, start, time.perf_counter() - begin))
+
+    def record(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+            if self.export_path is None:
+                return
+            self._unexported.append(span)
+            full = len(self._unexported) >= EXPORT_BATCH_SIZE
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Append the spans not yet exported to the export file"""
+        with self._export_lock:
+            with self._lock:
+                spans, self._unexported = self._unexported, []
+            if spans and self.export_path is not None:
+                with open(self.export_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(span.as_dict()) + '\n' for span in spans))
+
+    @property
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per stage: the number of spans and their p50, p95 and maximum duration (in ms)"""
+        durations: Dict[str, List[float]] = {}
+        for span in self.spans:
+            durations.setdefault(span.name, []).append(span.duration * 1000)
+        stats = {}
+        for name in sorted(durations):
+            values = sorted(durations[name])
+            stats[name] = {'count': len(values), 'p50': percentile(values, 50), 'p95': percentile(values, 95),
+                           'max': values[-1]}
+        return stats
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        if not stats:
+            return "No timings recorded yet."
+        width = max(len(name) for name in stats)
+        lines = [f"{'stage':<{width}} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"]
+        for name, s in stats.items():
+            lines.append(f"{name:<{width}} {s['count']:>6} {s['p50']:>9.1f} {s['p95']:>9.1f} {s['max']:>9.1f}")
+        return "\n".join(lines)
+
+
+# Tracer of components used without a corpus (e.g. a VectorRepository on its own)
+NO_TRACER = Tracer(enabled=False)
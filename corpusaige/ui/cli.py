@@ -8,24 +8,17 @@ through deep exploration and understanding of comprehensive document sets and so
 """
 
 # Import necessary modules
+# Only light modules are imported here: the commands import what they need (langchain, the vector
+# stores, tkinter, the audio libraries...) when they run, so trivial commands start fast and
+# commands not using the Gui or audio work on machines without them.
 import argparse
 from pathlib import Path
 import sys
-import tkinter as tk
 import traceback
-from typing import List
-from corpusaige import providers
-from corpusaige.ui.audio.audio_utils import Locale
-from corpusaige.ui.audio.voice_conversation import VoiceConversation
+from typing import List, Optional
 from corpusaige.exceptions import InvalidParameters
-from corpusaige.providers import vectorstore_creator_factory
-from corpusaige.ui.console_tools import is_data_available
-from corpusaige.ui.gui import GuiApp
-from corpusaige.ui.shell import ShellApp
-from ..corpus import StatefullCorpus, create_corpus, ensure_dir_path_exists
-from .repl import PromptRepl
+from ..server import DEFAULT_HOST, DEFAULT_PORT, discovery_path, find_server
 from ..config.read import CorpusConfig, get_config
-from ..config.create import prompt_user_for_init
 from ..documentset import DocumentSet
 from ..app_meta_data import AppMetaData
 
@@ -33,12 +26,19 @@ from ..app_meta_data import AppMetaData
 DEBUG = True
 #DEBUG = False
 
+# use a running corpus server (crpsg serve) for prompt, add and remove when one is found
+USE_SERVER = True
+
 
 
 def new_corpus(name: str, path: str):
     """
     Creates a new corpus using a wizzard
     """
+    from corpusaige import providers
+    from ..config.create import prompt_user_for_init
+    from ..corpus import create_corpus, ensure_dir_path_exists
+
     corpus_path = (Path(path) / Path(name)).absolute()
     ensure_dir_path_exists(corpus_path)
     config_parser = prompt_user_for_init()
@@ -48,7 +48,7 @@ def new_corpus(name: str, path: str):
     #TODO although vectorstore_creator_factory is not generic, it is the only one
     #TODO and it does not disthinquish between local or remote stored
     providers.register_internal_factories()
-    dbcreator = vectorstore_creator_factory(config)
+    dbcreator = providers.vectorstore_creator_factory(config)
     dbcreator()
  
     print(f"\nCorpus {name} created successfully in {corpus_path}.")
@@ -59,32 +59,62 @@ def add_docset(config: CorpusConfig, name: str, doc_paths: List[Path | str], doc
     Adds files of the given type(s) and path/glob to the corpus.
     """
     # Implementation goes here
+    client = find_server(config) if USE_SERVER else None
+    if client is not None:
+        client.add_docset(name, doc_paths, doc_types, recursive)
+        return
+    from ..corpus import StatefullCorpus
+
     docset = DocumentSet.initialize(name, doc_paths, doc_types, recursive)
-    StatefullCorpus(config).add_docset(docset)
+    with StatefullCorpus(config) as corpus:
+        corpus.add_docset(docset)
+        chunks, seconds = corpus.repository.last_ingest
+        if seconds > 0:
+            print(f"Added {chunks} chunks in {seconds:.1f}s ({chunks / seconds:.1f} chunks/s)")
    
 
-def shell(config: CorpusConfig):
+def shell(config: CorpusConfig, other_configs: Optional[List[CorpusConfig]] = None):
     """
-    Displays the Corpusaige shell for the given corpus.
+    Displays the Corpusaige shell for the given corpus (or corpora).
     """
-    corpus = StatefullCorpus(config)
+    from ..corpus import StatefullCorpus
+    from ..multicorpus import MultiCorpus
+    from .repl import PromptRepl
+    from .shell import ShellApp
+
+    if other_configs:
+        corpus = MultiCorpus([config, *other_configs])
+    else:
+        corpus = StatefullCorpus(config)
 
-    prompt = PromptRepl(corpus)
-    ShellApp(prompt, DEBUG).run()
+    try:
+        prompt = PromptRepl(corpus)
+        ShellApp(prompt, DEBUG).run()
+    finally:
+        corpus.close()
     
 def gui(config: CorpusConfig):
     """
     Displays the Corpusaige gui for the given corpus.
     """
+    import tkinter as tk
+    from ..corpus import StatefullCorpus
+    from .gui import GuiApp
+    from .repl import PromptRepl
+
     root = tk.Tk()
-    corpus = StatefullCorpus(config)
-    prompt = PromptRepl(corpus)
-    GuiApp(root, prompt, True).run()
+    with StatefullCorpus(config) as corpus:
+        prompt = PromptRepl(corpus)
+        GuiApp(root, prompt, True).run()
     
 def voice(config: CorpusConfig, language: str):
     """
     Interact with Corpusaige through voice (audio).
     """
+    from ..corpus import StatefullCorpus
+    from .audio.audio_utils import Locale
+    from .audio.voice_conversation import VoiceConversation
+
     locale = Locale.from_locale(language)
     if locale is None:
         locale = Locale.from_language(language)
@@ -92,11 +122,11 @@ def voice(config: CorpusConfig, language: str):
     if locale is None:
         raise InvalidParameters(f"Unsupported language: {language}")
     
-    corpus = StatefullCorpus(config)
-    #TODO: integrate with Repl? 
+    with StatefullCorpus(config) as corpus:
+        #TODO: integrate with Repl? 
 
-    conv = VoiceConversation(corpus, locale)
-    conv.start()
+        conv = VoiceConversation(corpus, locale)
+        conv.start()
     
     
     
@@ -104,11 +134,17 @@ def remove(config: CorpusConfig, docset_name: str, force: bool):
     """
     Remove the doc_set with the given name.
     """
-    corpus = StatefullCorpus(config)
-    if force or input(f"Are you sure you want to remove {docset_name}? (y/n)").lower() == "y":
+    if not force and input(f"Are you sure you want to remove {docset_name}? (y/n)").lower() != "y":
+        print("Remove cancelled.")
+        return
+    client = find_server(config) if USE_SERVER else None
+    if client is not None:
+        client.remove_docset(docset_name)
+        return
+    from ..corpus import StatefullCorpus
+
+    with StatefullCorpus(config) as corpus:
         corpus.remove_docset(docset_name)
-    else:
-        print("Remove cancelled.")    
 
 def prompt(config: CorpusConfig, read: bool, line: str):
     """Send prompt (not repl command) to corpus/AI."""
@@ -121,16 +157,63 @@ def prompt(config: CorpusConfig, read: bool, line: str):
     elif not read and not line:
         raise InvalidParameters("Must use either --read or --line")
     
-    if read and is_data_available(0):
-            input_str = sys.stdin.read()
-    elif line:
-        input_str = line
+    if read:
+        # imported here: console_tools loads prompt_toolkit
+        from .console_tools import is_data_available
+        if not is_data_available(0):
+            raise InvalidParameters("No data available on stdin")
+        input_str = sys.stdin.read()
     else:
-        raise InvalidParameters("No data available on stdin")
+        input_str = line
         
-    corpus = StatefullCorpus(config)
-    print(f"Prompt: {input_str}")
-    print(f"Result: {corpus.send_prompt(input_str)}")
+    client = find_server(config) if USE_SERVER else None
+    if client is not None:
+        print(f"Prompt: {input_str}")
+        print(f"Result: {client.send_prompt(input_str)}")
+        return
+    from ..corpus import StatefullCorpus
+
+    with StatefullCorpus(config) as corpus:
+        print(f"Prompt: {input_str}")
+        print("Result: ", end='', flush=True)
+        for token in corpus.stream_prompt(input_str):
+            print(token, end='', flush=True)
+        print()
+
+def serve(configs: List[CorpusConfig], host: str, port: int):
+    """Keep the given corpora loaded and serve them over HTTP (JSON)."""
+    from ..corpus import StatefullCorpus
+    from ..server import CorpusServer
+
+    corpora = {}
+    for config in configs:
+        name = config.name
+        while name in corpora:
+            name = f"{name}'"
+        corpora[name] = StatefullCorpus(config)
+        # create the vector store, LLM etc. now rather than while answering the first request
+        timings = corpora[name].warmup()
+        print(f"Loaded {name} ({', '.join(f'{component}: {seconds:.2f}s' for component, seconds in timings.items())})")
+    server = CorpusServer(corpora, host, port)
+    print(f"Serving {', '.join(corpora)} at {server.url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever([discovery_path(config) for config in configs])
+    except KeyboardInterrupt:
+        print("Server stopped.")
+    finally:
+        for corpus in corpora.values():
+            corpus.close()
+
+def batch(config: CorpusConfig, batch_path: str, out_path: str | None, concurrency: int, resume: bool):
+    """Send the prompts of a JSONL file concurrently to corpus/AI."""
+    from ..batch import batch_prompt
+    from ..corpus import StatefullCorpus
+
+    with StatefullCorpus(config) as corpus:
+        counts = batch_prompt(corpus, batch_path, out_path, concurrency, resume)
+    print(f"Batch done: {counts['answered']} answered, {counts['failed']} failed", file=sys.stderr)
+    if counts['failed']:
+        print("Use --resume to retry the failed prompts", file=sys.stderr)
     
     
 def cli_run():
@@ -159,7 +242,9 @@ def cli_run():
     rm_parser.add_argument('-n', '--name', required=True, help='Name for document set')
     
     # Shell command
-    subparsers.add_parser('shell', help='Display the Corpusaige Shell (console)')
+    shell_parser = subparsers.add_parser('shell', help='Display the Corpusaige Shell (console)')
+    shell_parser.add_argument('-c', '--corpus', action='append', 
+                              help='Path to a corpus to search and chat with; repeat to use several corpora at once (default: --path)')
 
      # Gui command
     subparsers.add_parser('gui', help='Display the Corpusaige Gui')
@@ -172,13 +257,27 @@ def cli_run():
     prompt_parser = subparsers.add_parser('prompt', help='Send prompt (not repl command) to corpus/AI.')
     prompt_parser.add_argument('-r', '--read', action='store_true', help='Read from stdin')
     prompt_parser.add_argument('-l', '--line', help='Send a single git line')
+    prompt_parser.add_argument('-b', '--batch', help='Send the prompts of a JSONL file (one prompt or {"id", "prompt"} object per line)')
+    prompt_parser.add_argument('-c', '--concurrency', type=int, default=4, help='Number of prompts of a batch sent concurrently (default: 4)')
+    prompt_parser.add_argument('-o', '--out', help='JSONL file for the answers of a batch (default: stdout)')
+    prompt_parser.add_argument('--resume', action='store_true', help='Skip the prompts of a batch already answered in the --out file')
+
+    # Serve command
+    serve_parser = subparsers.add_parser('serve', help='Keep corpora loaded and serve them over HTTP (JSON)')
+    serve_parser.add_argument('-c', '--corpus', action='append', 
+                              help='Path to a corpus to serve; repeat to serve several corpora (default: --path)')
+    serve_parser.add_argument('--host', default=DEFAULT_HOST, help=f'Host (interface) to listen on (default: {DEFAULT_HOST})')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default: {DEFAULT_PORT})')
 
     # Global optional parameter
     parser.add_argument('-p', '--path', default='.', help='Path to corpus (default: current dir)')
     
+    parser.add_argument('--no-server', action='store_true', help='Do not use a running corpus server (crpsg serve)')
     parser.add_argument('-v', '--version', action='version', version=f'{app_meta_data.name} {app_meta_data.version}')
   
     args = parser.parse_args(sys.argv[1:])
+    global USE_SERVER
+    USE_SERVER = not args.no_server
 
     # Execute the command
     match args.command:
@@ -188,8 +287,12 @@ def cli_run():
             config = get_config(args.path)
             add_docset(config, args.name, args.doc_paths, args.doc_types, args.recursive)
         case 'shell':
-            config = get_config(args.path)
-            shell(config)
+            if args.corpus:
+                configs = [get_config(path) for path in args.corpus]
+                shell(configs[0], configs[1:])
+            else:
+                config = get_config(args.path)
+                shell(config)
         case 'gui':
             config = get_config(args.path)
             gui(config)
@@ -201,7 +304,14 @@ def cli_run():
             remove(config, args.name, args.force)
         case 'prompt':
             config = get_config(args.path)
-            prompt(config, args.read, args.line)
+            if args.batch:
+                if args.read or args.line:
+                    raise InvalidParameters("Cannot use --batch with --read or --line")
+                batch(config, args.batch, args.out, args.concurrency, args.resume)
+            else:
+                prompt(config, args.read, args.line)
+        case 'serve':
+            serve([get_config(path) for path in args.corpus or [args.path]], args.host, args.port)
         case _:
             # If no command is provided, print help message and exit
             parser.print_help()
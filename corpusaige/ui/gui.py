@@ -10,6 +10,8 @@ through deep exploration and understanding of comprehensive document sets and so
 # Import necessary modules
 
 from collections import deque
+import queue
+import threading
 import tkinter as tk
 from tkinter import scrolledtext, Menu, messagebox
 from tkinter import font
@@ -19,6 +21,9 @@ from corpusaige.ui.gui_tools import exec_task_with_progress
 from corpusaige.ui.repl import PromptRepl
 from tkinter import simpledialog
 
+# put on the output queue when a streamed answer is complete
+_STREAM_DONE = object()
+
 class GuiApp(Input, Output):
     root: tk.Tk
     repl: PromptRepl
@@ -34,6 +39,11 @@ class GuiApp(Input, Output):
         self.repl = repl 
         self.repl.set_input_output(self, self)
         
+        # Output of background (streaming) tasks; written to the widgets by the Tk thread. While an
+        # answer is streamed all output goes through the queue, so it appears in order.
+        self._output_queue: queue.Queue = queue.Queue()
+        self._streaming = False
+        
         # Colors
         self.dark_mode_colors = {
             'bg': '#2E3B4E',
@@ -91,6 +101,21 @@ class GuiApp(Input, Output):
         self.root.config(menu=menubar)
         
         self.setup_widgets()
+        self.root.after(50, self._poll_output)
+
+    def _poll_output(self):
+        while True:
+            try:
+                item = self._output_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STREAM_DONE:
+                self._streaming = False
+                self.send_button.config(state=tk.NORMAL)
+                self.input_box.insert(tk.END, self.repl.prepared_prompt)
+            else:
+                self.append_to_output(*item)
+        self.root.after(50, self._poll_output)
 
     def on_first_show(self, event):
         self.root.unbind('<Map>')
@@ -135,6 +160,9 @@ class GuiApp(Input, Output):
         self.input_box.bind('<Control-Down>', self.next_command)
 
     def send_message(self):
+        # Wait for the answer being streamed
+        if str(self.send_button['state']) == tk.DISABLED:
+            return
         # Retrieve input, clear the input box, and append to output
         user_input = self.input_box.get("1.0", tk.END).strip()
         
@@ -157,6 +185,10 @@ class GuiApp(Input, Output):
                 self.repl.handle_command(user_input)
                 #exec_task_with_progress(self.root, "Executing...", lambda: self.repl.handle_command(user_input))
             
+            elif self.repl.is_streaming:
+                # the streamed answer shows the progress, the Gui remains responsive
+                self.send_streaming(user_input)
+                return
             else:
                 
                 exec_task_with_progress(self.root,"Sending prompt...", lambda: self.repl.send_prompt(user_input))
@@ -167,6 +199,19 @@ class GuiApp(Input, Output):
         
         self.input_box.insert(tk.END, self.repl.prepared_prompt)
     
+    def send_streaming(self, user_input: str):
+        """Send the prompt from a background thread, printing the answer while it is generated"""
+        def task():
+            try:
+                self.repl.send_prompt(user_input)
+            finally:
+                # completed by the Tk thread (_poll_output), after the streamed answer
+                self._output_queue.put(_STREAM_DONE)
+        
+        self.send_button.config(state=tk.DISABLED)
+        self._streaming = True
+        threading.Thread(target=task, daemon=True).start()
+    
     def prev_command(self, event=None):
         """Navigate to the previous command in the history."""
         if self.command_history and self.command_index < len(self.command_history) - 1:
@@ -187,9 +232,9 @@ class GuiApp(Input, Output):
             self.input_box.delete("1.0", tk.END)
     
             
-    def append_to_output(self, message):
+    def append_to_output(self, message, end='\n'):
         self.output_box.config(state=tk.NORMAL)
-        self.output_box.insert(tk.END, message + '\n')
+        self.output_box.insert(tk.END, message + end)
         self.output_box.config(state=tk.DISABLED)
         self.output_box.see(tk.END)
 
@@ -227,7 +272,17 @@ the MIT License""")
         raise NotImplementedError("Paged printing not necessary (and therefore not implemented) in GUI")
         
     def print(self, text:str):
-        self.append_to_output(text)
+        self._write(text, '\n')
+    
+    def print_token(self, text:str):
+        self._write(text, '')
+    
+    def _write(self, text: str, end: str):
+        # Tk widgets may only be used from the Tk thread
+        if threading.current_thread() is threading.main_thread() and not self._streaming:
+            self.append_to_output(text, end)
+        else:
+            self._output_queue.put((text, end))
     
     def clear(self):
         """Clear the screen"""
@@ -8,6 +8,7 @@ through deep exploration and understanding of comprehensive document sets and so
 """
 
 # Import necessary modules
+import re
 import traceback
 
 from ast import literal_eval
@@ -32,6 +33,25 @@ def detailed_help(help_text):
     return decorator
 
 
+# conversations/interactions listed per page by /conversation
+PAGE_SIZE = 20
+
+_DOC_SET_NAME = r'(?:"[^"]*"|[^\s,]+)'
+_SEARCH_IN_RE = re.compile(rf'^--in\s+({_DOC_SET_NAME}(?:\s*,\s*{_DOC_SET_NAME})*)\s+(.*)$', re.DOTALL)
+
+def parse_doc_set_names(text: str) -> list:
+    """Parse a comma separated list of document set names (which may be double quoted)"""
+    return [name.strip().strip('"').strip() for name in text.split(',') if name.strip().strip('"').strip()]
+
+def parse_search_args(cmdtext: str):
+    """Split '--in <doc-set,...> <text>' into the document sets and the search text"""
+    match = _SEARCH_IN_RE.match(cmdtext.strip())
+    if match:
+        return parse_doc_set_names(match.group(1)), match.group(2)
+    elif cmdtext.strip().startswith('--in'):
+        raise InvalidParameters("Usage: /search --in <doc-set,...> <text>")
+    return None, cmdtext
+
 def is_valid_integer(s):
     try:
         int(s)
@@ -54,9 +74,13 @@ class PromptRepl:
         self.corpus = corpus
        
         self.trace_mode = False
+        # print the answers of the LLM while they are generated
+        self.streaming = True
         
         self.conversation_id: int | None = None
         self.interaction_id: int | None = None
+        # shows the next page of the last conversation listing (if there is one)
+        self._next_page = None
         
         self._prepared_prompt = ""
     
@@ -97,8 +121,14 @@ class PromptRepl:
 
     def send_prompt(self, message: str) -> None:
         try:
-            answer = self.corpus.send_prompt(message)
-            self.out.print(answer)    
+            if self.is_streaming:
+                self.corpus.send_prompt(message, on_token=self.out.print_token)
+                self.out.print("")
+            else:
+                answer = self.corpus.send_prompt(message)
+                self.out.print(answer)    
+            if self.corpus.context_budget:
+                self.out.print(f"[context: {self.corpus.last_context_tokens} of {self.corpus.context_budget} tokens]")
                 
         except Exception as e:
             if not self.trace_mode:
@@ -106,6 +136,11 @@ class PromptRepl:
             else:
                 self.out.print(f"Error sending chat:\n {traceback.format_exc()}")
 
+    @property
+    def is_streaming(self) -> bool:
+        """Answers are streamed unless disabled or printed page by page"""
+        return self.streaming and not self.out.paged_printing
+
     def handle_command(self, command: str):
         # Remove leading '/' and trim the command
         command = command[1:].strip()
@@ -160,6 +195,24 @@ class PromptRepl:
             self.corpus.context_size = int(num)
             self.out.print(f"Number of items in context set to {self.corpus.context_size}")
 
+    @detailed_help("""Usage: /contextbudget        - Show the token budget of the context
+       /contextbudget <num>  - Fill the context with the best results fitting in <num> tokens
+       /contextbudget off    - Use a fixed number of results again (see /contextsize)""")
+    def do_contextbudget(self, *args, cmdtext=None):
+        """Gets or sets the token budget of the db results sent to AI"""
+        num = cmdtext.strip()
+        if num.lower() in ('off', '0'):
+            self.corpus.context_budget = 0
+        elif num:
+            if not is_valid_integer(num) or int(num) < 0:
+                raise InvalidParameters("Usage: /contextbudget <num>|off")
+            self.corpus.context_budget = int(num)
+        
+        if self.corpus.context_budget:
+            self.out.print(f"Context token budget: {self.corpus.context_budget}")
+        else:
+            self.out.print(f"Context token budget: off (number of items in context: {self.corpus.context_size})")
+
     @detailed_help("""Usage: /ls          - List document sets in the corpus
        /ls [docset] - List documents in the document set            
        /ls    *     - List all documents in the corpus""")
@@ -183,13 +236,40 @@ class PromptRepl:
         self.print_results(list=results, seperator="\n")
 
 
-    @detailed_help("Usage: /search <text>")
+    @detailed_help("""Usage: /search <text>
+       /search --in <doc-set,...> <text> - Search only the given document sets
+       (names with spaces can be quoted: /search --in "Rust Book",api-specs <text>)""")
     def do_search(self, *args, cmdtext=None):
         """Search for text in the corpus (without sending to AI)"""
-        self.out.print(f"Searching for {cmdtext }...")
-        results = self.corpus.store_search(cmdtext)
+        doc_sets, search_str = parse_search_args(cmdtext)
+        if doc_sets:
+            self.out.print(f"Searching for {search_str} in {', '.join(doc_sets)}...")
+        else:
+            self.out.print(f"Searching for {search_str}...")
+        results = self.corpus.store_search(search_str, doc_sets)
         self.print_results(list=results)
 
+    @detailed_help("""Usage: /scope                 - Show the document sets prompts and searches are restricted to
+       /scope <doc-set,...>   - Restrict prompts and searches to the given document sets
+       /scope *               - Use the whole corpus again""")
+    def do_scope(self, *args, cmdtext=None):
+        """Gets or sets the document sets to restrict prompts and searches to"""
+        text = cmdtext.strip()
+        if text == '*':
+            self.corpus.scope = []
+        elif text:
+            doc_sets = parse_doc_set_names(text)
+            known = self.corpus.doc_set_names()
+            unknown = [name for name in doc_sets if name not in known]
+            if unknown:
+                self.out.print(f"Warning: unknown document set(s): {', '.join(unknown)}")
+            self.corpus.scope = doc_sets
+        
+        if self.corpus.scope:
+            self.out.print(f"Scope: {', '.join(self.corpus.scope)}")
+        else:
+            self.out.print("Scope: whole corpus")
+
     @detailed_help("""Usage: /add "name", "path", "filetype",<recursive - by default True>
        /add "name", ["path1", "path2"], ["filetype1", "filetype2"],<recursive>""")
     def do_add(self, *args, cmdtext=None):
@@ -204,9 +284,11 @@ class PromptRepl:
         self.corpus.add_docset(docset)
         self.out.print(f"Added document set {name} to the corpus.")
     
-    @detailed_help("""Usage: /conversation           - List all conversations
-       /conversation <id>      - List all interactions in a conversation
+    @detailed_help("""Usage: /conversation           - List the most recent conversations
+       /conversation <id>      - List the interactions in a conversation
+       /conversation more      - Show the next page of the last listing
        /conversation show <id> - Show interaction
+       /conversation search <terms> - Find the interactions best matching the terms (word* matches prefixes)
        /conversation load <id> - Load conversation answer into edit buffer ready for /store
        /conversation load      - Load last answer into edit buffer ready for /store""")
     @synonymcommand("history")
@@ -218,8 +300,12 @@ class PromptRepl:
                 self.show_conversations()
             case (id,) if is_valid_integer(id):
                 self.show_interactions(int(id))
+            case ('more',):
+                self.show_next_page()
             case ('show', id) if is_valid_integer(id):
                 self.show_interaction(int(id))
+            case ('search', *terms) if terms:
+                self.search_conversations(" ".join(terms))
             case ('load',):
                 self.load_prompt_for_store()
             case ('load', id) if is_valid_integer(id):
@@ -227,18 +313,49 @@ class PromptRepl:
             case _:
                 raise InvalidParameters("Invalid command or arguments")
     
-    def show_conversations(self):
-        convs = self.corpus.get_conversations()
+    def show_conversations(self, before=None):
+        convs = self.corpus.list_conversations(PAGE_SIZE, before)
+        if not convs and before is None:
+            self.out.print("No conversations.")
         for conv in convs:
-            self.out.print(f"{conv.id:>5} : {conv.title}")
+            self.out.print(f"{conv.id:>5} : ({conv.date_created:%Y-%m-%d}) {conv.title}")
+        self._set_next_page(convs, lambda: self.show_conversations(convs[-1].id))
+    
+    def show_next_page(self):
+        if self._next_page is None:
+            self.out.print("No more to show.")
+        else:
+            self._next_page()
+    
+    def _set_next_page(self, page, show_next_page):
+        # a full page may be followed by another one
+        if len(page) < PAGE_SIZE:
+            self._next_page = None
+        else:
+            self._next_page = show_next_page
+            self.out.print("Use /conversation more for the next page.")
+    
+    def search_conversations(self, terms: str):
+        matches = self.corpus.search_conversations(terms)
+        if not matches:
+            self.out.print("No matching interactions.")
+        for match in matches:
+            snippet = " ".join(match.snippet.split())
+            self.out.print(f"{match.interaction_id:>5} : ({match.conversation_id}, {match.date_question:%Y-%m-%d}) {snippet}")
     
     def show_interactions(self, id:int):
         if id < 0:
             raise InvalidParameters("Invalid conversation id")
         else:
-            conv = self.corpus.get_conversation(id)
-            for interact in conv.interactions:
-                self.out.print(f"{interact.id:>5} : {interact.human_question[:120]}")
+            self.show_interactions_page(id)
+    
+    def show_interactions_page(self, id: int, after=None):
+        interacts = self.corpus.list_interactions(id, PAGE_SIZE, after)
+        if not interacts and after is None:
+            self.out.print("No interactions.")
+        for interact in interacts:
+            self.out.print(f"{interact.id:>5} : {interact.question}")
+        self._set_next_page(interacts, lambda: self.show_interactions_page(id, interacts[-1].id))
     
     def show_interaction(self, id: int):
         if int(id) < 0:
@@ -349,6 +466,41 @@ Scripys can be added to the corpus by placing them in the scripts folder""")
             else:
                 self.out.print(f"Unknown command: {command}")
                 
+    @detailed_help("""Usage: /memory                 - Show the memory strategy of the conversation
+       /memory buffer          - Remember the whole conversation
+       /memory window [turns]  - Remember the last turns (question and answer)
+       /memory tokens [num]    - Remember the most recent messages fitting in num tokens
+       /memory summary [num]   - As tokens, preceded by a summary of the older messages""")
+    def do_memory(self, *args, cmdtext=None):
+        """Gets or sets the memory strategy of the conversation"""
+        match args:
+            case ():
+                pass
+            case (strategy,):
+                self.corpus.set_memory(strategy.lower())
+            case (strategy, size) if is_valid_integer(size) and int(size) > 0:
+                self.corpus.set_memory(strategy.lower(), int(size))
+            case _:
+                raise InvalidParameters("Usage: /memory [buffer|window|tokens|summary] [size]")
+        self.out.print(f"Memory: {self.corpus.memory_description}")
+
+    @detailed_help("""Usage: /stats        - Show the durations (p50, p95, max) of the stages of prompts and searches
+       /stats clear  - Forget the recorded durations""")
+    def do_stats(self, *args, cmdtext=None):
+        """Show timings of the stages of prompts and searches"""
+        if cmdtext.strip() == 'clear':
+            self.corpus.tracer.clear()
+            self.out.print("Timings cleared.")
+        elif not self.corpus.tracer.enabled:
+            self.out.print("Tracing is disabled (see section [tracing] in corpus.ini).")
+        else:
+            self.out.print(self.corpus.tracer.format_stats())
+
+    def do_stream(self, *args, cmdtext=None):
+        """Toggle streaming of the answers on or off."""
+        self.streaming = not self.streaming
+        self.out.print(f"Streaming: {'on' if self.streaming else 'off'}")
+
     def do_sources(self, *args, cmdtext=None):
         """Toggle between showing sources or not."""
         self.corpus.toggle_sources()
@@ -80,6 +80,9 @@ class ShellApp(Input, Output):
         else:
             print(text)
     
+    def print_token(self, text:str):
+        print(text, end='', flush=True)
+    
     def clear(self):
         """Clear the screen"""
         print("\033c")
@@ -105,6 +108,9 @@ class ShellApp(Input, Output):
                 if user_input.startswith('/'):
                     # No spinner here as it screws up the paged printing
                     self.repl.handle_command(user_input)
+                elif self.repl.is_streaming:
+                    # the streamed answer shows the progress 
+                    self.repl.send_prompt(user_input)
                 else:
                     
                     with spinner("Sending prompt..."):
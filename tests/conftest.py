@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Fixtures shared by the tests: a test corpus using the deterministic embeddings and LLM of
+# tests.helpers.
+
+# Import necessary modules
+
+import configparser
+
+import pytest
+from langchain.schema import Document as Chunk
+
+from corpusaige import interactions
+from corpusaige.corpus import StatefullCorpus, create_corpus
+from corpusaige.providers import npstore
+from tests.helpers import WordEmbeddings, WordsLLM, corpus_ini_str
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(npstore, 'embeddings_factory', lambda config: WordEmbeddings())
+    monkeypatch.setattr(interactions, 'llm_factory', lambda config, streaming=False: WordsLLM(streaming=streaming))
+    config_p = configparser.ConfigParser()
+    config_p.read_string(corpus_ini_str)
+    create_corpus(tmp_path, config_p)
+    corpus = StatefullCorpus(str(tmp_path))
+    corpus.repository._add_chunks([Chunk(page_content="Traits define shared behaviour in Rust.",
+                                         metadata={'doc-set': 'rust', 'source': 'traits.md', 'path': 'traits.md'})])
+    yield corpus
+    corpus.close()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Helpers shared by the tests: deterministic embeddings and LLM (no API keys or downloads) and
+# the configuration and chunks of a test corpus.
+
+# Import necessary modules
+
+import asyncio
+import re
+from typing import Any, List, Optional
+
+from langchain.embeddings.base import Embeddings
+from langchain.llms.base import LLM
+
+
+class WordEmbeddings(Embeddings):
+    """Deterministic embeddings: a bag of words hashed into 32 dimensions"""
+    def _embed(self, text):
+        vector = [0.0] * 32
+        for word in text.lower().split():
+            vector[sum(word.encode()) % 32] += 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+ANSWER = "Traits define shared behaviour."
+
+
+class WordsLLM(LLM):
+    """LLM answering with a fixed text, streamed word by word"""
+    answer: str = ANSWER
+    streaming: bool = False
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "words"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        self.calls += 1
+        if self.streaming and run_manager is not None:
+            for word in re.findall(r"\S+\s*", self.answer):
+                run_manager.on_llm_new_token(word)
+        return self.answer
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.streaming and run_manager is not None:
+            for word in re.findall(r"\S+\s*", self.answer):
+                await run_manager.on_llm_new_token(word)
+        return self.answer
+
+
+corpus_ini_str = """[main]
+name = Test Corpus
+llm = openai
+vector-db = npstore
+
+[openai]
+api-key = sk-f4k3key4t3sting
+llm-model = gpt-4
+embedding-model = text-embedding-ada-002
+
+[npstore]
+path = ./npdb
+
+"""
+
+chunks = [
+    ('api-specs', 'api.txt', 'The endpoint returns error E1102 when the corpus is locked.'),
+    ('api-specs', 'api.txt', 'Requests are retried three times with exponential backoff.'),
+    ('code', 'storage.py', 'def get_vectordb_factory(config): return the vector store of the corpus'),
+    ('code', 'corpus.py', 'The corpus retries a failed request before giving up.'),
+]
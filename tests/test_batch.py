@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import asyncio
+import json
+
+import pytest
+
+from corpusaige.batch import batch_prompt, completed_ids, read_batch
+from corpusaige.exceptions import InvalidParameters
+
+
+class DummyCorpus:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.running = 0
+        self.max_running = 0
+        self.prompts = []
+
+    async def asend_prompt(self, prompt, isolated=False, store=True):
+        assert isolated and not store
+        self.prompts.append(prompt)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if prompt in self.failing:
+            raise RuntimeError("rate limited")
+        return prompt.upper()
+
+
+@pytest.fixture
+def questions(tmp_path):
+    path = tmp_path / 'questions.jsonl'
+    lines = [json.dumps({'id': 'q1', 'prompt': 'what is a trait'}),
+             json.dumps('what is a lifetime'),
+             '',
+             json.dumps({'question': 'what is a crate'})]
+    path.write_text('\n'.join(lines) + '\n')
+    return path
+
+
+def test_read_batch(questions, tmp_path):
+    assert [(item.id, item.prompt) for item in read_batch(questions)] == [
+        ('q1', 'what is a trait'), ('2', 'what is a lifetime'), ('4', 'what is a crate')]
+    invalid = tmp_path / 'invalid.jsonl'
+    invalid.write_text('{"id": 1}\n')
+    with pytest.raises(InvalidParameters):
+        read_batch(invalid)
+
+
+def test_batch_and_resume(questions, tmp_path):
+    out = tmp_path / 'answers.jsonl'
+    corpus = DummyCorpus(failing=['what is a lifetime'])
+    assert batch_prompt(corpus, questions, out, concurrency=2) == {'answered': 2, 'failed': 1}
+    assert corpus.max_running == 2
+    results = {r['id']: r for r in map(json.loads, out.read_text().splitlines())}
+    assert results['q1']['answer'] == 'WHAT IS A TRAIT'
+    assert results['2']['error'] == 'rate limited'
+    assert completed_ids(out) == {'q1', '4'}
+
+    # only the failed prompt is sent again, its answer is appended
+    corpus = DummyCorpus()
+    assert batch_prompt(corpus, questions, out, resume=True) == {'answered': 1, 'failed': 0}
+    assert corpus.prompts == ['what is a lifetime']
+    assert completed_ids(out) == {'q1', '2', '4'}
+    with pytest.raises(InvalidParameters):
+        batch_prompt(corpus, questions, resume=True)
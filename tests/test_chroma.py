@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import configparser
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+
+import pytest
+from langchain.schema import Document as Chunk
+
+from corpusaige import providers
+from corpusaige.config.read import get_config
+from corpusaige.corpus import create_corpus
+from corpusaige.exceptions import InvalidConfigEntry
+from corpusaige.providers import chroma
+from corpusaige.providers.chroma import batches, http_client, parse_connection_string
+from corpusaige.storage import VectorRepository
+from tests.helpers import WordEmbeddings, chunks, corpus_ini_str
+
+
+def test_parse_connection_string():
+    assert parse_connection_string("http://chroma.local:8001") == ("chroma.local", 8001, False)
+    assert parse_connection_string("https://chroma.local") == ("chroma.local", 443, True)
+    assert parse_connection_string("localhost") == ("localhost", 8000, False)
+    with pytest.raises(InvalidConfigEntry):
+        parse_connection_string("ftp://chroma.local")
+
+
+def test_batches():
+    assert list(batches(list(range(5)), 2)) == [(0, 2), (2, 4), (4, 5)]
+    assert list(batches([], 2)) == []
+
+
+def test_pooled_client():
+    client = http_client("http://127.0.0.1:9", timeout=2.5, pool_size=4)
+    adapter = client._session.get_adapter("http://127.0.0.1:9/api/v1")
+    assert adapter._pool_maxsize == 4
+    start = time.perf_counter()
+    with pytest.raises(Exception):
+        client.heartbeat()
+    assert time.perf_counter() - start < 2.5
+
+
+def _heartbeat(url: str) -> bool:
+    try:
+        with urllib.request.urlopen(f"{url}/api/v1/heartbeat", timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+@pytest.fixture(scope="module")
+def chroma_server(tmp_path_factory):
+    """Url of a Chroma server: the one given by CHROMA_SERVER_URL, or one started locally"""
+    url = os.environ.get("CHROMA_SERVER_URL")
+    if url:
+        if not _heartbeat(url):
+            pytest.skip(f"Chroma server {url} not available")
+        yield url
+        return
+    if importlib.util.find_spec("uvicorn") is None:
+        pytest.skip("uvicorn is needed to start a Chroma server")
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ, IS_PERSISTENT="1", PERSIST_DIRECTORY=str(tmp_path_factory.mktemp("chroma-server")),
+               ANONYMIZED_TELEMETRY="False")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "chromadb.app:app", "--port", str(port),
+                               "--log-level", "warning"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 30
+        while not _heartbeat(url):
+            if server.poll() is not None or time.time() > deadline:
+                pytest.skip("Could not start a Chroma server")
+            time.sleep(0.2)
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+@pytest.fixture
+def server_config(chroma_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(chroma, "embeddings_factory", lambda config: WordEmbeddings())
+    config_p = configparser.ConfigParser()
+    config_p.read_string(corpus_ini_str)
+    config_p["main"]["vector-db"] = "chroma"
+    config_p["chroma"] = {"connection-string": chroma_server, "collection": f"test-{uuid.uuid4().hex[:8]}",
+                          "batch-size": "3", "timeout": "10", "pool-size": "4"}
+    create_corpus(tmp_path, config_p)
+    providers.register_internal_factories()
+    return get_config(tmp_path)
+
+
+def test_server_mode(server_config):
+    repository = VectorRepository(server_config)
+    repository._add_chunks([Chunk(page_content=text, metadata={"doc-set": doc_set, "source": source, "path": source})
+                            for doc_set, source, text in chunks * 2])
+    assert repository.vectorstore._collection.count() == 2 * len(chunks)
+    assert len(repository.vectorstore.get()["ids"]) == 2 * len(chunks)
+    assert sorted(repository.ls()) == ["api-specs", "code"]
+    assert repository.retrieve("get_vectordb_factory", 2)[0][0].metadata["source"] == "storage.py"
+
+    # another process (client) shares the index of the server
+    other = chroma._server_store(server_config, WordEmbeddings())
+    assert other._client is not repository.vectorstore._client
+    repository.remove_docset("code")
+    assert {metadata["doc-set"] for metadata in other.get(include=["metadatas"])["metadatas"]} == {"api-specs"}
+    repository.close()
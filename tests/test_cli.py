@@ -9,6 +9,7 @@ through deep exploration and understanding of comprehensive document sets and so
 
 # Import necessary modules
 import os
+import subprocess
 import pytest
 from unittest import mock
 import sys
@@ -43,5 +44,37 @@ def test_cli_run(mock_shell, mock_add_docset, mock_new_corpus, mock_get_config):
         cli_run()
 
 
+# import time budget of the command line (trivial commands must not load the heavy dependencies)
+IMPORT_BUDGET_MS = 200
+HEAVY_MODULES = ['langchain', 'chromadb', 'sqlalchemy', 'numpy', 'tkinter', 'sounddevice', 'prompt_toolkit']
+
+def test_cli_import_time():
+    check = f"import sys, corpusaige.ui.cli; print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', check], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+    cli_line = [line for line in result.stderr.splitlines() if line.rstrip().endswith('| corpusaige.ui.cli')][0]
+    cumulative_us = int(cli_line.split('|')[1])
+    assert cumulative_us / 1000 < IMPORT_BUDGET_MS
+
+
+def test_server_commands_stay_light():
+    # with a corpus server running, remove and prompt only use its client
+    check = f"""
+import sys
+from corpusaige.ui import cli
+class Client:
+    def remove_docset(self, name):
+        print('removed', name)
+    def send_prompt(self, prompt):
+        return 'answer'
+cli.find_server = lambda config: Client()
+cli.remove(None, 'notes', True)
+cli.prompt(None, False, 'What?')
+print([m for m in {HEAVY_MODULES!r} if m in sys.modules])
+"""
+    result = subprocess.run([sys.executable, '-c', check], capture_output=True, text=True, check=True)
+    assert result.stdout.splitlines() == ['removed notes', 'Prompt: What?', 'Result: answer', '[]']
+
+
 # if __name__ == "__main__":
 #     pytest.main()
\ No newline at end of file
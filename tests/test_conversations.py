@@ -10,13 +10,21 @@ through deep exploration and understanding of comprehensive document sets and so
 # Import necessary modules
 
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from corpusaige.data import annotations, conversations
 from corpusaige.data.conversations import Base, Conversation, Interaction
 from sqlalchemy import select
+from sqlalchemy.orm import Session
+from corpusaige.data.db import create_db, init_db
+from corpusaige.data.writer import StateWriter
+from corpusaige.tracing import Tracer
+import subprocess
+import sys
 import tempfile
+import time
 from pathlib import Path
+from corpusaige.exceptions import InvalidParameters
 
 def fill_database(session):
     # Add test data to the session
@@ -94,4 +102,137 @@ def test_add_annotation(session):
     annot = annotations.get_annotation_by_id(session, id)
     assert annot.title == 'Title of the Annotation'
     assert annot.text == 'This is the text of the annotation'
-    
\ No newline at end of file
+    
+
+
+def test_state_writer(tmp_path, capsys):
+    engine = create_db(tmp_path / 'state.db')
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+    tracer = Tracer()
+    writer = StateWriter(engine, tracer=tracer)
+    conversation_id = None
+    futures = []
+    for n in range(50):
+        futures.append(writer.submit(lambda session, n=n: conversations.add_interaction(session, conversation_id, f'Question {n}?', 'Answer')))
+    writer.flush()
+    assert [future.result()[1] for future in futures] == list(range(1, 51))
+    # the writes queued while a batch was committed are committed together
+    assert 1 <= len([span for span in tracer.spans if span.name == 'state.write']) < 50
+
+    # a failing write does not take the other writes of its batch down with it
+    def failing(session):
+        raise ValueError('no write')
+    writes = [writer.submit(lambda session: conversations.add_interaction(session, 1, 'Before?', 'Answer')),
+              writer.submit(failing),
+              writer.submit(lambda session: conversations.add_interaction(session, 1, 'After?', 'Answer'))]
+    writer.close()
+    assert isinstance(writes[1].exception(), ValueError)
+    assert "Failed to write to the state database: ValueError('no write')" in capsys.readouterr().err
+    assert writes[0].result()[0] == writes[2].result()[0] == 1
+    with Session(engine) as session:
+        questions = [i.human_question for i in conversations.get_conversation_by_id(session, 1).interactions]
+    assert questions[-2:] == ['Before?', 'After?']
+    with pytest.raises(RuntimeError):
+        writer.submit(failing)
+
+
+
+def test_state_writer_commits_at_exit(tmp_path):
+    # a process exiting without closing its writer still commits the pending writes
+    script = f"""
+import time
+from corpusaige.data import conversations
+from corpusaige.data.db import create_db
+from corpusaige.data.writer import StateWriter
+writer = StateWriter(create_db({str(tmp_path / 'state.db')!r}))
+for n in range(3):
+    writer.submit(lambda session, n=n: (time.sleep(0.1), conversations.add_interaction(session, 1 if n else None, 'Question?', 'Answer')))
+"""
+    subprocess.run([sys.executable, '-c', script], check=True, cwd=Path(__file__).parent.parent)
+    with Session(init_db(tmp_path / 'state.db')) as session:
+        assert len(conversations.get_conversation_by_id(session, 1).interactions) == 3
+
+def query_plans(engine, run):
+    """The query plans (EXPLAIN QUERY PLAN details) of the statements executed by run"""
+    statements = []
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        run()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    with engine.connect() as connection:
+        return [[row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+                for statement, parameters in statements]
+
+
+def test_search_interactions(tmp_path):
+    engine = create_db(tmp_path / 'state.db')
+    with Session(engine) as session:
+        conversation_id, _ = conversations.add_interaction(session, None, 'What is the retry policy?',
+                                                           'Requests are retried three times with exponential backoff.')
+        conversations.add_interaction(session, conversation_id, 'And the timeout?', 'Requests time out after 30 seconds; no retry then.')
+        # tens of thousands of other interactions
+        session.execute(Interaction.__table__.insert(), [{'conversation_id': conversation_id, 'human_question': f'Question {n} about traits',
+                                                          'ai_answer': f'Answer {n} about lifetimes'} for n in range(20000)])
+        session.commit()
+
+        matches = conversations.search_interactions(session, 'retry policy')
+        assert [match.interaction_id for match in matches] == [1]
+        # the full-text index is searched, the interactions looked up by id
+        (plan,) = query_plans(engine, lambda: conversations.search_interactions(session, 'retry policy'))
+        assert any('interaction_fts VIRTUAL TABLE INDEX' in step for step in plan)
+        assert any('SEARCH i USING INTEGER PRIMARY KEY' in step for step in plan)
+        assert '[retry]' in matches[0].snippet and matches[0].conversation_id == conversation_id
+        # words are stemmed (retried, retry); a match in the question weighs more than one in the answer
+        assert [match.interaction_id for match in conversations.search_interactions(session, 'retried')] == [1, 2]
+        assert len(conversations.search_interactions(session, 'trait*', limit=5)) == 5
+        # the index follows updates and deletes
+        session.execute(Interaction.__table__.update().where(Interaction.id == 1).values(human_question='What is the backoff?'))
+        session.execute(Interaction.__table__.delete().where(Interaction.id == 2))
+        session.commit()
+        assert conversations.search_interactions(session, 'policy') == []
+        assert conversations.search_interactions(session, 'NOT "OR') == []
+        with pytest.raises(InvalidParameters):
+            conversations.search_interactions(session, '"*"')
+
+
+def test_list_conversations(tmp_path):
+    engine = create_db(tmp_path / 'state.db')
+    with Session(engine) as session:
+        session.execute(Conversation.__table__.insert(), [{'title': f'Conversation {n}'} for n in range(1, 20001)])
+        session.execute(Interaction.__table__.insert(), [{'conversation_id': 20000 - n % 2, 'human_question': f'Question {n} ' + 'x' * 500,
+                                                          'ai_answer': 'Answer ' * 1000} for n in range(1, 20001)])
+        session.commit()
+
+        # most recent first, paged with the id of the last one
+        page = conversations.list_conversations(session, 3)
+        assert [(conv.id, conv.title) for conv in page] == [(20000, 'Conversation 20000'), (19999, 'Conversation 19999'),
+                                                            (19998, 'Conversation 19998')]
+        assert [conv.id for conv in conversations.list_conversations(session, 3, before=page[-1].id)] == [19997, 19996, 19995]
+        assert [conv.id for conv in conversations.list_conversations(session, 3, before=2)] == [1]
+
+        # in order, paged with the id of the last one, with the start of the question only
+        page = conversations.list_interactions(session, 19999, 2)
+        assert [(interact.id, interact.question) for interact in page] == [(1, 'Question 1 ' + 'x' * 109), (3, 'Question 3 ' + 'x' * 109)]
+        assert [interact.id for interact in conversations.list_interactions(session, 19999, 2, after=3)] == [5, 7]
+        assert [interact.question for interact in conversations.list_interactions(session, 20000, 1, width=10)] == ['Question 2']
+        assert conversations.list_interactions(session, 1) == []
+
+        # the pages are read through the indexes, without sorting
+        plans = query_plans(engine, lambda: (conversations.list_conversations(session, 3, before=19998),
+                                             conversations.list_interactions(session, 19999, 2, after=3)))
+        assert plans == [['SEARCH conversation USING INTEGER PRIMARY KEY (rowid<?)'],
+                         ['SEARCH interaction USING INDEX ix_interaction_conversation_id (conversation_id=? AND rowid>?)']]
+
+
+def test_search_index_of_older_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'state.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        fill_database(session)
+    engine.dispose()
+    with Session(init_db(tmp_path / 'state.db')) as session:
+        assert [match.interaction_id for match in conversations.search_interactions(session, 'HAL')] == [3]
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import json
+import time
+
+from benchmarks.run import compare, main
+from benchmarks.synthetic import create_synthetic_corpus, synthetic_chunks
+from corpusaige import providers
+from corpusaige.corpus import StatefullCorpus
+from corpusaige.providers.fake import FakeEmbeddings, FakeLLM, fake_answer
+
+
+def test_fake_llm():
+    llm = FakeLLM(latency=0.05)
+    start = time.perf_counter()
+    answer = llm("What is a trait?")
+    assert time.perf_counter() - start >= 0.05
+    assert answer == llm("What is a trait?") == fake_answer("What is a trait?")
+    assert answer != llm("What is a struct?")
+    assert FakeEmbeddings(latency=0.0, dim=64).embed_query("trait") == FakeEmbeddings(dim=64).embed_query("trait")
+
+
+def test_offline_corpus(tmp_path):
+    providers.register_internal_factories()
+    config = create_synthetic_corpus(tmp_path / 'corpus')
+    with StatefullCorpus(config) as corpus:
+        for batch in synthetic_chunks(50, doc_sets=2):
+            corpus.repository._add_chunks(batch)
+        assert sorted(corpus.ls_docs()) == ['set-0', 'set-1']
+        tokens = []
+        answer = corpus.send_prompt("What is the corpus index?", on_token=tokens.append)
+        assert answer and "".join(tokens) == answer
+        assert len(corpus.store_search("vector search")) > 0
+
+
+def test_benchmark_run(tmp_path):
+    results = tmp_path / 'results'
+    assert main(['--sizes', '200', '--queries', '5', '--prompts', '2', '--results', str(results)]) == 0
+    (run,) = results.glob('*.json')
+    metrics = json.loads(run.read_text())['sizes']['200']
+    assert metrics['ingest_chunks_per_s'] > 0 and metrics['search_p50_ms'] > 0
+
+    slower = {'sizes': {'200': dict(metrics, search_p50_ms=metrics['search_p50_ms'] * 2)}}
+    lines, regressions = compare({'sizes': {'200': metrics}}, slower)
+    assert regressions == 1 and any('REGRESSION' in line and 'search_p50_ms' in line for line in lines)
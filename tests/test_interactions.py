@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import asyncio
+import configparser
+import types
+
+from corpusaige import interactions, providers
+from corpusaige.interactions import refers_to_history
+from corpusaige.corpus import StatefullCorpus, create_corpus
+from corpusaige.providers import npstore
+from corpusaige.retrieval import count_tokens
+from corpusaige.registry import ClientRegistry, ServiceRegistry
+from tests.helpers import ANSWER, WordEmbeddings, WordsLLM, corpus_ini_str
+from langchain.schema import Document as Chunk
+
+def test_send_prompt_streams_tokens(corpus):
+    tokens = []
+    answer = corpus.send_prompt("What is a trait?", on_token=tokens.append)
+    assert answer == ANSWER
+    assert tokens == ["Traits ", "define ", "shared ", "behaviour."]
+    # the interaction is stored once the answer is complete
+    assert corpus.get_interaction(corpus.last_interaction_id).ai_answer == ANSWER
+
+
+def test_stream_prompt_with_sources(corpus):
+    corpus.toggle_sources()
+    streamed = "".join(corpus.stream_prompt("What is a trait?"))
+    assert streamed.startswith(ANSWER)
+    assert streamed.endswith("Sources: doc-set: rust, source: traits.md")
+
+
+def test_non_streaming_llm(corpus):
+    corpus.interaction.llm.streaming = False
+    tokens = []
+    assert corpus.send_prompt("What is a trait?", on_token=tokens.append) == ANSWER
+    assert tokens == [ANSWER]
+
+
+def test_async_api(corpus):
+    async def session():
+        tokens = []
+        answers = await asyncio.gather(*[corpus.asend_prompt(f"What is trait {n}?") for n in range(5)],
+                                       corpus.asend_prompt("What is a trait?", on_token=tokens.append))
+        results = await corpus.astore_search("traits")
+        doc_sets = await corpus.als_docs()
+        return answers, tokens, results, doc_sets
+
+    answers, tokens, results, doc_sets = asyncio.run(session())
+    assert answers == [ANSWER] * 6
+    assert "".join(tokens) == ANSWER
+    assert results == ["traits.md\n\nTraits define shared behaviour in Rust."]
+    assert doc_sets == ['rust']
+    assert len(corpus.get_conversation(corpus.last_conversation_id).interactions) == 6
+    assert len(corpus.interaction.memory.chat_memory.messages) == 12
+
+    asyncio.run(corpus.asend_prompt("What is a struct?", isolated=True))
+    assert len(corpus.interaction.memory.chat_memory.messages) == 12
+
+
+def test_context_tokens_per_prompt(corpus):
+    corpus.repository._add_chunks([Chunk(page_content="Goroutines are functions running concurrently with other functions.",
+                                         metadata={'doc-set': 'go', 'source': 'goroutines.md', 'path': 'goroutines.md'})])
+    interaction = corpus.interaction
+
+    async def session():
+        return await asyncio.gather(interaction.aprompt("What is a trait?", doc_sets=['rust']),
+                                    interaction.aprompt("What is a goroutine?", doc_sets=['go'], token_budget=100))
+
+    # concurrent prompts each report the tokens of their own context
+    (_, rust_tokens), (_, go_tokens) = asyncio.run(session())
+    assert rust_tokens == count_tokens("Traits define shared behaviour in Rust.")
+    assert go_tokens == count_tokens("Goroutines are functions running concurrently with other functions.")
+
+    # the settings of a prompt are not left on the shared retriever
+    assert interaction.prompt("What is a goroutine?", doc_sets=['go'])[1] == go_tokens
+    assert interaction.retriever.search_kwargs == {}
+    corpus.send_prompt("What is a trait?")
+    assert corpus.last_context_tokens == rust_tokens + go_tokens
+
+
+def test_refers_to_history():
+    assert refers_to_history("And in Rust?")
+    assert refers_to_history("Why?")
+    assert refers_to_history("Can you show an example of it?")
+    assert refers_to_history("What about the previous version of the API?")
+    assert not refers_to_history("How does the borrow checker work in Rust?")
+    assert not refers_to_history("Which error codes does the storage module raise?")
+
+
+def test_condense_only_when_needed(corpus, monkeypatch):
+    condense_llm = corpus.interaction.condense_llm
+    corpus.send_prompt("What is a trait?")
+    corpus.send_prompt("How does the borrow checker work in Rust?")
+    assert condense_llm.calls == 0
+    corpus.send_prompt("Can you show an example of it?")
+    assert condense_llm.calls == 1
+
+    # a question referring to the history is retrieved once, with its rephrasing
+    retrieved = []
+    retrieve = corpus.repository.retrieve
+    monkeypatch.setattr(corpus.repository, 'retrieve', lambda query, *args: retrieved.append(query) or retrieve(query, *args))
+    condense_llm.answer = "What is a struct in Rust?"
+    corpus.send_prompt("And structs?")
+    asyncio.run(corpus.asend_prompt("And structs?"))
+    assert retrieved == ["What is a struct in Rust?"] * 2
+    assert condense_llm.calls == 3
+
+    # a self-contained question rephrased anyway is retrieved once, as is, while it is rephrased
+    corpus.interaction.qa_chain.condense = 'always'
+    corpus.interaction.condense = 'always'
+    condense_llm.answer = "How does the borrow checker of the Rust compiler work?"
+    corpus.send_prompt("How does the borrow checker work in Rust?")
+    asyncio.run(corpus.asend_prompt("How does the borrow checker work in Rust?"))
+    assert retrieved[2:] == ["How does the borrow checker work in Rust?"] * 2
+    assert condense_llm.calls == 5
+
+
+def test_llm_factory_streaming():
+    def get_llm_factory(config):
+        return WordsLLM()
+    provider = types.ModuleType('words')
+    provider._name = 'words'
+    provider._exported_items = ['get_llm_factory']
+    provider.get_llm_factory = get_llm_factory
+    ServiceRegistry.register_provider(provider)
+    config = types.SimpleNamespace(llm='words')
+    # factories without a streaming parameter return a non-streaming LLM
+    assert not providers.supports_streaming(providers.llm_factory(config, streaming=True))
+
+    provider.get_llm_factory = lambda config, streaming=False: WordsLLM(streaming=streaming)
+    assert providers.supports_streaming(providers.llm_factory(config, streaming=True))
+    assert not providers.supports_streaming(providers.llm_factory(config))
+
+
+def test_components_created_on_first_use(tmp_path, monkeypatch):
+    created = []
+    monkeypatch.setattr(npstore, 'embeddings_factory', lambda config: WordEmbeddings())
+    monkeypatch.setattr(interactions, 'llm_factory',
+                        lambda config, streaming=False: created.append('llm') or WordsLLM(streaming=streaming))
+    config_p = configparser.ConfigParser()
+    config_p.read_string(corpus_ini_str)
+    create_corpus(tmp_path, config_p)
+    corpus = StatefullCorpus(str(tmp_path))
+    assert corpus.ls_docs() == []
+    assert created == []
+    assert set(corpus.warmup()) == {'plugins', 'state-db', 'state-writer', 'interaction'}
+    assert created and corpus.warmup() == {}
+    assert {'init.repository', 'init.interaction', 'init.state-db'} <= set(corpus.tracer.stats())
+
+
+def test_corpora_share_vector_store(corpus):
+    key = providers.vectorstore_key(corpus.config)
+    with StatefullCorpus(str(corpus.path.parent)) as other:
+        assert other.repository.vectorstore is corpus.repository.vectorstore
+        assert ClientRegistry.refcount(key) == 2
+    assert ClientRegistry.refcount(key) == 1
+    vectorstore = corpus.repository.vectorstore
+    corpus.close()
+    assert ClientRegistry.refcount(key) == 0
+    # a closed store is not reused
+    with StatefullCorpus(str(corpus.path.parent)) as reopened:
+        assert reopened.repository.vectorstore is not vectorstore
+        assert reopened.ls_docs() == ['rust']
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import numpy as np
+import pytest
+from corpusaige import lexical
+from corpusaige.lexical import LexicalIndex, tokenize
+from langchain.schema import Document as Chunk
+from corpusaige import retrieval
+from corpusaige.retrieval import (count_tokens, is_identifier_query, maximal_marginal_relevance, merge_overlapping_chunks,
+                                  pack_token_budget, reciprocal_rank_fusion)
+
+chunks = {
+    'c1': "def get_vectordb_factory(config: CorpusConfig) -> Any:",
+    'c2': "The VectorRepository stores the chunks of all document sets.",
+    'c3': "Error E1102: the corpus could not be opened.",
+    'c4': "Traits define shared behaviour in Rust.",
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(tmp_path / 'lexical-index.bm25')
+    index.add(list(chunks.keys()), list(chunks.values()), ['code', 'docs', 'docs', 'rust'])
+    return index
+
+
+def test_tokenize():
+    assert tokenize("get_vectordb_factory") == ['get_vectordb_factory', 'get', 'vectordb', 'factory']
+    assert tokenize("VectorRepository.search") == ['vectorrepository', 'vector', 'repository', 'search']
+    assert tokenize("Error E1102!") == ['error', 'e1102']
+
+
+def test_search(index):
+    assert index.search("get_vectordb_factory", 2)[0][0] == 'c1'
+    assert index.search("E1102", 2) == index.search("e1102", 2)
+    assert [id for id, _ in index.search("E1102", 2)] == ['c3']
+    assert index.search("repository", 4)[0][0] == 'c2'
+    assert index.search("nonexistent", 4) == []
+
+
+def test_search_whole_words(index):
+    index.add(['c5'], ["Get the factory of the vectordb first."], ['docs'])
+    # the parts of an identifier match (ranked lower), but not as a whole
+    assert [id for id, _ in index.search("get_vectordb_factory", 4)] == ['c1', 'c5']
+    assert [id for id, _ in index.search("get_vectordb_factory", 4, whole_words=True)] == ['c1']
+    assert [id for id, _ in index.search("VectorRepository.stores", 4, whole_words=True)] == ['c2']
+    assert index.search("VectorRepository.search", 4, whole_words=True) == []
+
+
+def test_search_doc_sets(index):
+    assert [id for id, _ in index.search("corpus", 4, doc_sets=['docs'])] == ['c3']
+    assert index.search("corpus", 4, doc_sets=['rust']) == []
+    assert index.search("corpus", 4, doc_sets=['unknown']) == []
+
+
+def test_save_and_load(index, tmp_path):
+    index.save()
+    loaded = LexicalIndex(tmp_path / 'lexical-index.bm25')
+    assert len(loaded) == 4
+    for query in ["get_vectordb_factory", "E1102", "shared behaviour", "document sets"]:
+        assert loaded.search(query, 4) == index.search(query, 4)
+
+    # additions after loading are merged with the postings read from disk
+    loaded.add(['c5'], ["Another E1102 occurrence"], ['docs'])
+    assert {id for id, _ in loaded.search("E1102", 4)} == {'c3', 'c5'}
+    loaded.save()
+    assert {id for id, _ in LexicalIndex(tmp_path / 'lexical-index.bm25').search("E1102", 4)} == {'c3', 'c5'}
+
+
+def test_save_appends_delta(index, tmp_path, monkeypatch):
+    path = tmp_path / 'lexical-index.bm25'
+    index.save()
+    main = path.read_bytes()
+
+    # later additions are appended to the delta file, the main file is left as is
+    index.add(['c5'], ["Another E1102 occurrence"], ['docs'])
+    index.save()
+    index.add(['c6'], ["Traits and E1102 in a new set"], ['new'])
+    index.save()
+    assert path.read_bytes() == main
+    assert index.delta_path.exists()
+    loaded = LexicalIndex(path)
+    assert len(loaded) == 6
+    assert loaded.doc_sets == ['code', 'docs', 'rust', 'new']
+    for query in ["E1102", "traits", "occurrence", "get_vectordb_factory"]:
+        assert loaded.search(query, 6) == index.search(query, 6)
+
+    # a delta grown beyond the threshold is merged into the main file
+    monkeypatch.setattr(lexical, 'DELTA_MIN_POSTINGS', 0)
+    loaded.add(['c7'], ["E1102 once more"], ['docs'])
+    loaded.save()
+    assert not loaded.delta_path.exists()
+    assert {id for id, _ in LexicalIndex(path).search("E1102", 8)} == {'c3', 'c5', 'c6', 'c7'}
+
+
+def test_load_skips_merged_delta(index, tmp_path):
+    path = tmp_path / 'lexical-index.bm25'
+    index.save()
+    index.add(['c5'], ["Another E1102 occurrence"], ['docs'])
+    index.save()
+    delta = index.delta_path.read_bytes()
+    index.remove_docset('rust')
+    index.save()
+    # a delta left behind by an interrupted merge is not applied twice, nor is a truncated record
+    index.delta_path.write_bytes(delta + delta[:10])
+    loaded = LexicalIndex(path)
+    assert loaded.ids == ['c1', 'c2', 'c3', 'c5']
+    assert {id for id, _ in loaded.search("E1102", 4)} == {'c3', 'c5'}
+
+
+def test_remove_docset(index, tmp_path):
+    index.save()
+    index.remove_docset('docs')
+    assert len(index) == 2
+    assert index.search("E1102", 4) == []
+    assert index.search("traits", 4)[0][0] == 'c4'
+    index.save()
+    loaded = LexicalIndex(tmp_path / 'lexical-index.bm25')
+    assert loaded.doc_sets == ['code', 'rust']
+    assert loaded.search("get_vectordb_factory", 4)[0][0] == 'c1'
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['c', 'a']])
+    assert [id for id, _ in fused] == ['a', 'c', 'b']
+
+
+def test_maximal_marginal_relevance():
+    relevance = np.array([1.0, 0.9, 0.5])
+    # the second candidate is a near duplicate of the first one
+    embeddings = np.array([[1.0, 0.0], [0.99, 0.01], [0.0, 1.0]])
+    assert maximal_marginal_relevance(relevance, embeddings, 2, 0.5) == [0, 2]
+    # lambda 1 is pure relevance
+    assert maximal_marginal_relevance(relevance, embeddings, 3, 1.0) == [0, 1, 2]
+    assert maximal_marginal_relevance(np.array([]), np.zeros((0, 2)), 2) == []
+
+
+def test_merge_overlapping_chunks():
+    text = "Requests are retried three times. The delay doubles after every attempt. Errors are logged."
+    first = Chunk(page_content=text[:50], metadata={'source': 'api.txt', 'start_index': 0})
+    second = Chunk(page_content=text[30:], metadata={'source': 'api.txt', 'start_index': 30})
+    other = Chunk(page_content=text[40:], metadata={'source': 'other.txt'})
+    merged = merge_overlapping_chunks([(second, 0.9), (other, 0.8), (first, 0.5), (second, 0.4)])
+    assert [(chunk.page_content, score) for chunk, score in merged] == [(text, 0.9), (text[40:], 0.8)]
+
+    # without start index the overlap is found in the text itself
+    first = Chunk(page_content=text[:50], metadata={'source': 'api.txt'})
+    second = Chunk(page_content=text[30:], metadata={'source': 'api.txt'})
+    assert merge_overlapping_chunks([(second, 0.9), (first, 0.5)])[0][0].page_content == text
+    apart = Chunk(page_content=text[60:], metadata={'source': 'api.txt'})
+    assert len(merge_overlapping_chunks([(first, 0.9), (apart, 0.5)])) == 2
+
+    # a chunk bridging two passages joins them into one
+    head = Chunk(page_content=text[:45], metadata={'source': 'api.txt', 'start_index': 0})
+    tail = Chunk(page_content=text[55:], metadata={'source': 'api.txt', 'start_index': 55})
+    bridge = Chunk(page_content=text[25:75], metadata={'source': 'api.txt', 'start_index': 25})
+    merged = merge_overlapping_chunks([(other, 0.95), (tail, 0.9), (head, 0.7), (bridge, 0.6)])
+    assert [(chunk.page_content, score) for chunk, score in merged] == [(text[40:], 0.95), (text, 0.9)]
+    head, tail, bridge = (Chunk(page_content=chunk.page_content, metadata={'source': 'api.txt'}) for chunk in (head, tail, bridge))
+    assert [chunk.page_content for chunk, _ in merge_overlapping_chunks([(tail, 0.9), (head, 0.7), (bridge, 0.6)])] == [text]
+
+
+def test_pack_token_budget(monkeypatch):
+    # estimate the tokens (no tokenizer download)
+    monkeypatch.setattr(retrieval, '_encoding', lambda: None)
+    count_tokens.cache_clear()
+    big, small, medium = (Chunk(page_content='x' * size) for size in (400, 40, 200))
+    packed, used = pack_token_budget([(small, 0.5), (big, 0.9), (medium, 0.7)], 120)
+    assert [(chunk.page_content, score) for chunk, score in packed] == [('x' * 400, 0.9), ('x' * 40, 0.5)]
+    assert used == 110
+    assert pack_token_budget([(big, 0.9)], 10) == ([], 0)
+    count_tokens.cache_clear()
+
+
+def test_is_identifier_query():
+    assert is_identifier_query("get_config")
+    assert is_identifier_query("VectorRepository")
+    assert is_identifier_query("E1102")
+    assert is_identifier_query("corpus.send_prompt")
+    assert not is_identifier_query("What is a trait?")
+    assert not is_identifier_query("traits")
+    assert not is_identifier_query("Rust")
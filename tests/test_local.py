@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import configparser
+
+import numpy as np
+import pytest
+from langchain.schema import Document as Chunk
+
+from corpusaige import providers
+from corpusaige.config.read import get_config
+from corpusaige.corpus import create_corpus
+from corpusaige.exceptions import InvalidConfigEntry
+from corpusaige.providers.local import HashedNgramEmbeddings
+from corpusaige.storage import VectorRepository
+from tests.helpers import chunks, corpus_ini_str
+
+
+def cosine(a, b):
+    return float(np.dot(a, b))
+
+
+def test_embeddings():
+    embeddings = HashedNgramEmbeddings(dim=256, batch_size=2, threads=4)
+    texts = ["Rust traits", "Traits in Rust", "Python classes", "", "Rust traits"]
+    vectors = embeddings.embed_documents(texts)
+    assert len(vectors) == 5 and all(len(vector) == 256 for vector in vectors)
+    assert np.linalg.norm(vectors[0]) == pytest.approx(1.0, abs=1e-5)
+    assert not any(vectors[3])
+    # batching (and threads) do not change the embeddings
+    assert vectors[0] == vectors[4] == embeddings.embed_query("Rust traits")
+    assert cosine(vectors[0], vectors[1]) > cosine(vectors[0], vectors[2])
+    assert embeddings.last_count == 5 and embeddings.throughput > 0
+    with pytest.raises(InvalidConfigEntry):
+        HashedNgramEmbeddings(ngram_min=4, ngram_max=3)
+
+
+def test_offline_corpus(tmp_path):
+    config_p = configparser.ConfigParser()
+    config_p.read_string(corpus_ini_str)
+    config_p["main"]["embeddings"] = "local"
+    config_p["local"] = {"dim": "128", "batch-size": "2"}
+    create_corpus(tmp_path, config_p)
+    providers.register_internal_factories()
+    config = get_config(tmp_path)
+    repository = VectorRepository(config)
+    assert isinstance(repository.vectorstore.embeddings, HashedNgramEmbeddings)
+    assert repository.vectorstore.embeddings.dim == 128
+    repository.lexical = None
+    repository._add_chunks([Chunk(page_content=text, metadata={"doc-set": doc_set, "source": source, "path": source})
+                            for doc_set, source, text in chunks])
+    assert repository.last_ingest[0] == len(chunks)
+    assert repository.retrieve("exponential backoff retries", 1)[0][0].page_content == chunks[1][2]
+    repository.close()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import asyncio
+
+import pytest
+
+from corpusaige import retrieval
+from corpusaige.exceptions import InvalidParameters
+from corpusaige.memory import asave_context, create_memory, describe_memory, message_tokens
+from tests.helpers import WordsLLM
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # count tokens without downloading the tokenizer
+    monkeypatch.setattr(retrieval, '_encoding', lambda: None)
+    retrieval.count_tokens.cache_clear()
+    yield
+    retrieval.count_tokens.cache_clear()
+
+
+def converse(memory, turns):
+    for n in range(turns):
+        memory.save_context({'question': f"question {n} " + "x" * 40}, {'answer': f"answer {n} " + "y" * 40})
+
+
+def history(memory):
+    return [message.content for message in memory.load_memory_variables({})['chat_history']]
+
+
+def test_window():
+    memory = create_memory('window', None, turns=2)
+    converse(memory, 5)
+    assert [text.split()[:2] for text in history(memory)] == [
+        ['question', '3'], ['answer', '3'], ['question', '4'], ['answer', '4']]
+    assert describe_memory(memory) == "window (last 2 turns)"
+
+
+def test_tokens():
+    memory = create_memory('tokens', None, max_tokens=60)
+    converse(memory, 5)
+    assert message_tokens(memory.chat_memory.messages) <= 60
+    assert history(memory)[-1].startswith("answer 4")
+    assert len(history(memory)) < 10
+
+
+def test_summary():
+    memory = create_memory('summary', WordsLLM(answer="They talked about questions."), max_tokens=60)
+    converse(memory, 5)
+    messages = history(memory)
+    assert messages[0] == "They talked about questions."
+    assert messages[-1].startswith("answer 4")
+    assert message_tokens(memory.chat_memory.messages) <= 60
+
+
+class AsyncSummaryLLM(WordsLLM):
+    def _call(self, *args, **kwargs):
+        raise AssertionError("the event loop is blocked on a summary")
+
+
+def test_summary_async():
+    llm = AsyncSummaryLLM(answer="They talked about questions.")
+    memory = create_memory('summary', llm, max_tokens=60)
+
+    async def converse_concurrently():
+        await asyncio.gather(*[asave_context(memory, {'question': f"question {n} " + "x" * 40},
+                                             {'answer': f"answer {n} " + "y" * 40}) for n in range(5)])
+
+    asyncio.run(converse_concurrently())
+    messages = history(memory)
+    assert messages[0] == "They talked about questions."
+    assert messages[-1].startswith("answer 4")
+    # the turns pruned while a summary was made are summarized after it, not concurrently with it
+    assert llm.calls == 2
+
+
+def test_switch_strategy_keeps_conversation():
+    memory = create_memory('buffer', None)
+    converse(memory, 5)
+    assert len(history(memory)) == 10
+    window = create_memory('window', None, turns=1, messages=memory.chat_memory.messages)
+    assert [text.split()[:2] for text in history(window)] == [['question', '4'], ['answer', '4']]
+    with pytest.raises(InvalidParameters):
+        create_memory('forever', None)
+
+
+def test_switch_strategy_keeps_summary():
+    memory = create_memory('summary', WordsLLM(answer="They talked about questions."), max_tokens=60)
+    converse(memory, 5)
+    resized = create_memory('summary', WordsLLM(), max_tokens=100, messages=memory.chat_memory.messages,
+                            summary=memory.moving_summary_buffer)
+    assert history(resized)[0] == "They talked about questions."
+    tokens = create_memory('tokens', None, max_tokens=100, messages=memory.chat_memory.messages,
+                           summary=memory.moving_summary_buffer)
+    assert history(tokens)[0] == "They talked about questions."
+    assert history(tokens)[1:] == history(memory)[1:]
+
+
+def test_corpus_memory(corpus):
+    for n in range(3):
+        corpus.send_prompt(f"What is trait {n}?")
+    corpus.set_memory('window', 1)
+    assert corpus.memory_description == "window (last 1 turns)"
+    assert len(corpus.interaction.qa_chain.memory.load_memory_variables({})['chat_history']) == 2
+    corpus.send_prompt("What is a struct?")
+    assert corpus.interaction.memory.load_memory_variables({})['chat_history'][0].content == "What is a struct?"
+
+    # an invalid strategy or size changes nothing
+    interaction = corpus.interaction
+    max_tokens = interaction.memory_max_tokens
+    with pytest.raises(InvalidParameters):
+        corpus.set_memory('forever', 50)
+    with pytest.raises(InvalidParameters):
+        corpus.set_memory('buffer', 5)
+    assert corpus.memory_description == "window (last 1 turns)"
+    assert (interaction.memory_turns, interaction.memory_max_tokens) == (1, max_tokens)
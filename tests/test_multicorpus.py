@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import configparser
+import time
+
+import pytest
+from langchain.schema import Document as Chunk
+
+from corpusaige import interactions
+from corpusaige.corpus import create_corpus
+from corpusaige.multicorpus import MultiCorpus, merge_results, normalize_scores
+from corpusaige.providers import npstore
+from tests.helpers import WordEmbeddings, WordsLLM, corpus_ini_str
+
+corpora = {
+    'Billing': [('api', 'invoice.md', 'Invoices are created at the end of every month.'),
+                ('api', 'refund.md', 'A refund is booked as a negative invoice.')],
+    'Shipping': [('docs', 'parcel.md', 'Parcels are shipped within two days of the invoice.'),
+                 ('docs', 'returns.md', 'Returned parcels trigger a refund for the customer.')],
+}
+
+
+@pytest.fixture
+def multi_corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(npstore, 'embeddings_factory', lambda config: WordEmbeddings())
+    monkeypatch.setattr(interactions, 'llm_factory', lambda config, streaming=False: WordsLLM(streaming=streaming))
+    configs = []
+    for name, chunks in corpora.items():
+        config_p = configparser.ConfigParser()
+        config_p.read_string(corpus_ini_str)
+        config_p['main']['name'] = name
+        corpus_dir = tmp_path / name
+        corpus_dir.mkdir()
+        configs.append(create_corpus(corpus_dir, config_p))
+    corpus = MultiCorpus(configs)
+    for name, chunks in corpora.items():
+        corpus.repository.repositories[name]._add_chunks(
+            [Chunk(page_content=text, metadata={'doc-set': doc_set, 'source': source, 'path': source})
+             for doc_set, source, text in chunks])
+    return corpus
+
+
+def test_normalize_and_merge():
+    a = [(Chunk(page_content='a1'), 0.032), (Chunk(page_content='a2'), 0.016)]
+    b = [(Chunk(page_content='b1'), 0.9), (Chunk(page_content='b2'), 0.7), (Chunk(page_content='b3'), 0.5)]
+    assert [score for _, score in normalize_scores(b)] == pytest.approx([1.0, 0.5, 0.0])
+    merged = merge_results({'A': a, 'B': b}, 4)
+    assert [(chunk.page_content, chunk.metadata['corpus']) for chunk, _ in merged] == [
+        ('a1', 'A'), ('b1', 'B'), ('b2', 'B'), ('a2', 'A')]
+
+
+def test_federated_search(multi_corpus):
+    assert multi_corpus.name == 'Billing + Shipping'
+    results = multi_corpus.store_search('refund')
+    sources = [result.split('\n')[0] for result in results]
+    assert sorted(sources) == ['[Billing] invoice.md', '[Billing] refund.md',
+                               '[Shipping] parcel.md', '[Shipping] returns.md']
+    assert sorted(sources[:2]) == ['[Billing] refund.md', '[Shipping] returns.md']
+    assert sorted(multi_corpus.ls_docs()) == ['Billing: api', 'Shipping: docs']
+    # scope uses the plain names of the document sets
+    assert sorted(multi_corpus.doc_set_names()) == ['api', 'docs']
+    multi_corpus.scope = ['docs']
+    assert [result.split('\n')[0] for result in multi_corpus.store_search('refund')] == ['[Shipping] returns.md', '[Shipping] parcel.md']
+
+
+def test_federated_prompt(multi_corpus):
+    multi_corpus.toggle_sources()
+    answer = multi_corpus.send_prompt('How is a refund handled?')
+    assert 'source: refund.md' in answer and 'source: returns.md' in answer
+    assert multi_corpus.get_interaction(multi_corpus.last_interaction_id).human_question == 'How is a refund handled?'
+
+
+def test_corpora_searched_in_parallel(multi_corpus, monkeypatch):
+    for repository in multi_corpus.repository.repositories.values():
+        retrieve = repository.retrieve
+        def slow_retrieve(*args, retrieve=retrieve):
+            time.sleep(0.3)
+            return retrieve(*args)
+        monkeypatch.setattr(repository, 'retrieve', slow_retrieve)
+    start = time.perf_counter()
+    multi_corpus.store_search('refund')
+    assert time.perf_counter() - start < 0.55
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import configparser
+
+import numpy as np
+import pytest
+
+from corpusaige.corpus import create_corpus
+from corpusaige.providers.npstore import (NumpyCollection, NumpyVectorStore, _where_clause,
+                                          local_vectordb_creator_factory)
+from tests.helpers import WordEmbeddings, corpus_ini_str
+
+
+texts = ['cats and dogs', 'rust traits', 'python classes']
+metadatas = [{'doc-set': 'pets'}, {'doc-set': 'rust'}, {'doc-set': 'python'}]
+
+
+@pytest.fixture(params=['float32', 'float16'])
+def store(tmp_path, request):
+    store = NumpyVectorStore(tmp_path / 'npdb', WordEmbeddings(), dtype=request.param)
+    store.add_texts(texts, metadatas, ids=['c1', 'c2', 'c3'])
+    return store
+
+
+def test_similarity_search(store):
+    doc, distance = store.similarity_search_with_score('rust traits', 1)[0]
+    assert doc.page_content == 'rust traits'
+    assert doc.metadata == {'doc-set': 'rust'}
+    assert distance == pytest.approx(0.0, abs=1e-3)
+    assert len(store.similarity_search('rust', 10)) == 3
+
+
+def test_filters(store):
+    assert [d.page_content for d in store.similarity_search('rust traits', 3, filter={'doc-set': 'pets'})] == ['cats and dogs']
+    either = {'$or': [{'doc-set': 'pets'}, {'doc-set': 'python'}]}
+    assert {d.page_content for d in store.similarity_search('rust traits', 3, filter=either)} == {'cats and dogs', 'python classes'}
+    assert store.get(where={'doc-set': {'$ne': 'pets'}})['ids'] == ['c2', 'c3']
+    assert store.get(where={'doc-set': {'$in': ['pets', 'rust']}})['ids'] == ['c1', 'c2']
+
+
+def test_delete_and_upsert(store):
+    store._collection.delete(where={'doc-set': 'rust'})
+    assert store.get()['ids'] == ['c1', 'c3']
+    assert 'rust traits' not in [d.page_content for d in store.similarity_search('rust traits', 3)]
+
+    store.add_texts(['python generators'], [{'doc-set': 'python'}], ids=['c3'])
+    assert store._collection.count() == 2
+    assert store.get(ids=['c3'])['documents'] == ['python generators']
+
+
+def test_reopen(store, tmp_path):
+    reopened = NumpyVectorStore(tmp_path / 'npdb', WordEmbeddings(), dtype='float32')
+    # the data type of an existing store is kept
+    assert reopened._collection.dtype == store._collection.dtype
+    assert reopened.similarity_search('python classes', 1)[0].page_content == 'python classes'
+    # rows added through another instance (e.g. process) are seen by the first one
+    reopened.add_texts(['go interfaces'], [{'doc-set': 'go'}])
+    assert store.similarity_search('go interfaces', 1)[0].page_content == 'go interfaces'
+
+
+def test_ivf_index_and_compaction(tmp_path):
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 16))
+    vectors = np.repeat(centers, 50, axis=0) + rng.normal(scale=0.05, size=(1000, 16))
+    ids = [str(i) for i in range(len(vectors))]
+    collection = NumpyCollection(tmp_path / 'ivf', index='ivf', nlist=20, nprobe=2)
+    collection.add(ids, vectors.tolist(), [{'doc-set': 'x'}] * len(ids), ['text'] * len(ids))
+
+    exact = collection.query([vectors[10].tolist()], 5)['ids'][0]
+    collection.build_index()
+    assert collection._centroids is not None
+    assert collection.query([vectors[10].tolist()], 5)['ids'][0][0] == exact[0] == '10'
+
+    collection.delete(ids=ids[:500])
+    assert collection.count() == 500
+    assert collection.query([vectors[10].tolist()], 1)['ids'][0] != ['10']
+    collection.compact()
+    assert collection._matrix.shape[0] == 500
+    assert collection.query([vectors[600].tolist()], 1)['ids'][0] == ['600']
+    assert collection.get(ids=['600'], include=['embeddings'])['embeddings'][0] == pytest.approx(
+        (vectors[600] / np.linalg.norm(vectors[600])).tolist(), abs=1e-5)
+
+
+def test_quantized_store(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(2000, 64)).astype(np.float32)
+    ids = [str(i) for i in range(len(vectors))]
+    queries = vectors[:20] + rng.normal(scale=0.5, size=(20, 64))
+    collections = {name: NumpyCollection(tmp_path / name, dtype=dtype, rescore=rescore)
+                   for name, dtype, rescore in [('exact', 'float32', 0), ('int8', 'int8', 0), ('rescored', 'int8', 4)]}
+    found = {}
+    for name, collection in collections.items():
+        collection.add(ids, vectors.tolist())
+        found[name] = [collection.query([query.tolist()], 10)['ids'][0] for query in queries]
+
+    # int8 vectors (plus a float32 scale each) take a quarter of the space
+    assert (tmp_path / 'int8' / 'vectors.bin').stat().st_size == 2000 * 64
+    assert (tmp_path / 'int8' / 'scales.bin').stat().st_size == 2000 * 4
+    assert not (tmp_path / 'int8' / 'vectors-full.bin').exists()
+    recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(found['int8'], found['exact'])])
+    assert recall > 0.9
+    # rescoring with the full precision copy restores the exact ranking
+    assert found['rescored'] == found['exact']
+
+    int8 = collections['int8']
+    expected = (vectors[5] / np.linalg.norm(vectors[5])).tolist()
+    assert int8.get(ids=['5'], include=['embeddings'])['embeddings'][0] == pytest.approx(expected, abs=0.02)
+    int8.delete(ids=ids[:1000])
+    int8.compact()
+    assert int8._scales.shape == (1000,)
+    assert int8.query([vectors[1500].tolist()], 1)['ids'][0] == ['1500']
+
+
+def test_where_clause():
+    assert _where_clause(None) == ("1", [])
+    clause, params = _where_clause({'$or': [{'doc-set': 'a'}, {'doc-set': 'b'}]})
+    assert clause == "(json_extract(metadata, ?) = ? OR json_extract(metadata, ?) = ?)"
+    assert params == ['$."doc-set"', 'a', '$."doc-set"', 'b']
+    with pytest.raises(ValueError):
+        _where_clause({'doc-set': {'$like': 'a'}})
+
+
+def test_creator_closes_store(tmp_path, monkeypatch):
+    closed = []
+    close = NumpyVectorStore.close
+    monkeypatch.setattr(NumpyVectorStore, 'close', lambda self: closed.append(self) or close(self))
+    config_p = configparser.ConfigParser()
+    config_p.read_string(corpus_ini_str)
+    local_vectordb_creator_factory(create_corpus(tmp_path, config_p))()
+    assert len(closed) == 1 and (tmp_path / 'npdb').exists()
@@ -11,11 +11,13 @@ through deep exploration and understanding of comprehensive document sets and so
 # Import necessary modules
 
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import threading
 
 import pytest
 
-from corpusaige.registry import ServiceRegistry
+from corpusaige.registry import ClientRegistry, ServiceRegistry
 
 
 home_directory = Path.home()
@@ -57,3 +59,66 @@ def test_plugin_items(service_registry):
     item = service_registry.get_service_item("Another, better, plugin", "public_function") 
     assert item() == "public function"
     
+
+
+def test_clients_created_in_parallel():
+    created = []
+    # both clients are created at the same time (or the barrier breaks)
+    barrier = threading.Barrier(2, timeout=5)
+
+    def create(name):
+        barrier.wait()
+        created.append(name)
+        return name
+
+    # different clients are created in parallel, a client being created is shared
+    keys = ['client-a', 'client-b', 'client-a', 'client-b']
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        clients = list(executor.map(lambda key: ClientRegistry.acquire(key, lambda: create(key)), keys))
+    assert clients == keys and sorted(created) == ['client-a', 'client-b']
+    assert ClientRegistry.refcount('client-a') == 2
+    for key in keys:
+        ClientRegistry.release(key)
+    assert ClientRegistry.refcount('client-a') == ClientRegistry.refcount('client-b') == 0
+
+    # a failed creation is not kept
+    def failing():
+        raise ValueError('no client')
+    with pytest.raises(ValueError):
+        ClientRegistry.acquire('client-c', failing)
+    assert ClientRegistry.acquire('client-c', lambda: 'client-c') == 'client-c'
+    ClientRegistry.release('client-c')
+
+
+def test_release_closes_outside_lock():
+    closed = []
+
+    def on_close(client):
+        # other threads can use the registry while a client is closed
+        other = threading.Thread(target=ClientRegistry.refcount, args=('client-e',), daemon=True)
+        other.start()
+        other.join(5)
+        assert not other.is_alive()
+        closed.append(client)
+
+    ClientRegistry.acquire('client-d', lambda: 'client-d', on_close)
+    ClientRegistry.release('client-d')
+    assert closed == ['client-d']
+
+    # a client released while it is created is closed once created
+    creating, release = threading.Event(), threading.Event()
+
+    def create():
+        creating.set()
+        release.wait(5)
+        return 'client-f'
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        acquired = executor.submit(ClientRegistry.acquire, 'client-f', create, closed.append)
+        creating.wait(5)
+        ClientRegistry.release('client-f')
+        assert closed == ['client-d']
+        release.set()
+        assert acquired.result(timeout=5) == 'client-f'
+    assert closed == ['client-d', 'client-f']
+    assert ClientRegistry.refcount('client-f') == 0
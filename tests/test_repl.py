@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from corpusaige.data.conversations import ConversationSummary, InteractionMatch, InteractionSummary
+from corpusaige.exceptions import InvalidParameters
+from corpusaige.tracing import Span, Tracer
+from corpusaige.ui.repl import PromptRepl, parse_doc_set_names, parse_search_args
+
+
+class DummyCorpus:
+    name = "Dummy"
+    path = Path("corpus.ini")
+    context_size = 15
+    show_sources = False
+
+    def __init__(self):
+        self.scope = []
+        self.searches = []
+        self.context_budget = 0
+        self.last_context_tokens = 0
+        self.tracer = Tracer()
+
+    memory_description = "buffer (whole conversation)"
+
+    def set_memory(self, strategy, size=None):
+        self.memory_description = f"{strategy} {size}"
+
+    def send_prompt(self, prompt, on_token=None):
+        self.last_context_tokens = 1234
+        answer = f"answer to {prompt}"
+        if on_token is not None:
+            for word in answer.split(' '):
+                on_token(word + ' ')
+        return answer
+
+    def ls_docs(self, all_docs=False, doc_set=''):
+        return ['api-specs', 'Rust Book']
+
+    def doc_set_names(self):
+        return self.ls_docs()
+
+    def store_search(self, search_str, doc_sets=None):
+        self.searches.append((search_str, doc_sets))
+        return []
+
+    def set_output(self, output):
+        pass
+
+    def search_conversations(self, terms, limit=20):
+        if terms != 'retry policy':
+            return []
+        return [InteractionMatch(12, 3, datetime(2023, 9, 1), 'What is the [retry]\n[policy]?')]
+
+    def list_conversations(self, limit=20, before=None):
+        ids = range(min(before - 1, 45) if before else 45, 0, -1)
+        return [ConversationSummary(id, f'Conversation {id}', datetime(2023, 9, 1)) for id in ids][:limit]
+
+    def list_interactions(self, conversation_id, limit=20, after=None):
+        ids = range((after or 0) + 1, 21)
+        return [InteractionSummary(id, datetime(2023, 9, 1), f'Question {id}') for id in ids][:limit]
+
+
+class DummyOutput:
+    paged_printing = False
+
+    def __init__(self):
+        self.lines = []
+        self.tokens = []
+
+    def print(self, text):
+        self.lines.append(text)
+
+    def print_token(self, text):
+        self.tokens.append(text)
+
+
+@pytest.fixture
+def repl():
+    repl = PromptRepl(DummyCorpus())
+    out = DummyOutput()
+    repl.set_input_output(None, out)
+    return repl
+
+
+def test_parse_doc_set_names():
+    assert parse_doc_set_names('api-specs') == ['api-specs']
+    assert parse_doc_set_names('Rust Book, api-specs') == ['Rust Book', 'api-specs']
+    assert parse_doc_set_names('"Rust Book",api-specs,') == ['Rust Book', 'api-specs']
+
+
+def test_parse_search_args():
+    assert parse_search_args('what is a trait') == (None, 'what is a trait')
+    assert parse_search_args('--in api-specs retry policy') == (['api-specs'], 'retry policy')
+    assert parse_search_args('--in "Rust Book", api-specs traits') == (['Rust Book', 'api-specs'], 'traits')
+    with pytest.raises(InvalidParameters):
+        parse_search_args('--in api-specs')
+
+
+def test_search_in(repl):
+    repl.handle_command('/search --in api-specs,code retry policy')
+    repl.handle_command('/search retry policy')
+    assert repl.corpus.searches == [('retry policy', ['api-specs', 'code']), ('retry policy', None)]
+
+
+def test_scope(repl):
+    repl.handle_command('/scope "Rust Book", unknown')
+    assert repl.corpus.scope == ['Rust Book', 'unknown']
+    assert repl.out.lines[-2] == 'Warning: unknown document set(s): unknown'
+    repl.handle_command('/scope')
+    assert repl.out.lines[-1] == 'Scope: Rust Book, unknown'
+    repl.handle_command('/scope *')
+    assert repl.corpus.scope == []
+    assert repl.out.lines[-1] == 'Scope: whole corpus'
+
+
+def test_contextbudget(repl):
+    repl.streaming = False
+    repl.handle_command('/contextbudget 6000')
+    assert repl.corpus.context_budget == 6000
+    repl.send_prompt('what is a trait')
+    assert repl.out.lines[-2:] == ['answer to what is a trait', '[context: 1234 of 6000 tokens]']
+    repl.handle_command('/contextbudget lots')
+    assert repl.corpus.context_budget == 6000
+    repl.handle_command('/contextbudget off')
+    assert repl.corpus.context_budget == 0
+    repl.send_prompt('what is a trait')
+    assert repl.out.lines[-1] == 'answer to what is a trait'
+
+
+def test_stream(repl):
+    repl.send_prompt('what is a trait')
+    assert ''.join(repl.out.tokens) == 'answer to what is a trait '
+    repl.handle_command('/stream')
+    assert repl.out.lines[-1] == 'Streaming: off'
+    repl.send_prompt('what is a trait')
+    assert repl.out.lines[-1] == 'answer to what is a trait'
+    # paged printing needs the complete answer
+    repl.streaming = True
+    repl.out.paged_printing = True
+    assert not repl.is_streaming
+
+
+def test_memory(repl):
+    repl.handle_command('/memory window 3')
+    assert repl.out.lines[-1] == 'Memory: window 3'
+    repl.handle_command('/memory window three')
+    assert repl.out.lines[-1].startswith('Error executing command memory: Usage')
+    repl.handle_command('/memory')
+    assert repl.out.lines[-1] == 'Memory: window 3'
+
+
+def test_stats(repl):
+    repl.corpus.tracer.record(Span('prompt.llm', 0.0, 1.5))
+    repl.handle_command('/stats')
+    assert repl.out.lines[-1].splitlines()[-1].split() == ['prompt.llm', '1', '1500.0', '1500.0', '1500.0']
+    repl.handle_command('/stats clear')
+    repl.handle_command('/stats')
+    assert repl.out.lines[-1] == "No timings recorded yet."
+
+
+def test_conversation_search(repl):
+    repl.handle_command('/conversation search retry policy')
+    assert repl.out.lines[-1] == '   12 : (3, 2023-09-01) What is the [retry] [policy]?'
+    repl.handle_command('/conversation search backoff')
+    assert repl.out.lines[-1] == 'No matching interactions.'
+
+
+def test_conversation_pages(repl):
+    repl.handle_command('/conversation')
+    assert repl.out.lines[0] == '   45 : (2023-09-01) Conversation 45'
+    assert repl.out.lines[-1] == 'Use /conversation more for the next page.'
+    repl.handle_command('/conversation more')
+    repl.handle_command('/conversation more')
+    assert repl.out.lines[-1] == '    1 : (2023-09-01) Conversation 1'
+    assert len(repl.out.lines) == 45 + 2
+    repl.handle_command('/conversation more')
+    assert repl.out.lines[-1] == 'No more to show.'
+
+    # a full last page is followed by an empty one
+    repl.handle_command('/conversation 7')
+    assert repl.out.lines[-2:] == ['   20 : Question 20', 'Use /conversation more for the next page.']
+    repl.handle_command('/conversation more')
+    repl.handle_command('/conversation more')
+    assert repl.out.lines[-1] == 'No more to show.'
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from corpusaige.config.read import get_config
+from corpusaige.exceptions import InvalidParameters
+from corpusaige.server import CorpusClient, CorpusServer, discovery_path, find_server
+from tests.helpers import ANSWER
+
+
+@pytest.fixture
+def server(corpus):
+    server = CorpusServer({corpus.name: corpus}, port=0)
+    discovery = discovery_path(get_config(corpus.path))
+    thread = threading.Thread(target=server.serve_forever, args=([discovery],), daemon=True)
+    thread.start()
+    while not discovery.exists():
+        time.sleep(0.01)
+    yield server
+    server.shutdown()
+    thread.join()
+    assert not discovery.exists()
+
+
+def test_operations(server, corpus, tmp_path):
+    client = CorpusClient(server.url, token=server.token)
+    assert client.health()['corpora'] == [corpus.name]
+    assert client.send_prompt("What is a trait?") == ANSWER
+    assert client.store_search("traits")[0].startswith("traits.md")
+    assert client.ls_docs() == ['rust']
+
+    client.remove_docset('rust')
+    assert client.ls_docs() == []
+
+
+def test_add_docset(server, corpus, tmp_path, monkeypatch):
+    added = []
+    monkeypatch.setattr(corpus, 'add_docset', added.append)
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    CorpusClient(server.url, token=server.token).add_docset('structs', [docs], ['text:md'], True)
+    assert added[0].name == 'structs'
+    assert [(entry.path, entry.file_extension, entry.recursive) for entry in added[0].entries] == [(docs, 'md', True)]
+
+
+def test_concurrent_prompts(server):
+    client = CorpusClient(server.url, token=server.token)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        answers = list(executor.map(client.send_prompt, [f"What is trait {n}?" for n in range(16)]))
+    assert answers == [ANSWER] * 16
+    # isolated prompts are stored in conversations of their own, a prompt continuing the
+    # conversation with it
+    corpus = server.corpora[next(iter(server.corpora))]
+    client.send_prompt("And why?", conversation=True)
+    client.send_prompt("And how?", conversation=True)
+    assert corpus.last_interaction_id is not None
+    conversation_ids = [conv.id for conv in corpus.list_conversations(limit=100)]
+    assert len(conversation_ids) == 17 and corpus.last_conversation_id in conversation_ids
+    assert [interact.question for interact in corpus.list_interactions(corpus.last_conversation_id)] == ["And why?", "And how?"]
+
+
+def test_errors(server, monkeypatch):
+    client = CorpusClient(server.url, token=server.token)
+    with pytest.raises(InvalidParameters, match="Missing prompt"):
+        client.send_prompt("")
+    with pytest.raises(InvalidParameters, match="Not found"):
+        CorpusClient(server.url, corpus='unknown', token=server.token).ls_docs()
+    with pytest.raises(InvalidParameters, match="Not found"):
+        client._request('/unknown', {})
+
+    # other errors of a handler are server errors
+    def failing(*args):
+        raise KeyError('bug')
+    monkeypatch.setattr(server, 'handle_post', failing)
+    with pytest.raises(InvalidParameters, match="Server error: KeyError: 'bug'"):
+        client.ls_docs()
+    def invalid(*args):
+        raise ValueError('bug')
+    monkeypatch.setattr(server, 'handle_post', invalid)
+    with pytest.raises(InvalidParameters, match="Server error: ValueError: bug"):
+        client.ls_docs()
+
+
+def test_access(server):
+    def status(path, headers, data=b'{}'):
+        request = urllib.request.Request(server.url + path, data=data, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    json_type = {'Content-Type': 'application/json'}
+    token = {'X-Corpusaige-Token': server.token}
+    assert status('/ls', {**json_type, **token}) == 200
+    assert status('/ls', {**json_type, **token, 'Origin': 'http://localhost:3000'}) == 200
+    # no (valid) token
+    assert status('/ls', json_type) == 403
+    assert status('/ls', {**json_type, 'X-Corpusaige-Token': 'guess'}) == 403
+    assert status('/health', {}, data=None) == 403
+    # a web page of another site, a form or text/plain post (which need no CORS preflight)
+    assert status('/remove', {**json_type, **token, 'Origin': 'https://evil.example'}) == 403
+    assert status('/ls', {**token, 'Content-Type': 'text/plain'}) == 415
+    assert status('/ls', {**token, 'Content-Type': 'application/x-www-form-urlencoded'}, data=b'a=1') == 415
+
+
+def test_find_server(server, corpus):
+    config = get_config(corpus.path)
+    client = find_server(config)
+    assert client is not None and client.url == server.url and client.token == server.token
+    assert json.loads(discovery_path(config).read_text())['token'] == server.token
+    assert discovery_path(config).stat().st_mode & 0o077 == 0
+    discovery_path(config).write_text('{"url": "http://127.0.0.1:9", "pid": 1, "token": "x"}')
+    assert find_server(config) is None
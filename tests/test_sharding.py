@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import configparser
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain.schema import Document as Chunk
+
+from corpusaige import providers
+from corpusaige.config.read import get_config
+from corpusaige.corpus import create_corpus
+from corpusaige.exceptions import InvalidParameters
+from corpusaige.sharding import ShardedCollection, ShardedStore, filter_doc_sets, shard_name
+from corpusaige.storage import VectorRepository, doc_set_filter
+from tests.helpers import chunks, corpus_ini_str
+
+notes = [('notes', 'notes.txt', 'Meeting notes: the corpus server needs exponential backoff too.')]
+
+
+@pytest.fixture
+def repository(tmp_path):
+    config_p = configparser.ConfigParser()
+    config_p.read_string(corpus_ini_str)
+    config_p['main']['embeddings'] = 'local'
+    config_p['local'] = {'dim': '128'}
+    # api-specs and notes share a shard, code has one of its own
+    config_p['sharding'] = {'enabled': 'true', 'docs': 'api-specs, notes'}
+    create_corpus(tmp_path, config_p)
+    providers.register_internal_factories()
+    repository = VectorRepository(get_config(tmp_path))
+    repository.lexical = None
+    repository._add_chunks([Chunk(page_content=text, metadata={'doc-set': doc_set, 'source': source, 'path': source})
+                            for doc_set, source, text in chunks + notes])
+    yield repository
+    repository.close()
+
+
+def test_shard_names():
+    assert shard_name('code') == shard_name('code') != shard_name('Code')
+    assert shard_name('Corpusaige annotations').startswith('ds-corpusaige-annotations-')
+    assert 3 <= len(shard_name('')) <= 63 and len(shard_name('x' * 200)) <= 63
+    assert filter_doc_sets(doc_set_filter(['a', 'b'])) == ['a', 'b']
+    assert filter_doc_sets(doc_set_filter(['a'])) == ['a']
+    assert filter_doc_sets({'source': 'a.txt'}) is None
+
+
+def test_sharded_repository(repository, tmp_path):
+    store = repository.vectorstore
+    assert isinstance(store, ShardedStore)
+    manifest = json.loads((tmp_path / 'corpus-shards.json').read_text())
+    assert manifest == {'api-specs': shard_name('docs'), 'notes': shard_name('docs'), 'code': shard_name('code')}
+    assert sorted(path.name for path in (tmp_path / 'npdb').iterdir()) == sorted([shard_name('docs'), shard_name('code')])
+    assert store._collection.count() == len(chunks) + len(notes)
+
+    # unscoped queries search all shards, scoped queries only theirs
+    results = repository.retrieve('exponential backoff retries', 5)
+    assert {chunk.metadata['doc-set'] for chunk, _ in results} == {'api-specs', 'code', 'notes'}
+    assert {chunk.metadata['doc-set'] for chunk, _ in repository.retrieve('exponential backoff', 5, ['code'])} == {'code'}
+    assert {chunk.metadata['doc-set'] for chunk, _ in repository.retrieve('exponential backoff', 5, ['notes'])} == {'notes'}
+    assert sorted(repository.ls()) == ['api-specs', 'code', 'notes']
+    assert repository.ls(doc_set='code') == ['storage.py', 'corpus.py']
+
+    # a document set with a shard of its own is removed by dropping the shard
+    repository.remove_docset('code')
+    assert not (tmp_path / 'npdb' / shard_name('code')).exists()
+    # ... one sharing a shard by deleting its chunks from the shard
+    repository.remove_docset('notes')
+    assert (tmp_path / 'npdb' / shard_name('docs')).exists()
+    assert sorted(repository.ls()) == ['api-specs']
+    assert json.loads((tmp_path / 'corpus-shards.json').read_text()) == {'api-specs': shard_name('docs')}
+    with pytest.raises(InvalidParameters):
+        repository.remove_docset('code')
+
+    # a removed document set can be added again
+    repository._add_chunks([Chunk(page_content='fn main() {}', metadata={'doc-set': 'code', 'source': 'main.rs', 'path': 'main.rs'})])
+    assert repository.ls(doc_set='code') == ['main.rs']
+
+
+def test_sharded_get_pages(repository, monkeypatch):
+    collection = repository.vectorstore._collection
+    limits = []
+    for shard in collection.shards():
+        store = collection.store(shard)
+        monkeypatch.setattr(store, 'get', lambda *args, get=store.get, **kwargs: limits.append(kwargs['limit']) or get(*args, **kwargs))
+    # the shards only return the chunks of the requested page
+    assert len(collection.get(limit=1)['ids']) == 1
+    assert len(collection.get(limit=2, offset=1)['ids']) == 2
+    assert limits == [1, 1, 3, 3]
+    assert len(collection.get()['ids']) == len(chunks) + len(notes)
+
+
+def test_concurrent_manifest_updates(repository, tmp_path):
+    # collections of other processes add document sets at the same time: none is lost
+    config = get_config(tmp_path)
+    collections = [ShardedCollection(config) for _ in range(2)]
+    doc_sets = [(collections[n % 2], f'set-{n}') for n in range(40)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda item: item[0].shard_of(item[1], create=True), doc_sets))
+    manifest = json.loads((tmp_path / 'corpus-shards.json').read_text())
+    assert {f'set-{n}' for n in range(40)} | {'api-specs', 'code', 'notes'} == set(manifest)
+    for collection in collections:
+        collection.close()
+
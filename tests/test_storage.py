@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import configparser
+from pathlib import Path
+
+import pytest
+from langchain.schema import Document as Chunk
+
+from corpusaige.config.read import get_config
+from corpusaige.corpus import create_corpus
+from corpusaige import providers
+from corpusaige.providers import npstore
+from corpusaige.storage import VectorRepository, doc_set_filter
+from tests.helpers import WordEmbeddings, chunks, corpus_ini_str
+
+@pytest.fixture
+def repository(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(npstore, 'embeddings_factory', lambda config: WordEmbeddings())
+    config_p = configparser.ConfigParser()
+    config_p.read_string(corpus_ini_str)
+    create_corpus(tmp_path, config_p)
+    providers.register_internal_factories()
+    repository = VectorRepository(get_config(tmp_path))
+    repository._add_chunks([Chunk(page_content=text, metadata={'doc-set': doc_set, 'source': source, 'path': source})
+                            for doc_set, source, text in chunks])
+    return repository
+
+
+def test_doc_set_filter():
+    assert doc_set_filter(None) is None
+    assert doc_set_filter([]) is None
+    assert doc_set_filter(['a']) == {'doc-set': 'a'}
+    assert doc_set_filter(['a', 'b']) == {'$or': [{'doc-set': 'a'}, {'doc-set': 'b'}]}
+
+
+def test_identifier_lookup_skips_embedding(repository, monkeypatch):
+    def no_embedding(query):
+        raise AssertionError("identifier lookups should not embed the query")
+    monkeypatch.setattr(repository.vectorstore.embeddings, 'embed_query', no_embedding)
+    # a chunk with the parts of the identifier only is no exact hit
+    repository._add_chunks([Chunk(page_content='Get the vectordb from its factory.',
+                                  metadata={'doc-set': 'code', 'source': 'notes.md', 'path': 'notes.md'})])
+    results = repository.retrieve('get_vectordb_factory', 2)
+    assert [chunk.metadata['source'] for chunk, _ in results] == ['storage.py']
+
+
+def test_hybrid_retrieve(repository):
+    results = repository.retrieve('how are requests retried', 4)
+    assert len(results) == 4
+    assert [score for _, score in results] == sorted([score for _, score in results], reverse=True)
+    assert results[0][0].metadata['doc-set'] in ('api-specs', 'code')
+
+
+def test_scoped_retrieve(repository):
+    results = repository.retrieve('how are requests retried', 4, doc_sets=['code'])
+    assert len(results) == 2
+    assert {chunk.metadata['doc-set'] for chunk, _ in results} == {'code'}
+    # the identifier is only found in api-specs, so the vector search has to answer
+    assert {chunk.metadata['doc-set'] for chunk, _ in repository.retrieve('E1102', 4, doc_sets=['code'])} == {'code'}
+    assert {chunk.metadata['doc-set'] for chunk, _ in repository.retrieve('retried', 4, doc_sets=['api-specs', 'code'])} == {'api-specs', 'code'}
+
+
+def test_lexical_index_built_for_existing_store(repository, tmp_path):
+    repository.lexical.path.unlink()
+    reopened = VectorRepository(get_config(tmp_path))
+    assert len(reopened._lexical_index()) == len(chunks)
+
+
+def test_remove_docset(repository):
+    repository.remove_docset('code')
+    assert repository.ls() == ['api-specs']
+    assert repository.retrieve('get_vectordb_factory', 4)[0][0].metadata['doc-set'] == 'api-specs'
+
+
+def test_mmr_drops_near_duplicates(repository):
+    duplicate = chunks[1][2]
+    repository._add_chunks([Chunk(page_content=duplicate, metadata={'doc-set': 'api-specs', 'source': 'copy.txt', 'path': 'copy.txt'})])
+    texts = [chunk.page_content for chunk, _ in repository.retrieve('are requests retried with backoff', 2)]
+    assert texts[0] == duplicate
+    assert texts[1] != duplicate
+
+    repository.mmr = False
+    texts = [chunk.page_content for chunk, _ in repository.retrieve('are requests retried with backoff', 2)]
+    assert texts == [duplicate, duplicate]
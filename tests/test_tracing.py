@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Corpusaige is a Python tool (and utility library) enabling AI-powered systems analysis
+through deep exploration and understanding of comprehensive document sets and source code.
+@copyright: Copyright © 2023 Iwan van der Kleijn
+@license: MIT
+"""
+
+# Import necessary modules
+
+import json
+
+from corpusaige import tracing
+from corpusaige.tracing import Span, Tracer, percentile
+
+
+def test_percentile():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([], 50) == 0.0
+
+
+def test_ring_buffer_and_stats():
+    tracer = Tracer(buffer_size=3)
+    for duration in (0.010, 0.020, 0.030, 0.040):
+        tracer.record(Span('retrieve', 0.0, duration))
+    assert len(tracer.spans) == 3
+    stats = tracer.stats()['retrieve']
+    assert stats['count'] == 3
+    assert round(stats['p50']) == 30 and round(stats['max']) == 40
+    assert 'retrieve' in tracer.format_stats()
+    tracer.clear()
+    assert tracer.format_stats() == "No timings recorded yet."
+
+
+def test_disabled_and_export(tmp_path):
+    tracer = Tracer(enabled=False)
+    with tracer.span('prompt'):
+        pass
+    assert tracer.spans == []
+
+    export = tmp_path / 'trace.jsonl'
+    tracer = Tracer(export_path=export)
+    with tracer.span('prompt'):
+        with tracer.span('prompt.llm'):
+            pass
+    # spans are exported in batches
+    assert not export.exists()
+    tracer.flush()
+    assert [json.loads(line)['name'] for line in export.read_text().splitlines()] == ['prompt.llm', 'prompt']
+    for _ in range(tracing.EXPORT_BATCH_SIZE):
+        tracer.record(Span('retrieve.embed', 0.0, 0.001))
+    assert len(export.read_text().splitlines()) == 2 + tracing.EXPORT_BATCH_SIZE
+
+
+def test_corpus_stages(corpus):
+    corpus.send_prompt("What is a trait?")
+    corpus.send_prompt("And why?")
+    corpus.store_search("traits")
+    stages = corpus.tracer.stats()
+    assert {'prompt', 'prompt.llm', 'prompt.condense', 'prompt.store', 'retrieve', 'retrieve.embed',
+            'retrieve.vector', 'search'} <= set(stages)
+    assert stages['prompt']['count'] == 2
+    assert stages['search']['count'] == 1